@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Compact storage engine for the KVSS store (--storage arena)
+Instead of one Python object per value and a dict entry per version, each shard keeps
+values and versions as packed records in bytearray segments, found through an
+open-addressing hash table. Only the key remains an object (shared with the sorted
+index), which saves about 100 bytes per small key over the dict engine
+(see "benchmark.py storage").
+"""
+
+import struct
+import sys
+from array import array
+
+from compression import Compressed
+
+
+# Record: index slot (DEAD once dropped), payload length, version, flags; then the payload
+HEADER = struct.Struct('<IIQB')
+VERSION = struct.Struct('<Q')
+VERSION_OFFSET = 8
+U32 = struct.Struct('<I')
+DEAD = 0xFFFFFFFF
+
+FLAG_TEXT = 1        # str value, stored as UTF-8
+FLAG_COMPRESSED = 2  # Compressed value: original size (u32) then its data; codec in bits 2+
+
+# Records are appended to the last segment until it reaches SEGMENT_SIZE (a larger
+# record gets a segment of its own); offsets are segment number * SEGMENT_SPAN + position
+SEGMENT_SIZE = 256 * 1024
+SEGMENT_SPAN = 1 << 32
+
+# Approximate per-key cost of the table slots (at its average load) and sorted index
+SLOT_OVERHEAD = 40
+
+_DELETED = object()  # Tombstone left in a key slot by a removed key
+_MISSING = object()
+
+
+def encode(value):
+    """Return (flags, payload) for a stored value (str, bytes or Compressed)"""
+    if value.__class__ is str:
+        return FLAG_TEXT, value.encode('utf-8')
+    if value.__class__ is Compressed:
+        flags = FLAG_COMPRESSED | value.codec << 2 | (FLAG_TEXT if value.text else 0)
+        return flags, U32.pack(value.size) + value.data
+    return 0, bytes(value)
+
+
+def decode(flags, payload):
+    """Inverse of encode(); payload may be any bytes-like object"""
+    if flags & FLAG_COMPRESSED:
+        return Compressed(flags >> 2, bytes(payload[U32.size:]), U32.unpack_from(payload)[0],
+                          bool(flags & FLAG_TEXT))
+    if flags & FLAG_TEXT:
+        return payload.decode('utf-8')
+    return bytes(payload)
+
+
+class ArenaVersions:
+    """An ArenaTable's key versions, read and written in place in the records"""
+    __slots__ = ('table',)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, key):
+        segment, position = self.table._record(key)
+        return VERSION.unpack_from(segment, position + VERSION_OFFSET)[0]
+
+    def __setitem__(self, key, version):
+        segment, position = self.table._record(key)
+        VERSION.pack_into(segment, position + VERSION_OFFSET, version)
+
+    def __delitem__(self, key):
+        """Nothing to do: a version is dropped along with its key's record"""
+
+
+class ArenaTable:
+    """Mapping of str keys to stored values, used as a shard's data in place of a dict
+
+    Keys live in a list of 2**n slots probed linearly, next to an array holding the
+    offset of each key's record; the list is rebuilt once live keys and tombstones
+    fill 2/3 of it. A record holds the value's bytes and the key's version (see
+    versions). Overwriting with a value of the same encoded length rewrites the record
+    in place; any other overwrite appends a new record and leaves the old one dead. A
+    segment whose dead bytes reach half its size has its live records moved to the
+    last segment and is freed, so garbage stays bounded without a full rewrite.
+
+    Not thread-safe: shards only use it under their lock.
+    """
+
+    MIN_SLOTS = 8
+
+    def __init__(self):
+        self.keys = [None] * self.MIN_SLOTS  # Key object, None (never used) or _DELETED
+        self.offsets = array('q', bytes(8 * self.MIN_SLOTS))  # Record of each slot's key
+        self.used = 0    # Live keys
+        self.filled = 0  # Live keys and tombstones
+        self.segments = [bytearray()]
+        self.dead = [0]  # Bytes of dead records per segment
+        self.free = []   # Numbers of freed segments, reused before new ones are added
+        self.tail = 0    # Segment receiving new records
+        # Slot of the key last found or inserted: a store write looks its key up
+        # several times in a row (exists, old value, store, version)
+        self.cached_key = None
+        self.cached_slot = -1
+        self.versions = ArenaVersions(self)
+
+    @staticmethod
+    def entry_size(key, value):
+        """Approximate memory held by one stored key/value pair, in bytes"""
+        if value.__class__ is Compressed:
+            length = U32.size + len(value.data)
+        else:
+            length = len(value)  # Exact for bytes and ASCII text
+        return sys.getsizeof(key) + HEADER.size + length + SLOT_OVERHEAD
+
+    @staticmethod
+    def _start(key, mask):
+        # Shards pick keys by hash(key) % shards, so a shard's keys share their low
+        # bits; fold the high bits in before masking
+        h = hash(key)
+        return (h ^ h >> 21 ^ h >> 42) & mask
+
+    def _find(self, key):
+        """Return the slot holding key, or -1"""
+        if key is self.cached_key:
+            return self.cached_slot
+        keys = self.keys
+        mask = len(keys) - 1
+        h = hash(key)
+        slot = (h ^ h >> 21 ^ h >> 42) & mask  # See _start()
+        while True:
+            current = keys[slot]
+            if current is None:
+                return -1
+            if current is key or current == key:
+                self.cached_key = key
+                self.cached_slot = slot
+                return slot
+            slot = (slot + 1) & mask
+
+    def _record(self, key):
+        """Return (segment, position) of key's record; raises KeyError if missing"""
+        slot = self._find(key)
+        if slot < 0:
+            raise KeyError(key)
+        number, position = divmod(self.offsets[slot], SEGMENT_SPAN)
+        return self.segments[number], position
+
+    def _value(self, offset):
+        number, position = divmod(offset, SEGMENT_SPAN)
+        segment = self.segments[number]
+        _, length, _, flags = HEADER.unpack_from(segment, position)
+        start = position + HEADER.size
+        return decode(flags, segment[start:start + length])
+
+    def _append(self, slot, version, flags, payload):
+        """Write a record to the tail segment and return its offset"""
+        segment = self.segments[self.tail]
+        if segment and len(segment) + HEADER.size + len(payload) > SEGMENT_SIZE:
+            self._new_tail()
+            segment = self.segments[self.tail]
+        position = len(segment)
+        segment += HEADER.pack(slot, len(payload), version, flags)
+        segment += payload
+        return self.tail * SEGMENT_SPAN + position
+
+    def _new_tail(self):
+        previous = self.tail
+        if self.free:
+            self.tail = self.free.pop()
+            self.segments[self.tail] = bytearray()
+        else:
+            self.tail = len(self.segments)
+            self.segments.append(bytearray())
+            self.dead.append(0)
+        self._collect(previous)
+
+    def _kill(self, offset):
+        """Mark a record dead, collecting its segment once it is mostly garbage"""
+        number, position = divmod(offset, SEGMENT_SPAN)
+        segment = self.segments[number]
+        self.dead[number] += HEADER.size + U32.unpack_from(segment, position + U32.size)[0]
+        U32.pack_into(segment, position, DEAD)
+        if number != self.tail:
+            self._collect(number)
+
+    def _collect(self, number):
+        """Move the live records of a segment at least half dead to the tail and free it"""
+        segment = self.segments[number]
+        if self.dead[number] * 2 < len(segment):
+            return
+        position = 0
+        while position < len(segment):
+            slot, length, version, flags = HEADER.unpack_from(segment, position)
+            start = position + HEADER.size
+            position = start + length
+            if slot != DEAD:
+                self.offsets[slot] = self._append(slot, version, flags, segment[start:position])
+        self.segments[number] = None
+        self.dead[number] = 0
+        self.free.append(number)
+
+    def _resize(self):
+        """Rebuild the slots for the live keys, dropping tombstones"""
+        size = self.MIN_SLOTS
+        while size <= 2 * self.used:
+            size *= 2
+        keys = [None] * size
+        offsets = array('q', bytes(8 * size))
+        mask = size - 1
+        for old_slot, key in enumerate(self.keys):
+            if key is None or key is _DELETED:
+                continue
+            slot = self._start(key, mask)
+            while keys[slot] is not None:
+                slot = (slot + 1) & mask
+            keys[slot] = key
+            offset = offsets[slot] = self.offsets[old_slot]
+            number, position = divmod(offset, SEGMENT_SPAN)
+            U32.pack_into(self.segments[number], position, slot)
+        self.keys = keys
+        self.offsets = offsets
+        self.filled = self.used
+        self.cached_key = None
+
+    def __len__(self):
+        return self.used
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for key in self.keys:
+            if key is not None and key is not _DELETED:
+                yield key
+
+    def __getitem__(self, key):
+        slot = self._find(key)
+        if slot < 0:
+            raise KeyError(key)
+        return self._value(self.offsets[slot])
+
+    def get(self, key, default=None):
+        slot = self._find(key)
+        return default if slot < 0 else self._value(self.offsets[slot])
+
+    def __setitem__(self, key, value):
+        flags, payload = encode(value)
+        keys = self.keys
+        mask = len(keys) - 1
+        slot = self._start(key, mask)
+        insert_at = -1
+        while True:
+            current = keys[slot]
+            if current is None:
+                break
+            if current is _DELETED:
+                if insert_at < 0:
+                    insert_at = slot
+            elif current is key or current == key:
+                self._replace(slot, flags, payload)
+                return
+            slot = (slot + 1) & mask
+        if insert_at < 0:
+            insert_at = slot
+            self.filled += 1
+        keys[insert_at] = key
+        self.offsets[insert_at] = self._append(insert_at, 0, flags, payload)
+        self.cached_key = key
+        self.cached_slot = insert_at
+        self.used += 1
+        if 3 * self.filled >= 2 * len(keys):
+            self._resize()
+
+    def _replace(self, slot, flags, payload):
+        """Store a new value for the key in slot, keeping its version"""
+        offset = self.offsets[slot]
+        number, position = divmod(offset, SEGMENT_SPAN)
+        segment = self.segments[number]
+        _, length, version, _ = HEADER.unpack_from(segment, position)
+        if length == len(payload):
+            HEADER.pack_into(segment, position, slot, length, version, flags)
+            start = position + HEADER.size
+            segment[start:start + length] = payload
+            return
+        self._kill(offset)
+        self.offsets[slot] = self._append(slot, version, flags, payload)
+
+    def pop(self, key, default=_MISSING):
+        slot = self._find(key)
+        if slot < 0:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        offset = self.offsets[slot]
+        value = self._value(offset)
+        self._kill(offset)
+        self.keys[slot] = _DELETED
+        self.cached_key = None
+        self.used -= 1
+        return value
+
+    def items(self):
+        offsets = self.offsets
+        for slot, key in enumerate(self.keys):
+            if key is not None and key is not _DELETED:
+                yield key, self._value(offsets[slot])
+
+    @property
+    def arena_bytes(self):
+        """Bytes held by the segments, dead records included"""
+        return sum(len(segment) for segment in self.segments if segment is not None)
+
+    @property
+    def dead_bytes(self):
+        return sum(self.dead)
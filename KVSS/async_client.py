@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Asyncio client for KVSS
+Concurrent calls share one connection: requests issued in the same event loop
+iteration are written together, and a reader task matches responses to callers in
+FIFO order, so pipelining happens without any caller coordination.
+"""
+
+import asyncio
+import json
+from collections import deque
+
+from client import KVSSError, parse_counts
+import protocol
+from compression import from_wire
+
+
+def expire_call(future):
+    """Timer callback: fail a call still waiting for its response"""
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
+
+
+class AsyncKVSSClient:
+    # Bytes requested per read; many pipelined responses are parsed per read
+    READ_SIZE = 256 * 1024
+
+    def __init__(self, host='127.0.0.1', port=5050, timeout=5.0, binary=False, max_pending=10000,
+                 compress=False):
+        """
+        timeout: seconds to wait for each response unless a call passes its own
+                 (None waits forever)
+        binary: upgrade to the KV/2.0 binary protocol on connect (values are then bytes)
+        max_pending: requests in flight before further calls wait for responses
+        compress: with binary, receive values compressed as stored (see KVSSClient)
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.use_binary = binary
+        self.binary = False
+        self.use_compress = compress
+        self.compressed = False
+        self.reader = None
+        self.writer = None
+        self.connected = False
+        self.pending = deque()   # Futures awaiting responses, in request order
+        self.outgoing = []       # Encoded requests not yet written
+        self.flush_scheduled = False
+        self.max_pending = max_pending
+        self.waiters = deque()   # Calls waiting for an in-flight slot, oldest first
+        self.read_task = None
+        self.error = None        # Why the connection was lost
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Open the connection (and upgrade it to KV/2.0 if requested)"""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        self.connected = True
+        self.error = None
+        self.binary = self.compressed = False
+        if self.use_binary and self.use_compress:
+            self.writer.write(f"{protocol.HELLO_COMPRESS}\n".encode('utf-8'))
+            response = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            self.binary = self.compressed = (response.decode('utf-8').strip()
+                                             == f"200 OK {protocol.VERSION} COMPRESS")
+        if self.use_binary and not self.binary:
+            self.writer.write(f"{protocol.HELLO}\n".encode('utf-8'))
+            response = await asyncio.wait_for(self.reader.readline(), self.timeout)
+            self.binary = response.decode('utf-8').strip() == f"200 OK {protocol.VERSION}"
+        self.read_task = asyncio.ensure_future(self._read_loop())
+
+    async def close(self):
+        """Close the connection; calls still waiting fail with ConnectionError"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+        if self.read_task:
+            self.read_task.cancel()
+            try:
+                await self.read_task
+            except asyncio.CancelledError:
+                pass
+        self._fail(ConnectionError("Connection closed"))
+        self.writer = None
+
+    def _fail(self, error):
+        """Mark the connection lost and fail every call waiting for a response"""
+        self.connected = False
+        self.error = error
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+        self._wake_waiters()
+    
+    def _wake_waiters(self):
+        """Let waiting calls proceed as in-flight slots free up"""
+        free = self.max_pending - len(self.pending)
+        while self.waiters and (free > 0 or not self.connected):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _flush(self):
+        self.flush_scheduled = False
+        if self.outgoing and self.connected:
+            self.writer.write(b''.join(self.outgoing))
+        self.outgoing.clear()
+
+    async def _call(self, payload, timeout):
+        """Queue one encoded request and wait for its response"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.connected:
+                raise ConnectionError(f"Not connected: {self.error or 'call connect() first'}")
+            if len(self.pending) < self.max_pending and not self.waiters:
+                break
+            waiter = loop.create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                self._wake_waiters()
+                raise
+            if len(self.pending) < self.max_pending:
+                break
+        
+        future = loop.create_future()
+        self.pending.append(future)
+        self.outgoing.append(payload)
+        if not self.flush_scheduled:
+            # Everything queued during this loop iteration goes out in one write
+            self.flush_scheduled = True
+            loop.call_soon(self._flush)
+        self._wake_waiters()
+        
+        # A cancelled or timed-out call leaves its future in place; the reader still
+        # consumes the response, so later callers stay matched
+        timeout = self.timeout if timeout is None else timeout
+        timer = loop.call_later(timeout, expire_call, future) if timeout is not None else None
+        try:
+            return await future
+        finally:
+            if timer:
+                timer.cancel()
+
+    async def _read_loop(self):
+        """Read responses in bulk and resolve the waiting calls in FIFO order"""
+        buffer = bytearray()
+        scanned = 0
+        try:
+            while True:
+                data = await self.reader.read(self.READ_SIZE)
+                if not data:
+                    raise ConnectionError("Connection closed by server")
+                buffer += data
+                offset = 0
+                while self.pending:
+                    if self.binary:
+                        if len(buffer) - offset < protocol.RESPONSE_HEADER.size:
+                            break
+                        length, status = protocol.RESPONSE_HEADER.unpack_from(buffer, offset)
+                        end = offset + protocol.LENGTH.size + length
+                        if end > len(buffer):
+                            break
+                        result = (status, bytes(buffer[offset + protocol.RESPONSE_HEADER.size:end]))
+                        offset = end
+                    else:
+                        end = buffer.find(b'\n', max(offset, scanned))
+                        if end < 0:
+                            scanned = len(buffer)
+                            break
+                        result = buffer[offset:end].decode('utf-8').strip()
+                        offset = end + 1
+                    future = self.pending.popleft()
+                    if not future.done():
+                        future.set_result(result)
+                del buffer[:offset]
+                scanned = max(scanned - offset, 0)
+                self._wake_waiters()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(e if isinstance(e, ConnectionError) else ConnectionError(str(e)))
+
+    async def send_command(self, command, timeout=None):
+        """Send a KV/1.0 command line and return the raw response line"""
+        if self.binary:
+            raise RuntimeError("send_command needs a KV/1.0 connection; use the typed methods")
+        return await self._call(f"{command}\n".encode('utf-8'), timeout)
+
+    async def send_frame(self, command, args=(), timeout=None):
+        """Send a KV/2.0 request and return (status, body bytes)"""
+        return await self._call(protocol.encode_request(command, args), timeout)
+
+    async def _request(self, command, timeout):
+        """Send a text command and return its body, raising KVSSError on failure"""
+        response = await self.send_command(command, timeout)
+        status, _, body = response.partition(' ')
+        if not status.startswith('2'):
+            raise KVSSError(response)
+        return body.partition(' ')[2]
+
+    def _status_error(self, status):
+        return KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+
+    async def get(self, key, timeout=None):
+        """Return the value of key (str, or bytes over KV/2.0), or None if missing"""
+        if self.binary:
+            status, body = await self.send_frame('GET', [key], timeout)
+            if status == 404:
+                return None
+            if status != 200:
+                raise self._status_error(status)
+            return from_wire(body) if self.compressed else body
+        response = await self.send_command(f"KV/1.0 GET {key}", timeout)
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return response.split(' ', 2)[2] if response.count(' ') >= 2 else ''
+
+    async def put(self, key, value, ttl=None, timeout=None):
+        """Store value under key (optionally expiring); returns True if created"""
+        if self.binary:
+            args = [key, value] + ([str(ttl)] if ttl is not None else [])
+            status, _ = await self.send_frame('PUT', args, timeout)
+            if status not in (200, 201):
+                raise self._status_error(status)
+            return status == 201
+        command = f"KV/1.0 PUT {key} {value}" if ttl is None else f"KV/1.0 PUTEX {key} {ttl} {value}"
+        response = await self.send_command(command, timeout)
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return response.startswith('201')
+
+    async def delete(self, key, timeout=None):
+        """Delete key; returns True if it existed"""
+        if self.binary:
+            status, _ = await self.send_frame('DEL', [key], timeout)
+        else:
+            response = await self.send_command(f"KV/1.0 DEL {key}", timeout)
+            status = int(response.split(' ', 1)[0])
+        if status == 404:
+            return False
+        if status >= 300:
+            raise self._status_error(status)
+        return True
+
+    async def mget(self, keys, timeout=None):
+        """Fetch many keys in one request; returns {key: value or None}"""
+        keys = list(keys)
+        if self.binary:
+            status, body = await self.send_frame('MGET', keys, timeout)
+            if status != 200:
+                raise self._status_error(status)
+            values = protocol.decode_values(body)
+            if self.compressed:
+                values = [None if value is None else from_wire(value) for value in values]
+            return dict(zip(keys, values))
+        values = json.loads(await self._request(f"KV/1.0 MGET {' '.join(keys)}", timeout))
+        return dict(zip(keys, values))
+
+    async def mput(self, items, timeout=None):
+        """Store many pairs atomically; returns {'created': n, 'updated': m}"""
+        items = dict(items)
+        if self.binary:
+            args = [part for item in items.items() for part in item]
+            status, body = await self.send_frame('MPUT', args, timeout)
+            if status != 200:
+                raise self._status_error(status)
+            return parse_counts(body.decode('utf-8'))
+        pairs = ' '.join(f"{key} {value}" for key, value in items.items())
+        return parse_counts(await self._request(f"KV/1.0 MPUT {pairs}", timeout))
+
+    async def mdel(self, keys, timeout=None):
+        """Delete many keys atomically; returns the number deleted"""
+        if self.binary:
+            status, body = await self.send_frame('MDEL', list(keys), timeout)
+            if status != 200:
+                raise self._status_error(status)
+            return parse_counts(body.decode('utf-8'))['deleted']
+        return parse_counts(await self._request(f"KV/1.0 MDEL {' '.join(keys)}", timeout))['deleted']
+
+    async def expire(self, key, seconds, timeout=None):
+        """Set a TTL on key; returns False if the key does not exist"""
+        if self.binary:
+            status, _ = await self.send_frame('EXPIRE', [key, str(seconds)], timeout)
+        else:
+            response = await self.send_command(f"KV/1.0 EXPIRE {key} {seconds}", timeout)
+            status = int(response.split(' ', 1)[0])
+        if status == 404:
+            return False
+        if status >= 300:
+            raise self._status_error(status)
+        return True
+
+    async def ttl(self, key, timeout=None):
+        """Return the seconds key has left, -1 if it has no TTL, or None if missing"""
+        if self.binary:
+            status, body = await self.send_frame('TTL', [key], timeout)
+            if status == 404:
+                return None
+            if status != 200:
+                raise self._status_error(status)
+            return float(body)
+        response = await self.send_command(f"KV/1.0 TTL {key}", timeout)
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return float(response.split()[2])
+
+    async def incr(self, key, amount=1, timeout=None):
+        """Atomically add amount to the integer at key (0 if missing); returns the new value"""
+        if self.binary:
+            status, body = await self.send_frame('INCRBY', [key, str(amount)], timeout)
+            if status != 200:
+                raise self._status_error(status)
+            return int(body)
+        return int(await self._request(f"KV/1.0 INCRBY {key} {amount}", timeout))
+
+    async def decr(self, key, amount=1, timeout=None):
+        """Atomically subtract amount from the integer at key; returns the new value"""
+        return await self.incr(key, -amount, timeout)
+
+    async def append(self, key, value, timeout=None):
+        """Atomically append value to key (created if missing); returns the new length"""
+        if self.binary:
+            status, body = await self.send_frame('APPEND', [key, value], timeout)
+            if status != 200:
+                raise self._status_error(status)
+            return int(body)
+        return int(await self._request(f"KV/1.0 APPEND {key} {value}", timeout))
+
+    async def gets(self, key, timeout=None):
+        """Return (value, version) for key, or None if it does not exist"""
+        if self.binary:
+            status, body = await self.send_frame('GETS', [key], timeout)
+            if status == 404:
+                return None
+            if status != 200:
+                raise self._status_error(status)
+            version, _, value = body.partition(b' ')
+            return (from_wire(value) if self.compressed else value), int(version)
+        response = await self.send_command(f"KV/1.0 GETS {key}", timeout)
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        parts = response.split(' ', 3)
+        return (parts[3] if len(parts) > 3 else ''), int(parts[2])
+
+    async def cas(self, key, version, value, ttl=None, timeout=None):
+        """Store value only if key still has version; returns the new version or None"""
+        if self.binary:
+            args = [key, str(version), value] + ([str(ttl)] if ttl is not None else [])
+            status, body = await self.send_frame('CAS', args, timeout)
+        else:
+            command = (f"KV/1.0 CAS {key} {version} {value}" if ttl is None
+                       else f"KV/1.0 CASEX {key} {version} {ttl} {value}")
+            status, _, body = (await self.send_command(command, timeout)).partition(' ')
+            status = int(status)
+            body = body.partition(' ')[2]
+        if status in (404, 409):
+            return None
+        if status != 200:
+            raise self._status_error(status)
+        return int(body)
+
+    async def scan(self, cursor='0', prefix=None, start=None, end=None, count=None, timeout=None):
+        """Fetch one page of keys in key order; returns (next cursor, keys)"""
+        args = [cursor]
+        for name, value in (('PREFIX', prefix), ('START', start), ('END', end), ('COUNT', count)):
+            if value is not None:
+                args += [name, str(value)]
+        if self.binary:
+            status, body = await self.send_frame('SCAN', args, timeout)
+            if status != 200:
+                raise self._status_error(status)
+            body = body.decode('utf-8')
+        else:
+            body = await self._request(f"KV/1.0 SCAN {' '.join(args)}", timeout)
+        cursor, _, keys = body.partition(' ')
+        return cursor, json.loads(keys)
+
+    async def stats(self, timeout=None):
+        """Return the server statistics as a dict of numbers"""
+        if self.binary:
+            status, body = await self.send_frame('STATS', [], timeout)
+            if status != 200:
+                raise self._status_error(status)
+            return parse_counts(body.decode('utf-8'))
+        return parse_counts(await self._request("KV/1.0 STATS", timeout))
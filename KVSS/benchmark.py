@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+KVSS benchmarks
+Starts a throw-away server for each configuration and measures it over loopback
+"""
+
+import argparse
+import asyncio
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import protocol
+from async_client import AsyncKVSSClient
+from cluster import KVSSClusterClient
+from pool import KVSSClientPool
+from server import raise_fd_limit
+
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(host, port, timeout=10.0):
+    """Block until a server accepts connections on host:port"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def start_server(port, extra_args, workdir):
+    """Launch server.py in a subprocess with its logs kept in workdir"""
+    cmd = [sys.executable, SERVER_SCRIPT, '127.0.0.1', str(port)] + list(extra_args)
+    process = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not wait_for_port('127.0.0.1', port):
+        process.kill()
+        raise RuntimeError(f"Server {' '.join(cmd)} did not start")
+    return process
+
+
+def stop_server(process):
+    """Terminate a server subprocess"""
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def process_status(pid):
+    """Return (rss_kb, threads) for a process, or (None, None) where /proc is unavailable"""
+    rss, threads = None, None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, threads
+
+
+async def open_connections(port, count):
+    """Open count idle connections to the server"""
+    connections = []
+    for _ in range(count):
+        connections.append(await asyncio.open_connection('127.0.0.1', port))
+    return connections
+
+
+async def request_loop(reader, writer, requests, key):
+    """Issue PUT/GET round trips on one connection"""
+    for i in range(requests):
+        command = f"KV/1.0 PUT {key} {i}\n" if i % 2 == 0 else f"KV/1.0 GET {key}\n"
+        writer.write(command.encode('utf-8'))
+        await reader.readline()
+
+
+async def run_load(port, idle, active, requests, pid):
+    """Hold idle connections open while active connections issue requests
+
+    Returns the elapsed time and the server's (rss_kb, threads) sampled while all
+    connections are still open.
+    """
+    idle_connections = await open_connections(port, idle)
+    active_connections = await open_connections(port, active)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        request_loop(reader, writer, requests, f"bench{i}")
+        for i, (reader, writer) in enumerate(active_connections)
+    ))
+    elapsed = time.perf_counter() - start
+    status = process_status(pid)
+
+    for _, writer in idle_connections + active_connections:
+        writer.close()
+    return elapsed, status
+
+
+async def pipelined_puts(port, connections, requests, depth, value):
+    """Issue PUTs over several connections, depth requests in flight per connection"""
+    streams = await open_connections(port, connections)
+
+    async def worker(index, reader, writer):
+        for batch_start in range(0, requests, depth):
+            batch = range(batch_start, min(batch_start + depth, requests))
+            writer.write(''.join(f"KV/1.0 PUT c{index}k{i} {value}\n" for i in batch).encode('utf-8'))
+            for _ in batch:
+                await reader.readline()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i, reader, writer) for i, (reader, writer) in enumerate(streams)))
+    elapsed = time.perf_counter() - start
+    for _, writer in streams:
+        writer.close()
+    return elapsed
+
+
+async def pipelined_gets(ports, connections, requests, depth, keys):
+    """Issue GETs for keys over connections spread round-robin across ports"""
+    streams = []
+    for index in range(connections):
+        streams.extend(await open_connections(ports[index % len(ports)], 1))
+
+    async def worker(index, reader, writer):
+        for batch_start in range(0, requests, depth):
+            batch = range(batch_start, min(batch_start + depth, requests))
+            writer.write(''.join(f"KV/1.0 GET key{(index * requests + i) % keys}\n"
+                                 for i in batch).encode('utf-8'))
+            for _ in batch:
+                await reader.readline()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i, reader, writer) for i, (reader, writer) in enumerate(streams)))
+    elapsed = time.perf_counter() - start
+    for _, writer in streams:
+        writer.close()
+    return elapsed
+
+
+async def protocol_roundtrips(port, binary, requests, depth, value):
+    """PUT then GET requests keys over one pipelined connection in KV/1.0 or KV/2.0
+
+    Returns the elapsed seconds for both phases.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    if binary:
+        writer.write(f"{protocol.HELLO}\n".encode('utf-8'))
+        await reader.readline()
+
+    buffer = bytearray()
+
+    async def read_responses(count):
+        """Consume count responses, scanning whole reads rather than awaiting each one"""
+        nonlocal buffer
+        offset = 0
+        scanned = 0  # Text: bytes already searched for a newline
+        while count:
+            if binary:
+                if len(buffer) - offset >= protocol.LENGTH.size:
+                    end = offset + protocol.LENGTH.size + protocol.LENGTH.unpack_from(buffer, offset)[0]
+                    if end <= len(buffer):
+                        offset = end
+                        count -= 1
+                        continue
+            else:
+                end = buffer.find(b'\n', max(offset, scanned))
+                if end >= 0:
+                    offset = end + 1
+                    count -= 1
+                    continue
+            del buffer[:offset]
+            offset = 0
+            scanned = len(buffer)
+            data = await reader.read(262144)
+            if not data:
+                raise ConnectionError("server closed the connection")
+            buffer += data
+        del buffer[:offset]
+
+    start = time.perf_counter()
+    for command in ('PUT', 'GET'):
+        for batch_start in range(0, requests, depth):
+            batch = range(batch_start, min(batch_start + depth, requests))
+            if binary:
+                args = (lambda i: [f"k{i}", value]) if command == 'PUT' else (lambda i: [f"k{i}"])
+                writer.write(b''.join(protocol.encode_request(command, args(i)) for i in batch))
+            else:
+                suffix = f" {value}" if command == 'PUT' else ""
+                writer.write(''.join(f"KV/1.0 {command} k{i}{suffix}\n" for i in batch).encode('utf-8'))
+            await read_responses(len(batch))
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return elapsed
+
+
+def bench_protocol(args):
+    """Compare KV/1.0 text and KV/2.0 binary round-trips for each value size"""
+    print(f"{'protocol':<10} {'value_b':>8} {'ops':>8} {'ops/s':>10} {'MB/s':>8}")
+    for size in args.value_sizes:
+        value = 'x' * size
+        for name, binary in (('KV/1.0', False), ('KV/2.0', True)):
+            with tempfile.TemporaryDirectory() as workdir:
+                port = free_port()
+                process = start_server(port, ['--trace-sample', '0'] + shlex.split(args.server_args), workdir)
+                try:
+                    loop = asyncio.new_event_loop()
+                    try:
+                        elapsed = loop.run_until_complete(
+                            protocol_roundtrips(port, binary, args.requests, args.depth, value)
+                        )
+                    finally:
+                        loop.close()
+                finally:
+                    stop_server(process)
+
+            ops = 2 * args.requests
+            megabytes = ops * size / (1024 * 1024)
+            print(f"{name:<10} {size:>8} {ops:>8} {ops / elapsed:>10.0f} {megabytes / elapsed:>8.1f}")
+
+
+async def async_client_load(port, binary, concurrency, requests):
+    """Run concurrency coroutines doing PUT+GET over one AsyncKVSSClient connection"""
+    async with AsyncKVSSClient('127.0.0.1', port, binary=binary) as client:
+        async def worker(index):
+            for i in range(requests):
+                await client.put(f"w{index}k{i}", "value")
+                await client.get(f"w{index}k{i}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def bench_async_client(args):
+    """Throughput of one AsyncKVSSClient connection as concurrent callers increase"""
+    print(f"{'protocol':<10} {'callers':>8} {'ops':>8} {'ops/s':>10}")
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        process = start_server(port, ['--trace-sample', '0'] + shlex.split(args.server_args), workdir)
+        try:
+            for binary in (False, True):
+                for concurrency in args.concurrency:
+                    loop = asyncio.new_event_loop()
+                    try:
+                        elapsed = loop.run_until_complete(
+                            async_client_load(port, binary, concurrency, args.requests)
+                        )
+                    finally:
+                        loop.close()
+                    ops = 2 * concurrency * args.requests
+                    name = 'KV/2.0' if binary else 'KV/1.0'
+                    print(f"{name:<10} {concurrency:>8} {ops:>8} {ops / elapsed:>10.0f}")
+        finally:
+            stop_server(process)
+
+
+def bench_cluster(args):
+    """Shard keys over several local servers: balance, fan-out MGET, and ring movement"""
+    with tempfile.TemporaryDirectory() as workdir:
+        ports = [free_port() for _ in range(args.servers + 1)]
+        processes = [start_server(port, ['--trace-sample', '0'], workdir) for port in ports]
+        try:
+            endpoints = [f"127.0.0.1:{port}" for port in ports[:-1]]
+            keys = [f"key{i}" for i in range(args.keys)]
+            with KVSSClusterClient(endpoints, vnodes=args.vnodes, max_connections=4) as cluster:
+                start = time.perf_counter()
+                for batch_start in range(0, len(keys), args.batch):
+                    batch = keys[batch_start:batch_start + args.batch]
+                    cluster.mput({key: 'v' for key in batch})
+                mput_elapsed = time.perf_counter() - start
+
+                start = time.perf_counter()
+                for batch_start in range(0, len(keys), args.batch):
+                    values = cluster.mget(keys[batch_start:batch_start + args.batch])
+                    assert all(value is not None for value in values.values())
+                mget_elapsed = time.perf_counter() - start
+
+                counts = {node: int(stats['keys']) for node, stats in cluster.stats().items()}
+                ideal = args.keys / len(endpoints)
+                print(f"{'server':<18} {'keys':>8} {'vs_even':>8}")
+                for node, count in counts.items():
+                    print(f"{node:<18} {count:>8} {count / ideal:>8.2f}")
+                print(f"mput {args.keys / mput_elapsed:.0f} keys/s, mget {args.keys / mget_elapsed:.0f} keys/s "
+                      f"(batches of {args.batch} fanned out to {len(endpoints)} servers)")
+
+                before = {key: cluster.node_for(key) for key in keys}
+                cluster.add_node(f"127.0.0.1:{ports[-1]}")
+                moved = sum(cluster.node_for(key) != before[key] for key in keys)
+                print(f"add 1 server: {moved / args.keys:.1%} of keys moved "
+                      f"(ideal {1 / (len(endpoints) + 1):.1%})")
+                removed = endpoints[0]
+                before = {key: cluster.node_for(key) for key in keys}
+                cluster.remove_node(removed)
+                moved = sum(cluster.node_for(key) != before[key] for key in keys)
+                owned = sum(node == removed for node in before.values())
+                print(f"remove 1 server: {moved / args.keys:.1%} of keys moved "
+                      f"(the {owned / args.keys:.1%} it owned)")
+        finally:
+            for process in processes:
+                stop_server(process)
+
+
+def bench_replication(args):
+    """Leader plus followers: initial sync time, live catch-up and read scaling"""
+    with tempfile.TemporaryDirectory() as workdir:
+        server_args = ['--trace-sample', '0'] + shlex.split(args.server_args)
+        leader_port = free_port()
+        processes = [start_server(leader_port, server_args, workdir)]
+        try:
+            with KVSSClientPool('127.0.0.1', leader_port) as leader:
+                for batch_start in range(0, args.keys, args.batch):
+                    leader.mput({f"key{i}": 'v' * args.value_size
+                                 for i in range(batch_start, min(batch_start + args.batch, args.keys))})
+
+                # Initial sync: followers start empty and load the leader's snapshot
+                follower_ports = [free_port() for _ in range(args.followers)]
+                start = time.perf_counter()
+                for port in follower_ports:
+                    processes.append(start_server(
+                        port, server_args + ['--replica-of', f"127.0.0.1:{leader_port}"], workdir))
+                followers = [KVSSClientPool('127.0.0.1', port) for port in follower_ports]
+                for follower in followers:
+                    while follower.stats().get('repl_synced') != 1:
+                        time.sleep(0.01)
+                print(f"initial sync of {args.keys} keys to {args.followers} followers: "
+                      f"{time.perf_counter() - start:.3f}s")
+
+                # Live stream: time from the last write on the leader to it being readable everywhere
+                start = time.perf_counter()
+                for batch_start in range(0, args.keys, args.batch):
+                    leader.mput({f"key{i}": 'w' * args.value_size
+                                 for i in range(batch_start, min(batch_start + args.batch, args.keys))})
+                written = time.perf_counter() - start
+                leader.put('marker', 'done')
+                for follower in followers:
+                    while follower.get('marker') != 'done':
+                        pass
+                print(f"rewrote {args.keys} keys in {written:.3f}s; followers caught up "
+                      f"{time.perf_counter() - start - written:.3f}s after the last write")
+                time.sleep(1.0)  # Let a heartbeat round trip update the lag figures
+                print(f"leader lag: {leader.stats()['repl_lag']} records; follower lag: " +
+                      ', '.join(f"{follower.stats()['repl_lag'] * 1000:.2f}ms" for follower in followers))
+                for follower in followers:
+                    follower.close()
+
+            print(f"{'nodes':>6} {'reads':>8} {'reads/s':>10}")
+            ports = [leader_port] + follower_ports
+            reads = args.connections * args.requests
+            for count in sorted({1, len(ports)}):
+                loop = asyncio.new_event_loop()
+                try:
+                    elapsed = loop.run_until_complete(pipelined_gets(
+                        ports[:count], args.connections, args.requests, args.depth, args.keys))
+                finally:
+                    loop.close()
+                print(f"{count:>6} {reads:>8} {reads / elapsed:>10.0f}")
+        finally:
+            for process in processes:
+                stop_server(process)
+
+
+def client_process(port, connections, requests, depth):
+    """Load generator run in a separate process: pipelined PUTs, then GETs of the same keys
+
+    Returns the elapsed seconds.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        elapsed = loop.run_until_complete(pipelined_puts(port, connections, requests, depth, 'v'))
+        return elapsed + loop.run_until_complete(pipelined_gets(
+            [port], connections, requests, depth, connections * requests))
+    finally:
+        loop.close()
+
+
+def bench_workers(args):
+    """Throughput of the multi-process server as the worker count grows"""
+    print(f"{os.cpu_count()} CPUs; {args.clients} client processes x {args.connections} connections")
+    print(f"{'workers':>8} {'ops':>9} {'ops/s':>10}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            process = start_server(port, ['--trace-sample', '0', '--workers', str(workers)] +
+                                   shlex.split(args.server_args), workdir)
+            try:
+                with ProcessPoolExecutor(args.clients) as executor:
+                    futures = [executor.submit(client_process, port, args.connections,
+                                               args.requests, args.depth)
+                               for _ in range(args.clients)]
+                    elapsed = max(future.result() for future in futures)
+            finally:
+                stop_server(process)
+        ops = 2 * args.clients * args.connections * args.requests
+        print(f"{workers:>8} {ops:>9} {ops / elapsed:>10.0f}")
+
+
+def bench_fsync(args):
+    """Write throughput under each fsync policy, then recovery time of the result"""
+    value = 'x' * args.value_size
+    print(f"{'fsync':<10} {'ops':>8} {'ops/s':>10} {'recovery_s':>11}")
+    for policy in args.policies:
+        with tempfile.TemporaryDirectory() as workdir:
+            data_dir = os.path.join(workdir, 'data')
+            server_args = ['--trace-sample', '0', '--data-dir', data_dir, '--fsync', policy]
+            port = free_port()
+            process = start_server(port, server_args, workdir)
+            try:
+                loop = asyncio.new_event_loop()
+                try:
+                    elapsed = loop.run_until_complete(
+                        pipelined_puts(port, args.connections, args.requests, args.depth, value)
+                    )
+                finally:
+                    loop.close()
+            finally:
+                stop_server(process)
+
+            # Restart on the same data directory and time until it accepts connections
+            port = free_port()
+            start = time.perf_counter()
+            process = start_server(port, server_args, workdir)
+            recovery = time.perf_counter() - start
+            stop_server(process)
+
+        ops = args.connections * args.requests
+        print(f"{policy:<10} {ops:>8} {ops / elapsed:>10.0f} {recovery:>11.3f}")
+
+
+def bench_modes(args):
+    """Compare the threaded and asyncio connection engines"""
+    raise_fd_limit()
+    print(f"{'mode':<10} {'idle':>6} {'active':>6} {'ops':>8} {'ops/s':>10} {'rss_kb':>8} {'threads':>8}")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            process = start_server(port, ['--mode', mode] + shlex.split(args.server_args), workdir)
+            try:
+                loop = asyncio.new_event_loop()
+                try:
+                    elapsed, (rss, threads) = loop.run_until_complete(
+                        run_load(port, args.idle, args.connections, args.requests, process.pid)
+                    )
+                finally:
+                    loop.close()
+            finally:
+                stop_server(process)
+
+        ops = args.connections * args.requests
+        print(f"{mode:<10} {args.idle:>6} {args.connections:>6} {ops:>8} {ops / elapsed:>10.0f} "
+              f"{rss if rss is not None else 'n/a':>8} {threads if threads is not None else 'n/a':>8}")
+
+
+def bench_storage(args):
+    """Server memory per key and throughput of each storage engine"""
+    value = 'v' * args.value_size
+    print(f"{'storage':<8} {'keys':>9} {'bytes/key':>10} {'mput keys/s':>12} {'gets/s':>10}")
+    for storage in args.engines:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = free_port()
+            process = start_server(port, ['--trace-sample', '0', '--storage', storage] +
+                                   shlex.split(args.server_args), workdir)
+            try:
+                with KVSSClientPool('127.0.0.1', port) as pool:
+                    pool.put('warmup', value)
+                    before, _ = process_status(process.pid)
+                    start = time.perf_counter()
+                    for batch_start in range(0, args.keys, args.batch):
+                        pool.mput({f"key{i}": value
+                                   for i in range(batch_start, min(batch_start + args.batch, args.keys))})
+                    load_elapsed = time.perf_counter() - start
+                    after, _ = process_status(process.pid)
+                loop = asyncio.new_event_loop()
+                try:
+                    elapsed = loop.run_until_complete(pipelined_gets(
+                        [port], args.connections, args.requests, args.depth, args.keys))
+                finally:
+                    loop.close()
+            finally:
+                stop_server(process)
+
+        per_key = f"{(after - before) * 1024 / args.keys:.0f}" if before is not None else 'n/a'
+        print(f"{storage:<8} {args.keys:>9} {per_key:>10} {args.keys / load_elapsed:>12.0f} "
+              f"{args.connections * args.requests / elapsed:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="KVSS benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    modes = subparsers.add_parser('modes', help="threaded vs asyncio server engine")
+    modes.add_argument('--modes', nargs='+', default=['threaded', 'asyncio'])
+    modes.add_argument('--idle', type=int, default=200, help="idle connections held open")
+    modes.add_argument('--connections', type=int, default=50, help="active connections")
+    modes.add_argument('--requests', type=int, default=200, help="requests per active connection")
+    modes.add_argument('--server-args', default='',
+                       help="extra server.py arguments, e.g. \"--trace-sample 0\"")
+    modes.set_defaults(func=bench_modes)
+
+    fsync = subparsers.add_parser('fsync', help="write throughput per persistence fsync policy")
+    fsync.add_argument('--policies', nargs='+', default=['never', 'interval', 'always'])
+    fsync.add_argument('--connections', type=int, default=8, help="writer connections")
+    fsync.add_argument('--requests', type=int, default=5000, help="PUTs per connection")
+    fsync.add_argument('--depth', type=int, default=32, help="pipelined requests in flight")
+    fsync.add_argument('--value-size', type=int, default=100, help="value size in bytes")
+    fsync.set_defaults(func=bench_fsync)
+
+    proto = subparsers.add_parser('protocol', help="KV/1.0 text vs KV/2.0 binary protocol")
+    proto.add_argument('--value-sizes', nargs='+', type=int, default=[16, 4096, 262144],
+                       help="value sizes in bytes")
+    proto.add_argument('--requests', type=int, default=20000, help="PUTs and GETs each")
+    proto.add_argument('--depth', type=int, default=32, help="pipelined requests in flight")
+    proto.add_argument('--server-args', default='', help="extra server.py arguments")
+    proto.set_defaults(func=bench_protocol)
+
+    aclient = subparsers.add_parser('async-client', help="AsyncKVSSClient pipelining over one connection")
+    aclient.add_argument('--concurrency', nargs='+', type=int, default=[1, 10, 100, 1000],
+                         help="concurrent callers sharing the connection")
+    aclient.add_argument('--requests', type=int, default=200, help="PUT+GET pairs per caller")
+    aclient.add_argument('--server-args', default='--mode asyncio', help="extra server.py arguments")
+    aclient.set_defaults(func=bench_async_client)
+
+    cluster = subparsers.add_parser('cluster', help="consistent-hash sharding over local servers")
+    cluster.add_argument('--servers', type=int, default=3, help="server processes to start")
+    cluster.add_argument('--keys', type=int, default=20000, help="keys written and read")
+    cluster.add_argument('--batch', type=int, default=100, help="keys per MPUT/MGET")
+    cluster.add_argument('--vnodes', type=int, default=160, help="ring points per server")
+    cluster.set_defaults(func=bench_cluster)
+
+    workers = subparsers.add_parser('workers', help="multi-process server scaling with --workers")
+    workers.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4],
+                         help="worker counts to compare")
+    workers.add_argument('--clients', type=int, default=4, help="load generator processes")
+    workers.add_argument('--connections', type=int, default=8, help="connections per client process")
+    workers.add_argument('--requests', type=int, default=2000, help="PUTs and GETs per connection")
+    workers.add_argument('--depth', type=int, default=32, help="pipelined requests in flight")
+    workers.add_argument('--server-args', default='', help="extra server.py arguments")
+    workers.set_defaults(func=bench_workers)
+
+    replication = subparsers.add_parser('replication', help="leader-follower sync, lag and read scaling")
+    replication.add_argument('--followers', type=int, default=2, help="follower processes to start")
+    replication.add_argument('--keys', type=int, default=50000, help="keys on the leader")
+    replication.add_argument('--batch', type=int, default=500, help="keys per MPUT")
+    replication.add_argument('--value-size', type=int, default=100, help="value size in bytes")
+    replication.add_argument('--connections', type=int, default=12, help="reader connections")
+    replication.add_argument('--requests', type=int, default=5000, help="GETs per connection")
+    replication.add_argument('--depth', type=int, default=32, help="pipelined requests in flight")
+    replication.add_argument('--server-args', default='', help="extra server.py arguments")
+    replication.set_defaults(func=bench_replication)
+
+    storage = subparsers.add_parser('storage', help="memory per key of the dict vs arena storage engines")
+    storage.add_argument('--engines', nargs='+', default=['dict', 'arena'])
+    storage.add_argument('--keys', type=int, default=500000, help="keys loaded")
+    storage.add_argument('--value-size', type=int, default=16, help="value size in bytes")
+    storage.add_argument('--batch', type=int, default=500, help="keys per MPUT")
+    storage.add_argument('--connections', type=int, default=8, help="reader connections")
+    storage.add_argument('--requests', type=int, default=5000, help="GETs per connection")
+    storage.add_argument('--depth', type=int, default=32, help="pipelined requests in flight")
+    storage.add_argument('--server-args', default='', help="extra server.py arguments")
+    storage.set_defaults(func=bench_storage)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
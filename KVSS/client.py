@@ -4,40 +4,107 @@ Mini Key-Value Store Service (KVSS) Client
 Connects to KVSS server and provides command-line interface
 """
 
+import json
 import socket
 import sys
 from datetime import datetime
 import os
 
+from log_writer import LogWriter, abbreviate
+import protocol
+from compression import from_wire, decompressor
+
+
+class KVSSError(Exception):
+    """Raised by the typed client methods when the server returns an error response"""
+    
+    def __init__(self, response):
+        super().__init__(response)
+        self.response = response
+
+
+def parse_counts(data):
+    """Parse a 'name=value name=value' response body into a dict of numbers
+
+    Values that are not numbers (e.g. role=leader) are kept as strings.
+    """
+    counts = {}
+    for item in data.split():
+        name, _, value = item.partition('=')
+        try:
+            counts[name] = float(value) if '.' in value else int(value)
+        except ValueError:
+            counts[name] = value
+    return counts
+
 
 class KVSSClient:
-    def __init__(self, host='127.0.0.1', port=5050, log_file=None):
+    # Bytes read per recv_into; values larger than this arrive over several reads
+    RECV_CHUNK_SIZE = 256 * 1024
+
+    def __init__(self, host='127.0.0.1', port=5050, log_file=None, binary=False,
+                 timeout=None, verbose=True, compress=False):
+        """
+        binary: upgrade to the KV/2.0 binary protocol on connect when the server supports it
+        compress: with binary, ask for values as the server stores them (compressed with
+                  --compression) and decompress them here, saving network bandwidth
+        timeout: socket timeout in seconds for connecting and each read/write (None blocks)
+        verbose: print requests, responses and errors and write them to log_file;
+                 library users such as KVSSClientPool turn this off
+        """
         self.host = host
         self.port = port
+        self.timeout = timeout
+        self.verbose = verbose
+        self.last_error = None
         self.socket = None
         self.connected = False
+        self.use_binary = binary
+        self.binary = False  # True while the connection speaks KV/2.0
+        self.use_compress = compress
+        self.compressed = False  # True while values arrive in their stored form
+        self.recv_buffer = bytearray()  # Bytes received but not yet returned as a response
+        self.recv_scanned = 0  # Leading bytes of recv_buffer known to hold no newline
+        self.recv_chunk = bytearray(self.RECV_CHUNK_SIZE)  # Reused for every recv_into
         self.log_file = log_file or f"kvss_client_{host}_{port}.log"
+        # Console output stays synchronous for the interactive prompt; file writes are
+        # batched by a LogWriter opened on first use and closed by disconnect()
+        self.logger = None
         
     def log_message(self, message):
-        """Write log message to both console and file"""
+        """Write log message to the console and queue it for the log file"""
+        if not self.verbose:
+            return
         print(message)
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(f"{message}\n")
-        except Exception as e:
-            print(f"Warning: Could not write to log file {self.log_file}: {e}")
+        if self.logger is None:
+            self.logger = LogWriter(self.log_file, console=False)
+        self.logger.log(message)
+    
+    def log_error(self, message):
+        """Record a client-side error, printing it unless the client is quiet"""
+        self.last_error = message
+        if self.verbose:
+            print(message)
     
     def connect(self):
         """Connect to the KVSS server"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.settimeout(self.timeout)
             self.socket.connect((self.host, self.port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.connected = True
+            self.binary = False
+            self.compressed = False
+            self.recv_buffer = bytearray()
+            self.recv_scanned = 0
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             self.log_message(f"[{timestamp}] [CONNECT] Connected to KVSS server at {self.host}:{self.port}")
+            if self.use_binary:
+                self.upgrade()
             return True
         except Exception as e:
-            print(f"Failed to connect to server: {e}")
+            self.log_error(f"Failed to connect to server: {e}")
             return False
     
     def disconnect(self):
@@ -47,28 +114,458 @@ class KVSSClient:
             self.connected = False
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             self.log_message(f"[{timestamp}] [DISCONNECT] Disconnected from server")
+        if self.logger:
+            self.logger.close()  # Stops its thread and closes the file
+            self.logger = None
+    
+    def is_alive(self):
+        """Cheap liveness check without a round trip
+
+        Peeks at the socket without blocking: an idle healthy connection has nothing
+        to read, while a connection the server closed reads as EOF.
+        """
+        if not self.connected or self.recv_buffer:
+            return False  # Unread bytes mean the request/response pairing is lost
+        try:
+            self.socket.setblocking(False)
+            try:
+                self.socket.recv(1, socket.MSG_PEEK)
+            finally:
+                self.socket.settimeout(self.timeout)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        return False  # EOF (server closed) or unsolicited data
     
     def send_command(self, command):
         """Send a command to the server and return the response"""
         if not self.connected:
             return "Error: Not connected to server"
+        if self.binary:
+            return self.send_text_as_frame(command)
         
         try:
             # Send command as-is (user must include KV/1.0 prefix)
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.log_message(f"[{timestamp}] [SEND] to {self.host}:{self.port}: {command}")
-            self.socket.send(f"{command}\n".encode('utf-8'))
+            self.log_message(f"[{timestamp}] [SEND] to {self.host}:{self.port}: {abbreviate(command)}")
+            self.socket.sendall(f"{command}\n".encode('utf-8'))
             
             # Receive response
-            response = self.socket.recv(1024).decode('utf-8').strip()
-            self.log_message(f"[{timestamp}] [RECV] from {self.host}:{self.port}: {response}")
+            response = self.read_response()
+            self.log_message(f"[{timestamp}] [RECV] from {self.host}:{self.port}: {abbreviate(response)}")
+            if command.strip() == protocol.HELLO and response == f"200 OK {protocol.VERSION}":
+                self.binary = True  # Later requests travel as KV/2.0 frames
+            elif (command.strip() == protocol.HELLO_COMPRESS
+                  and response == f"200 OK {protocol.VERSION} COMPRESS"):
+                self.binary = self.compressed = True
             return response
             
         except Exception as e:
-            print(f"Error sending command: {e}")
+            self.log_error(f"Error sending command: {e}")
+            self.connected = False
+            return "Error: Connection lost"
+    
+    def pipeline(self, commands):
+        """Send all commands in one write and return their responses in order"""
+        if not self.connected:
+            return ["Error: Not connected to server"] * len(commands)
+        if self.binary:
+            return [self.send_text_as_frame(command) for command in commands]
+        
+        responses = []
+        try:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for command in commands:
+                self.log_message(f"[{timestamp}] [SEND] to {self.host}:{self.port}: {abbreviate(command)}")
+            self.socket.sendall(''.join(f"{command}\n" for command in commands).encode('utf-8'))
+            
+            self.read_responses(len(commands), responses)
+            for response in responses:
+                self.log_message(f"[{timestamp}] [RECV] from {self.host}:{self.port}: {abbreviate(response)}")
+            return responses
+            
+        except Exception as e:
+            self.log_error(f"Error sending commands: {e}")
+            self.connected = False
+            return responses + ["Error: Connection lost"] * (len(commands) - len(responses))
+    
+    def read_response(self):
+        """Read one newline-terminated response"""
+        return self.read_responses(1)[0]
+    
+    def read_responses(self, count, responses=None):
+        """Read count newline-terminated responses, buffering any bytes after them
+
+        Responses are appended to the responses list when one is given, so callers
+        keep whatever arrived before a connection error.
+        """
+        responses = [] if responses is None else responses
+        target = len(responses) + count
+        buffer = self.recv_buffer
+        offset = 0
+        while len(responses) < target:
+            # Only search bytes not already scanned, so a long response costs one pass
+            end = buffer.find(b'\n', max(offset, self.recv_scanned))
+            if end < 0:
+                del buffer[:offset]
+                offset = 0
+                self.recv_scanned = len(buffer)
+                self._fill_buffer()
+                continue
+            responses.append(buffer[offset:end].decode('utf-8').strip())
+            offset = end + 1
+        # Keep unrequested responses buffered for the next read
+        del buffer[:offset]
+        self.recv_scanned = 0
+        return responses
+    
+    def upgrade(self):
+        """Switch the connection to the KV/2.0 binary protocol if the server supports it
+
+        Returns True once upgraded; servers without KV/2.0 answer 426 UPGRADE_REQUIRED
+        and the connection stays on KV/1.0 text. With compress, HELLO COMPRESS is tried
+        first, falling back to a plain upgrade on servers that do not know it.
+        """
+        if self.use_compress:
+            self.send_command(protocol.HELLO_COMPRESS)
+            if self.binary:
+                return True
+        self.send_command(protocol.HELLO)
+        return self.binary
+    
+    def send_frame(self, command, args=()):
+        """Send one KV/2.0 request and return (status, body bytes)"""
+        self.socket.sendall(protocol.encode_request(command, args))
+        return self.read_frame()
+    
+    def read_frame(self):
+        """Read one KV/2.0 response frame; returns (status, body bytes)"""
+        header_size = protocol.RESPONSE_HEADER.size
+        while len(self.recv_buffer) < header_size:
+            self._fill_buffer()
+        length, status = protocol.RESPONSE_HEADER.unpack_from(self.recv_buffer)
+        end = protocol.LENGTH.size + length
+        while len(self.recv_buffer) < end:
+            self._fill_buffer()
+        with memoryview(self.recv_buffer) as view:
+            body = bytes(view[header_size:end])
+        del self.recv_buffer[:end]
+        return status, body
+    
+    def _fill_buffer(self):
+        received = self.socket.recv_into(self.recv_chunk)
+        if not received:
+            raise ConnectionError("Connection closed by server")
+        self.recv_buffer += memoryview(self.recv_chunk)[:received]
+    
+    def send_text_as_frame(self, command):
+        """Run a KV/1.0-style command line over a KV/2.0 connection; returns a text response"""
+        parts = command.split()
+        if len(parts) < 2:
+            return "400 BAD_REQUEST"
+        name, args = parts[1], parts[2:]
+        if name == 'PUTEX' and len(args) >= 3:
+            # KV/2.0 PUT and CAS take the TTL as their last argument
+            name, args = 'PUT', [args[0], ' '.join(args[2:]), args[1]]
+        elif name == 'CASEX' and len(args) >= 4:
+            name, args = 'CAS', [args[0], args[1], ' '.join(args[3:]), args[2]]
+        elif name in ('PUT', 'CAS', 'APPEND') and len(args) >= 2:
+            fixed = 2 if name == 'CAS' else 1  # Arguments before the value
+            args = args[:fixed] + [' '.join(args[fixed:])]
+        if name not in protocol.OPCODES:
+            return "400 BAD_REQUEST"
+        
+        try:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.log_message(f"[{timestamp}] [SEND] to {self.host}:{self.port}: {abbreviate(command)}")
+            status, body = self.send_frame(name, args)
+            if name == 'MGET' and status == 200:
+                values = [value.decode('utf-8', 'replace') if value is not None else None
+                          for value in protocol.decode_values(body)]
+                body = json.dumps(values, ensure_ascii=False).encode('utf-8')
+            response = f"{status} {protocol.STATUS_TEXT.get(status, '')}"
+            if body:
+                response += f" {body.decode('utf-8', 'replace')}"
+            self.log_message(f"[{timestamp}] [RECV] from {self.host}:{self.port}: {abbreviate(response)}")
+            return response
+        except Exception as e:
+            self.log_error(f"Error sending command: {e}")
             self.connected = False
             return "Error: Connection lost"
     
+    def get(self, key):
+        """Return the value of key, or None if it does not exist
+
+        Values are str over KV/1.0 and bytes over KV/2.0.
+        """
+        if self.binary:
+            status, body = self.send_frame('GET', [key])
+            if status == 404:
+                return None
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            return from_wire(body) if self.compressed else body
+        response = self.send_command(f"KV/1.0 GET {key}")
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return response.split(' ', 2)[2] if response.count(' ') >= 2 else ''
+    
+    def put(self, key, value, ttl=None):
+        """Store value under key (optionally expiring after ttl seconds)
+
+        Returns True if the key was created. Over KV/2.0 the value may be any bytes,
+        including newlines; over KV/1.0 it must be single-line text.
+        """
+        if self.binary:
+            args = [key, value] + ([str(ttl)] if ttl is not None else [])
+            status, _ = self.send_frame('PUT', args)
+            if status not in (200, 201):
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            return status == 201
+        command = f"KV/1.0 PUT {key} {value}" if ttl is None else f"KV/1.0 PUTEX {key} {ttl} {value}"
+        response = self.send_command(command)
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return response.startswith('201')
+    
+    def delete(self, key):
+        """Delete key; returns True if it existed"""
+        response = self.send_command(f"KV/1.0 DEL {key}")
+        if response.startswith('404'):
+            return False
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return True
+    
+    def put_file(self, key, path, ttl=None):
+        """Store the contents of the file at path under key, streamed from disk
+
+        The file is sent with socket.sendfile, never read into memory. Uses KV/2.0,
+        upgrading the connection if needed. Returns True if the key was created.
+        """
+        self._require_binary()
+        key_bytes = protocol.to_bytes(key)
+        trailer = b''
+        if ttl is not None:
+            ttl_bytes = str(ttl).encode('utf-8')
+            trailer = protocol.LENGTH.pack(len(ttl_bytes)) + ttl_bytes
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            body_length = 2 * protocol.LENGTH.size + len(key_bytes) + size + len(trailer)
+            argc = 3 if ttl is not None else 2
+            header = (protocol.encode_request_header('PUT', argc, body_length)
+                      + protocol.LENGTH.pack(len(key_bytes)) + key_bytes + protocol.LENGTH.pack(size))
+            self.socket.sendall(header)
+            self.socket.sendfile(f)
+            if trailer:
+                self.socket.sendall(trailer)
+        status, _ = self.read_frame()
+        if status not in (200, 201):
+            raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+        return status == 201
+    
+    def get_file(self, key, path):
+        """Write the value of key to the file at path as it arrives
+
+        The value is never held in memory as a whole. Uses KV/2.0, upgrading the
+        connection if needed. Returns the number of bytes written, or None if the
+        key does not exist (the file is then left untouched).
+        """
+        self._require_binary()
+        self.socket.sendall(protocol.encode_request('GET', [key]))
+        header_size = protocol.RESPONSE_HEADER.size
+        while len(self.recv_buffer) < header_size:
+            self._fill_buffer()
+        length, status = protocol.RESPONSE_HEADER.unpack_from(self.recv_buffer)
+        if status != 200:
+            self.read_frame()
+            if status == 404:
+                return None
+            raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+        
+        remaining = length - 2
+        with open(path, 'wb') as f:
+            write = f.write
+            if self.compressed:
+                # Codec byte first; compressed values are decompressed as they arrive
+                while len(self.recv_buffer) < header_size + 1:
+                    self._fill_buffer()
+                codec = self.recv_buffer[header_size]
+                del self.recv_buffer[header_size:header_size + 1]
+                remaining -= 1
+                if codec:
+                    stream = decompressor(codec)
+                    write = lambda data: f.write(stream.decompress(data))
+            # Part of the value may already be buffered behind the header
+            buffered = min(len(self.recv_buffer) - header_size, remaining)
+            with memoryview(self.recv_buffer) as view:
+                write(view[header_size:header_size + buffered])
+            del self.recv_buffer[:header_size + buffered]
+            remaining -= buffered
+            chunk = memoryview(self.recv_chunk)
+            while remaining:
+                received = self.socket.recv_into(chunk[:min(remaining, len(chunk))])
+                if not received:
+                    raise ConnectionError("Connection closed by server")
+                write(chunk[:received])
+                remaining -= received
+            written = f.tell()
+        return written
+    
+    def _require_binary(self):
+        if not self.binary and not self.upgrade():
+            raise KVSSError(f"426 UPGRADE_REQUIRED (server does not support {protocol.VERSION})")
+    
+    def request(self, command):
+        """Send a command and return the response body, raising KVSSError on failure"""
+        response = self.send_command(command)
+        status, _, body = response.partition(' ')
+        if not status.startswith('2'):
+            raise KVSSError(response)
+        # Strip the reason phrase ("OK", "CREATED", ...) and keep the data
+        return body.partition(' ')[2]
+    
+    def mget(self, keys):
+        """Fetch many keys in one request; returns {key: value or None}"""
+        keys = list(keys)
+        if self.binary:
+            status, body = self.send_frame('MGET', keys)
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            values = protocol.decode_values(body)
+            if self.compressed:
+                values = [None if value is None else from_wire(value) for value in values]
+            return dict(zip(keys, values))
+        values = json.loads(self.request(f"KV/1.0 MGET {' '.join(keys)}"))
+        return dict(zip(keys, values))
+    
+    def mput(self, items):
+        """Store many key/value pairs atomically; returns {'created': n, 'updated': m}
+
+        Over KV/1.0 values must not contain whitespace (use PUT for those).
+        """
+        if self.binary:
+            args = [part for item in dict(items).items() for part in item]
+            status, body = self.send_frame('MPUT', args)
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            return parse_counts(body.decode('utf-8'))
+        pairs = ' '.join(f"{key} {value}" for key, value in dict(items).items())
+        return parse_counts(self.request(f"KV/1.0 MPUT {pairs}"))
+    
+    def mdel(self, keys):
+        """Delete many keys atomically; returns the number of keys deleted"""
+        return parse_counts(self.request(f"KV/1.0 MDEL {' '.join(keys)}"))['deleted']
+    
+    def expire(self, key, seconds):
+        """Set a TTL on key; returns False if the key does not exist"""
+        response = self.send_command(f"KV/1.0 EXPIRE {key} {seconds}")
+        if response.startswith('404'):
+            return False
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return True
+    
+    def ttl(self, key):
+        """Return the seconds key has left, -1 if it has no TTL, or None if missing"""
+        response = self.send_command(f"KV/1.0 TTL {key}")
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return float(response.split()[2])
+    
+    def incr(self, key, amount=1):
+        """Atomically add amount to the integer at key (0 if missing); returns the new value"""
+        if amount == 1:
+            return int(self.request(f"KV/1.0 INCR {key}"))
+        return int(self.request(f"KV/1.0 INCRBY {key} {amount}"))
+    
+    def decr(self, key, amount=1):
+        """Atomically subtract amount from the integer at key; returns the new value"""
+        if amount == 1:
+            return int(self.request(f"KV/1.0 DECR {key}"))
+        return self.incr(key, -amount)
+    
+    def append(self, key, value):
+        """Atomically append value to key (created if missing); returns the new length"""
+        if self.binary:
+            status, body = self.send_frame('APPEND', [key, value])
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            return int(body)
+        return int(self.request(f"KV/1.0 APPEND {key} {value}"))
+    
+    def gets(self, key):
+        """Return (value, version) for key, or None if it does not exist"""
+        if self.binary:
+            status, body = self.send_frame('GETS', [key])
+            if status == 404:
+                return None
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            version, _, value = body.partition(b' ')
+            return (from_wire(value) if self.compressed else value), int(version)
+        response = self.send_command(f"KV/1.0 GETS {key}")
+        if response.startswith('404'):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        parts = response.split(' ', 3)
+        return (parts[3] if len(parts) > 3 else ''), int(parts[2])
+    
+    def cas(self, key, version, value, ttl=None):
+        """Store value only if key still has version (from gets; 0: key must not exist)
+
+        Returns the key's new version, or None if another write got there first (or
+        the key no longer exists).
+        """
+        if self.binary:
+            args = [key, str(version), value] + ([str(ttl)] if ttl is not None else [])
+            status, body = self.send_frame('CAS', args)
+            if status in (404, 409):
+                return None
+            if status != 200:
+                raise KVSSError(f"{status} {protocol.STATUS_TEXT.get(status, '')}")
+            return int(body)
+        command = (f"KV/1.0 CAS {key} {version} {value}" if ttl is None
+                   else f"KV/1.0 CASEX {key} {version} {ttl} {value}")
+        response = self.send_command(command)
+        if response.startswith(('404', '409')):
+            return None
+        if not response.startswith('2'):
+            raise KVSSError(response)
+        return int(response.split()[2])
+    
+    def scan(self, cursor='0', prefix=None, start=None, end=None, count=None):
+        """Fetch one page of keys in key order; returns (next cursor, keys)
+
+        Start with cursor '0' and pass each returned cursor back; the scan is complete
+        when it is '0'. prefix and/or [start, end) limit the keys returned.
+        """
+        command = f"KV/1.0 SCAN {cursor}"
+        for name, value in (('PREFIX', prefix), ('START', start), ('END', end), ('COUNT', count)):
+            if value is not None:
+                command += f" {name} {value}"
+        cursor, _, keys = self.request(command).partition(' ')
+        return cursor, json.loads(keys)
+    
+    def scan_iter(self, prefix=None, start=None, end=None, count=None):
+        """Yield every matching key in order, fetching one SCAN page at a time"""
+        cursor = '0'
+        while True:
+            cursor, keys = self.scan(cursor, prefix, start, end, count)
+            yield from keys
+            if cursor == '0':
+                return
+    
+    def stats(self):
+        """Return the server statistics as a dict of numbers"""
+        return parse_counts(self.request("KV/1.0 STATS"))
+    
     def interactive_mode(self):
         """Run in interactive mode with command prompt"""
         print("KVSS Client - Interactive Mode")
@@ -115,10 +612,9 @@ class KVSSClient:
                 break
     
     def batch_mode(self, commands):
-        """Execute a list of commands in batch mode"""
+        """Execute a list of commands in batch mode (pipelined over one write)"""
         results = []
-        for command in commands:
-            response = self.send_command(command)
+        for command, response in zip(commands, self.pipeline(commands)):
             results.append(f"{command} -> {response}")
             print(f"{command} -> {response}")
         return results
@@ -128,10 +624,29 @@ class KVSSClient:
         help_text = """
 KVSS Client Commands (must include KV/1.0 prefix):
   KV/1.0 PUT <key> <value>  - Store a key-value pair
+  KV/1.0 PUTEX <key> <seconds> <value> - Store a pair that expires
   KV/1.0 GET <key>          - Retrieve value for a key
   KV/1.0 DEL <key>          - Delete a key-value pair
+  KV/1.0 MGET <key> [<key> ...]                 - Retrieve many keys (JSON array)
+  KV/1.0 MPUT <key> <value> [<key> <value> ...] - Store many pairs atomically
+  KV/1.0 MDEL <key> [<key> ...]                 - Delete many keys atomically
+  KV/1.0 EXPIRE <key> <seconds> - Set a key to expire
+  KV/1.0 TTL <key>              - Seconds left before a key expires (-1: never)
+  KV/1.0 INCR <key> / DECR <key> - Add or subtract 1 atomically (missing keys count as 0)
+  KV/1.0 INCRBY <key> <delta>   - Add delta (may be negative) atomically
+  KV/1.0 APPEND <key> <value>   - Append to a value atomically (returns the new length)
+  KV/1.0 GETS <key>             - Retrieve the version and value of a key
+  KV/1.0 CAS <key> <version> <value>
+                                - Store only if the version is unchanged (0: key must
+                                  not exist); 409 CONFLICT otherwise
+  KV/1.0 CASEX <key> <version> <seconds> <value> - CAS that also sets a TTL
+  KV/1.0 SCAN <cursor> [PREFIX <p>] [START <key>] [END <key>] [COUNT <n>]
+                                - List keys in order, one page per call (cursor 0
+                                  starts; a returned cursor of 0 means done)
   KV/1.0 STATS              - Show server statistics
   KV/1.0 QUIT               - Disconnect from server (server remains running)
+  KV/2.0 HELLO              - Switch to the binary protocol (commands are typed
+                              the same way and sent as KV/2.0 frames)
   
 Client Commands:
   help               - Show this help
@@ -151,6 +666,23 @@ Logging: All client activities are logged to file: {self.log_file}
         print(help_text)
 
 
+def transfer_mode(host, port, mode, args):
+    """Run --dump FILE [PREFIX] or --load FILE, printing progress to stderr"""
+    from transfer import dump_file, load_file  # Loaded only for this mode
+    report = lambda message: print(message, file=sys.stderr)
+    try:
+        if mode == '--dump':
+            count = dump_file(host, port, args[0], args[1] if len(args) > 1 else None, report)
+            print(f"Dumped {count} keys to {args[0]}")
+        else:
+            summary = load_file(host, port, args[0], report)
+            print(f"Loaded {summary['keys']} keys from {args[0]} in {summary['seconds']}s "
+                  f"({summary['keys_per_sec']} keys/s)")
+    except (OSError, ValueError) as e:
+        print(f"{mode[2:].upper()} failed: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
 def main():
     # Default values
     host = '127.0.0.1'
@@ -160,13 +692,18 @@ def main():
     if len(sys.argv) >= 2:
         if sys.argv[1] in ['-h', '--help']:
             print("Usage: python client.py [host] [port] [command...]")
+            print("       python client.py host port --dump FILE [PREFIX]")
+            print("       python client.py host port --load FILE")
             print("  host: server hostname (default: 127.0.0.1)")
             print("  port: server port (default: 5050)")
             print("  command: optional command to execute (otherwise interactive mode)")
+            print("  --dump: write every key (or those starting with PREFIX) to FILE")
+            print("  --load: store the keys of a FILE written by --dump")
             print("\nExamples:")
             print("  python client.py")
             print("  python client.py 192.168.1.100 5050")
             print("  python client.py 127.0.0.1 5050 GET mykey")
+            print("  python client.py 127.0.0.1 5050 --dump users.kvd user:")
             return
         host = sys.argv[1]
     
@@ -177,6 +714,10 @@ def main():
             print("Invalid port number")
             sys.exit(1)
     
+    if len(sys.argv) >= 5 and sys.argv[3] in ('--dump', '--load'):
+        transfer_mode(host, port, sys.argv[3], sys.argv[4:])
+        return
+    
     # Create client
     client = KVSSClient(host, port)
     
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Client-side sharding across several KVSS servers
+Keys are placed on a consistent-hash ring with virtual nodes, so adding or removing
+a server only moves the keys on the arcs it gains or loses (about 1/N of them).
+"""
+
+import bisect
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pool import KVSSClientPool
+
+
+log = logging.getLogger(__name__)
+
+def ring_hash(value):
+    """64-bit position on the ring (stable across processes, unlike hash())"""
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+def parse_endpoint(endpoint):
+    """Accept 'host:port' or (host, port); returns the canonical 'host:port' name"""
+    if isinstance(endpoint, str):
+        host, _, port = endpoint.rpartition(':')
+        return f"{host or '127.0.0.1'}:{int(port)}"
+    host, port = endpoint
+    return f"{host}:{int(port)}"
+
+
+class HashRing:
+    """Consistent-hash ring mapping keys to node names
+
+    Each node owns `vnodes` points on the ring; a key belongs to the first point at
+    or after its hash. Updates build new arrays and swap them in, so lookups from
+    other threads never need a lock.
+    """
+
+    def __init__(self, nodes=(), vnodes=160):
+        self.vnodes = vnodes
+        self.lock = threading.Lock()  # Serializes updates
+        # (sorted ring positions, node owning each position), replaced as a whole
+        self.ring = ([], [])
+        for node in nodes:
+            self.add_node(node)
+
+    @property
+    def nodes(self):
+        return sorted(set(self.ring[1]))
+
+    def __len__(self):
+        return len(set(self.ring[1]))
+
+    def _rebuild(self, nodes):
+        ring = sorted((ring_hash(f"{node}#{index}"), node)
+                      for node in nodes for index in range(self.vnodes))
+        self.ring = ([point for point, _ in ring], [node for _, node in ring])
+
+    def add_node(self, node):
+        with self.lock:
+            nodes = set(self.ring[1])
+            if node not in nodes:
+                self._rebuild(nodes | {node})
+
+    def remove_node(self, node):
+        with self.lock:
+            self._rebuild(set(self.ring[1]) - {node})
+
+    def node_for(self, key):
+        """Return the node owning key"""
+        points, owners = self.ring
+        if not points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect_left(points, ring_hash(key))
+        return owners[index % len(points)]
+
+
+class KVSSClusterClient:
+    def __init__(self, endpoints, vnodes=160, max_workers=16, **pool_options):
+        """
+        endpoints: 'host:port' strings or (host, port) pairs of the KVSS servers
+        vnodes: ring points per server; more points spread keys more evenly
+        max_workers: threads used to fan multi-key operations out to servers
+        pool_options: passed to each server's KVSSClientPool (e.g. max_connections)
+        """
+        self.pool_options = pool_options
+        self.pools = {}
+        self.ring = HashRing(vnodes=vnodes)
+        # Routing lookups and node changes are serialized, so a call routed to a server
+        # counts as in use before remove_node can see its pool idle
+        self.condition = threading.Condition()
+        self.in_use = {}       # pool -> calls routed to it and not yet finished
+        self.retiring = set()  # Removed pools closed once their last call finishes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="kvss-cluster")
+        for endpoint in endpoints:
+            self.add_node(endpoint)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_node(self, endpoint):
+        """Start routing a share of the keyspace to another server
+
+        Only keys on the ring arcs the new server takes over change owner (about
+        1/N of them); existing data is not migrated, so those keys read as missing
+        until rewritten.
+        """
+        name = parse_endpoint(endpoint)
+        pool = None
+        if name not in self.pools:
+            # Opened outside the lock, since it connects
+            host, _, port = name.rpartition(':')
+            pool = KVSSClientPool(host, int(port), **self.pool_options)
+        with self.condition:
+            if pool is not None and name not in self.pools:
+                self.pools[name] = pool
+                pool = None
+            self.ring.add_node(name)
+        if pool is not None:
+            pool.close()  # Another thread added the same server meanwhile
+        return name
+
+    def remove_node(self, endpoint, timeout=30.0):
+        """Stop routing keys to a server; its keys move to the next servers on the ring
+
+        Calls already routed to the server, including ones that have not yet taken a
+        connection, finish on it before its connections are closed. If some are still
+        running after timeout seconds, a warning is logged and the pool is closed when
+        the last of them finishes instead; remove_node then returns False.
+        """
+        name = parse_endpoint(endpoint)
+        with self.condition:
+            self.ring.remove_node(name)
+            pool = self.pools.pop(name, None)
+            if pool is None:
+                return True
+            if not self.condition.wait_for(lambda: not self.in_use.get(pool), timeout):
+                self.retiring.add(pool)
+                log.warning("%d calls to %s still running after %ss; its connections "
+                            "close when they finish", self.in_use[pool], name, timeout)
+                return False
+        pool.close()
+        return True
+
+    @property
+    def nodes(self):
+        return self.ring.nodes
+
+    def node_for(self, key):
+        """Return the 'host:port' of the server owning key"""
+        return self.ring.node_for(key)
+
+    def pool_for(self, key):
+        """The pool of the server owning key (not counted as in use; see _call)"""
+        with self.condition:
+            return self.pools[self.ring.node_for(key)]
+
+    def _borrow(self, node):
+        """The pool of node, counted as in use until _return; caller holds condition"""
+        pool = self.pools[node]
+        self.in_use[pool] = self.in_use.get(pool, 0) + 1
+        return pool
+
+    def _return(self, pool):
+        with self.condition:
+            self.in_use[pool] -= 1
+            if self.in_use[pool]:
+                return
+            del self.in_use[pool]
+            self.condition.notify_all()
+            if pool not in self.retiring:
+                return
+            self.retiring.discard(pool)
+        pool.close()
+
+    def _call(self, key, method, *args):
+        """Run KVSSClientPool.<method>(*args) on the pool of the server owning key"""
+        with self.condition:
+            pool = self._borrow(self.ring.node_for(key))
+        try:
+            return getattr(pool, method)(*args)
+        finally:
+            self._return(pool)
+
+    def _group(self, keys):
+        """Split keys by owning server, keeping each group in request order"""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.ring.node_for(key), []).append(key)
+        return groups
+
+    def _fan_out(self, keys, call):
+        """Run call(pool, group) for each server's group of keys, in parallel; returns results"""
+        with self.condition:
+            groups = [(self._borrow(node), group) for node, group in self._group(keys).items()]
+        try:
+            if len(groups) == 1:
+                (pool, group), = groups
+                return [call(pool, group)]
+            futures = [self.executor.submit(call, pool, group) for pool, group in groups]
+            return [future.result() for future in futures]
+        finally:
+            for pool, _ in groups:
+                self._return(pool)
+
+    def get(self, key):
+        """Return the value of key, or None if it does not exist"""
+        return self._call(key, 'get', key)
+
+    def put(self, key, value, ttl=None):
+        """Store value under key; returns True if the key was created"""
+        return self._call(key, 'put', key, value, ttl)
+
+    def delete(self, key):
+        """Delete key; returns True if it existed"""
+        return self._call(key, 'delete', key)
+
+    def expire(self, key, seconds):
+        """Set a TTL on key; returns False if the key does not exist"""
+        return self._call(key, 'expire', key, seconds)
+
+    def ttl(self, key):
+        """Return the seconds key has left, -1 if it has no TTL, or None if missing"""
+        return self._call(key, 'ttl', key)
+
+    def incr(self, key, amount=1):
+        """Atomically add amount to the integer at key; returns the new value"""
+        return self._call(key, 'incr', key, amount)
+
+    def decr(self, key, amount=1):
+        """Atomically subtract amount from the integer at key; returns the new value"""
+        return self._call(key, 'decr', key, amount)
+
+    def append(self, key, value):
+        """Atomically append value to key; returns the new length"""
+        return self._call(key, 'append', key, value)
+
+    def gets(self, key):
+        """Return (value, version) for key, or None if it does not exist"""
+        return self._call(key, 'gets', key)
+
+    def cas(self, key, version, value, ttl=None):
+        """Store value only if key still has version; returns the new version or None"""
+        return self._call(key, 'cas', key, version, value, ttl)
+
+    def mget(self, keys):
+        """Fetch many keys, one parallel MGET per server; returns {key: value or None}"""
+        keys = list(keys)
+        found = {}
+        for values in self._fan_out(keys, lambda pool, group: pool.mget(group)):
+            found.update(values)
+        return {key: found.get(key) for key in keys}
+
+    def mput(self, items):
+        """Store many pairs, one parallel MPUT per server; returns summed counts
+
+        Each server applies its share atomically; the batch as a whole is not atomic.
+        """
+        items = dict(items)
+        counts = {'created': 0, 'updated': 0}
+        results = self._fan_out(items,
+                                lambda pool, group: pool.mput({key: items[key] for key in group}))
+        for result in results:
+            for name in counts:
+                counts[name] += result.get(name, 0)
+        return counts
+
+    def mdel(self, keys):
+        """Delete many keys, one parallel MDEL per server; returns the number deleted"""
+        return sum(self._fan_out(list(keys), lambda pool, group: pool.mdel(group)))
+
+    def stats(self):
+        """Return {'host:port': statistics} for every server, queried in parallel"""
+        with self.condition:
+            nodes = self.nodes
+            pools = [self._borrow(node) for node in nodes]
+        try:
+            futures = [self.executor.submit(pool.stats) for pool in pools]
+            return {node: future.result() for node, future in zip(nodes, futures)}
+        finally:
+            for pool in pools:
+                self._return(pool)
+
+    def close(self):
+        """Close every server's connections and the fan-out threads"""
+        self.executor.shutdown(wait=True)
+        with self.condition:
+            pools = list(self.pools.values()) + list(self.retiring)
+            self.pools.clear()
+            self.retiring.clear()
+        for pool in pools:
+            pool.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Value compression for the KVSS store
+With --compression, values of at least --compress-min-size bytes are kept compressed
+with zlib or lzma. Each stored value records its codec, so KV/2.0 clients that
+negotiated it ("KV/2.0 HELLO COMPRESS") receive values exactly as stored, prefixed by
+the codec id, and decompress them themselves.
+"""
+
+import lzma
+import sys
+import zlib
+
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODECS = {'zlib': CODEC_ZLIB, 'lzma': CODEC_LZMA}
+
+# Fast settings: most of the size reduction for a fraction of the default levels' CPU
+ZLIB_LEVEL = 1
+LZMA_PRESET = 1
+
+# Default smallest value compressed; smaller ones rarely shrink enough to be worth it
+DEFAULT_COMPRESS_MIN_SIZE = 1024
+
+
+def compress(codec, data):
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    if codec == CODEC_LZMA:
+        return lzma.compress(data, preset=LZMA_PRESET)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def decompress(codec, data):
+    if codec == CODEC_NONE:
+        return bytes(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(data)
+    raise ValueError(f"unknown codec {codec}")
+
+
+def decompressor(codec):
+    """Incremental decompressor for codec: an object with decompress(chunk)"""
+    if codec == CODEC_ZLIB:
+        return zlib.decompressobj()
+    if codec == CODEC_LZMA:
+        return lzma.LZMADecompressor()
+    raise ValueError(f"unknown codec {codec}")
+
+
+class Compressed:
+    """A value the store holds compressed
+
+    size is the length of the original bytes; text values (str) were encoded as
+    UTF-8 and are decoded again by unpack().
+    """
+    __slots__ = ('codec', 'data', 'size', 'text', 'footprint')
+
+    def __init__(self, codec, data, size, text):
+        self.codec = codec
+        self.data = data
+        self.size = size
+        self.text = text
+        # Memory held, for the store's accounting (see store.entry_size)
+        self.footprint = sys.getsizeof(self) + sys.getsizeof(data)
+
+    def unpack(self):
+        """Return the original value (str or bytes)"""
+        data = decompress(self.codec, self.data)
+        return data.decode('utf-8') if self.text else data
+
+
+def to_wire(value):
+    """A stored value as sent to a client that negotiated compression: codec id + bytes"""
+    if value.__class__ is Compressed:
+        return bytes((value.codec,)) + value.data
+    return b'\x00' + (value.encode('utf-8') if isinstance(value, str) else value)
+
+
+def from_wire(data):
+    """Decode a value received with to_wire() into its original bytes"""
+    return decompress(data[0], memoryview(data)[1:])
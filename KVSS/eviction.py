@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Eviction policies for the memory-bounded KVSS store
+Each shard owns one policy instance, updated under the shard lock in O(1) per access.
+"""
+
+import random
+import time
+from collections import OrderedDict
+
+
+class LRUPolicy:
+    """Evict the least recently used key"""
+
+    def __init__(self):
+        self.order = OrderedDict()  # Oldest access first
+
+    def add(self, key):
+        self.order[key] = None
+        self.order.move_to_end(key)
+
+    def touch(self, key):
+        self.order.move_to_end(key)
+
+    def remove(self, key):
+        self.order.pop(key, None)
+
+    def victim(self, protect=None):
+        for key in self.order:
+            if key != protect:
+                return key
+        return None
+
+
+class KeySampler:
+    """Set of keys supporting O(1) add, remove and uniform random choice"""
+
+    def __init__(self):
+        self.keys = []
+        self.positions = {}
+
+    def add(self, key):
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+
+    def remove(self, key):
+        index = self.positions.pop(key, None)
+        if index is None:
+            return
+        last = self.keys.pop()
+        if index < len(self.keys):
+            self.keys[index] = last
+            self.positions[last] = index
+
+    def sample(self, count, protect=None):
+        """Return up to count random keys (with replacement), excluding protect"""
+        keys = self.keys
+        if not keys or (len(keys) == 1 and keys[0] == protect):
+            return []
+        picks = []
+        while len(picks) < count:
+            key = keys[random.randrange(len(keys))]
+            if key != protect:
+                picks.append(key)
+        return picks
+
+
+class RandomPolicy:
+    """Evict a uniformly random key"""
+
+    def __init__(self):
+        self.sampler = KeySampler()
+
+    def add(self, key):
+        self.sampler.add(key)
+
+    def touch(self, key):
+        pass
+
+    def remove(self, key):
+        self.sampler.remove(key)
+
+    def victim(self, protect=None):
+        picks = self.sampler.sample(1, protect)
+        return picks[0] if picks else None
+
+
+class LFUPolicy:
+    """Approximate LFU: logarithmic access counters with time decay and sampled eviction
+
+    Counters grow with probability 1 / ((counter - INITIAL) * LOG_FACTOR + 1), so an
+    8-bit counter covers millions of hits, and lose one point per DECAY_PERIOD of
+    inactivity. Eviction picks the lowest counter among SAMPLES random keys.
+    """
+
+    INITIAL = 5
+    LOG_FACTOR = 10
+    DECAY_PERIOD = 60.0
+    MAX_COUNTER = 255
+    SAMPLES = 5
+
+    def __init__(self):
+        self.sampler = KeySampler()
+        self.counters = {}  # key -> [counter, last decay time]
+
+    def _decayed(self, entry, now):
+        periods = int((now - entry[1]) / self.DECAY_PERIOD)
+        if periods:
+            entry[0] = max(entry[0] - periods, 0)
+            entry[1] = now
+        return entry[0]
+
+    def add(self, key):
+        if key in self.counters:
+            self.touch(key)
+            return
+        self.sampler.add(key)
+        self.counters[key] = [self.INITIAL, time.time()]
+
+    def touch(self, key):
+        entry = self.counters[key]
+        counter = self._decayed(entry, time.time())
+        if counter < self.MAX_COUNTER:
+            base = counter - self.INITIAL
+            if base <= 0 or random.random() < 1.0 / (base * self.LOG_FACTOR + 1):
+                entry[0] = counter + 1
+
+    def remove(self, key):
+        if self.counters.pop(key, None) is not None:
+            self.sampler.remove(key)
+
+    def victim(self, protect=None):
+        now = time.time()
+        picks = self.sampler.sample(self.SAMPLES, protect)
+        if not picks:
+            return None
+        return min(picks, key=lambda key: self._decayed(self.counters[key], now))
+
+
+EVICTION_POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'random': RandomPolicy,
+}
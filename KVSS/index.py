@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Ordered key index for KVSS range and prefix scans
+Each store shard keeps its keys in a SortedKeys, updated under the shard lock as keys
+are created and removed; SCAN merges the shards' pages and resumes from a cursor.
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+class SortedKeys:
+    """Sorted set of keys stored as a list of sorted sublists
+
+    Finding a key is a binary search over the sublists' last keys and then within one
+    sublist, so add and remove cost O(log n) comparisons plus moving at most
+    2 * LOAD references; a flat sorted list would move O(n) on every insert.
+    """
+
+    # Target sublist length; sublists are split at twice this size
+    LOAD = 1000
+
+    def __init__(self, keys=()):
+        self.lists = []  # Sorted, non-empty sublists
+        self.maxes = []  # Last key of each sublist
+        self.size = 0
+        if keys:
+            self.update(keys)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for sublist in self.lists:
+            yield from sublist
+
+    def __contains__(self, key):
+        index = bisect_left(self.maxes, key)
+        if index == len(self.maxes):
+            return False
+        sublist = self.lists[index]
+        return sublist[bisect_left(sublist, key)] == key
+
+    def update(self, keys):
+        """Add many keys at once, rebuilding the sublists"""
+        ordered = sorted(set(self).union(keys))
+        load = self.LOAD
+        self.lists = [ordered[i:i + load] for i in range(0, len(ordered), load)]
+        self.maxes = [sublist[-1] for sublist in self.lists]
+        self.size = len(ordered)
+
+    def add(self, key):
+        maxes = self.maxes
+        if not maxes:
+            self.lists.append([key])
+            maxes.append(key)
+            self.size = 1
+            return
+        index = bisect_left(maxes, key)
+        if index == len(maxes):
+            # Past the last key: append to the last sublist
+            index -= 1
+            self.lists[index].append(key)
+            maxes[index] = key
+        else:
+            sublist = self.lists[index]
+            position = bisect_left(sublist, key)
+            if sublist[position] == key:
+                return
+            sublist.insert(position, key)
+        self.size += 1
+        sublist = self.lists[index]
+        if len(sublist) > 2 * self.LOAD:
+            self.lists.insert(index + 1, sublist[self.LOAD:])
+            del sublist[self.LOAD:]
+            maxes[index] = sublist[-1]
+            maxes.insert(index + 1, self.lists[index + 1][-1])
+
+    def remove(self, key):
+        """Remove key if present"""
+        maxes = self.maxes
+        index = bisect_left(maxes, key)
+        if index == len(maxes):
+            return
+        sublist = self.lists[index]
+        position = bisect_left(sublist, key)
+        if sublist[position] != key:
+            return
+        del sublist[position]
+        self.size -= 1
+        if not sublist:
+            del self.lists[index]
+            del maxes[index]
+        elif position == len(sublist):
+            maxes[index] = sublist[-1]
+
+    def clear(self):
+        self.lists = []
+        self.maxes = []
+        self.size = 0
+
+    def irange(self, low=None, inclusive=True):
+        """Iterate over keys from low (>= low, or > low if not inclusive) in order"""
+        if low is None:
+            yield from self
+            return
+        search = bisect_left if inclusive else bisect_right
+        maxes = self.maxes
+        index = search(maxes, low)
+        if index == len(maxes):
+            return
+        sublist = self.lists[index]
+        yield from sublist[search(sublist, low):]
+        for sublist in self.lists[index + 1:]:
+            yield from sublist
+
+
+def prefix_end(prefix):
+    """Smallest string greater than every string starting with prefix (None: no bound)"""
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10FFFF:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def encode_cursor(key):
+    """SCAN cursor resuming after key ('0' when the scan is complete)"""
+    return 'k' + key.encode('utf-8', 'surrogatepass').hex() if key is not None else '0'
+
+
+def decode_cursor(cursor):
+    """Key a SCAN cursor resumes after (None for '0'); raises ValueError if malformed"""
+    if cursor == '0':
+        return None
+    if not cursor.startswith('k'):
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return bytes.fromhex(cursor[1:]).decode('utf-8', 'surrogatepass')
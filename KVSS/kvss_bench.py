@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+kvss-bench: load generator for a running KVSS server
+Drives a configurable GET/PUT workload over KVSSClient connections and reports
+throughput and latency percentiles, optionally as JSON to compare against a
+baseline run so performance regressions fail the run.
+"""
+
+import argparse
+import functools
+import itertools
+import json
+import os
+import random
+import shlex
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from client import KVSSClient
+from metrics import LatencyHistogram
+import protocol
+
+
+DISTRIBUTIONS = ('uniform', 'zipfian')
+
+# Exit status when the --compare baseline cannot be read (1 means a regression, 2 a
+# usage error)
+EXIT_BAD_BASELINE = 3
+
+
+@functools.lru_cache(maxsize=4)
+def zipf_cum_weights(keys, skew):
+    """Cumulative weights 1 / (rank + 1)^skew, built once and shared by every connection"""
+    return list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(keys)))
+
+
+class KeyChooser:
+    """Draws key indexes in [0, keys) uniformly or with a Zipfian skew
+
+    The Zipfian draw picks index i with probability proportional to 1 / (i + 1)^s,
+    through a precomputed cumulative table (random.choices bisects it).
+    """
+
+    def __init__(self, keys, distribution='uniform', skew=0.99, seed=None):
+        self.keys = keys
+        self.random = random.Random(seed)
+        self.population = range(keys)
+        self.cum_weights = None
+        if distribution == 'zipfian':
+            self.cum_weights = zipf_cum_weights(keys, skew)
+
+    def sample(self, count):
+        if self.cum_weights is None:
+            return [int(self.random.random() * self.keys) for _ in range(count)]
+        return self.random.choices(self.population, cum_weights=self.cum_weights, k=count)
+
+
+class Workload:
+    """Settings shared by every connection of a run (picklable for worker processes)"""
+
+    def __init__(self, args):
+        self.host = args.host
+        self.port = args.port
+        self.binary = args.binary
+        self.read_ratio = args.read_ratio
+        self.keys = args.keys
+        self.distribution = args.distribution
+        self.skew = args.zipf_skew
+        self.value_size = args.value_size
+        self.pipeline = args.pipeline
+        self.duration = args.duration
+        self.requests = args.requests
+        self.key_prefix = args.key_prefix
+
+
+class ConnectionLoad(threading.Thread):
+    """One connection issuing batches of `pipeline` requests until the run ends
+
+    A request's latency runs from its batch being sent to its own response being
+    read, so it includes the time spent queued behind earlier requests of the batch.
+    """
+
+    def __init__(self, workload, index, start_at, stop_at):
+        super().__init__(name=f"kvss-bench-{index}", daemon=True)
+        self.workload = workload
+        self.index = index
+        self.start_at = start_at
+        self.stop_at = stop_at
+        self.histograms = {'GET': LatencyHistogram(), 'PUT': LatencyHistogram()}
+        self.errors = 0
+        self.misses = 0
+        self.operations = 0
+        self.elapsed = 0.0
+        self.failure = None
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            self.failure = f"connection {self.index}: {e}"
+
+    def _run(self):
+        workload = self.workload
+        client = KVSSClient(workload.host, workload.port, binary=workload.binary, verbose=False)
+        if not client.connect():
+            raise ConnectionError(client.last_error)
+        if workload.binary and not client.binary:
+            raise ConnectionError("server does not support KV/2.0")
+        chooser = KeyChooser(workload.keys, workload.distribution, workload.skew,
+                             seed=os.getpid() * 1000 + self.index)
+        rng = random.Random(self.index)
+        value = 'x' * workload.value_size
+        prefix = workload.key_prefix
+        limit = workload.requests
+        depth = workload.pipeline
+        read_ratio = workload.read_ratio
+        binary = workload.binary
+        clock = time.perf_counter
+
+        while clock() < self.start_at:
+            time.sleep(0.001)
+        start = clock()
+        try:
+            while clock() < self.stop_at and (limit is None or self.operations < limit):
+                count = depth if limit is None else min(depth, limit - self.operations)
+                commands = ['GET' if rng.random() < read_ratio else 'PUT' for _ in range(count)]
+                keys = [f"{prefix}{index}" for index in chooser.sample(count)]
+                if binary:
+                    payload = b''.join(
+                        protocol.encode_request(command, [key] if command == 'GET' else [key, value])
+                        for command, key in zip(commands, keys))
+                else:
+                    payload = ''.join(
+                        f"KV/1.0 GET {key}\n" if command == 'GET' else f"KV/1.0 PUT {key} {value}\n"
+                        for command, key in zip(commands, keys)).encode('utf-8')
+                sent_at = clock()
+                client.socket.sendall(payload)
+                for command in commands:
+                    if binary:
+                        status = client.read_frame()[0]
+                    else:
+                        status = int(client.read_responses(1)[0][:3])
+                    self.histograms[command].record(clock() - sent_at)
+                    if status == 404:
+                        self.misses += 1
+                    elif status >= 300:
+                        self.errors += 1
+                self.operations += count
+        finally:
+            self.elapsed = clock() - start
+            client.disconnect()
+
+
+def preload(workload, connections):
+    """Write every key once so GETs find values; returns the elapsed seconds"""
+    start = time.perf_counter()
+    value = 'x' * workload.value_size
+    keys = [f"{workload.key_prefix}{index}" for index in range(workload.keys)]
+    batch = 500
+    clients = []
+    try:
+        for _ in range(max(1, min(connections, 8))):
+            client = KVSSClient(workload.host, workload.port, binary=workload.binary, verbose=False)
+            if not client.connect():
+                raise ConnectionError(client.last_error)
+            clients.append(client)
+
+        def load(shard):
+            client = clients[shard]
+            for batch_start in range(shard * batch, len(keys), batch * len(clients)):
+                client.mput({key: value for key in keys[batch_start:batch_start + batch]})
+
+        threads = [threading.Thread(target=load, args=(shard,)) for shard in range(len(clients))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for client in clients:
+            client.disconnect()
+    return time.perf_counter() - start
+
+
+def run_connections(workload, first, count, start_at):
+    """Run count connections in this process, all starting at start_at (perf_counter
+    time, or None for shortly from now); returns their merged results"""
+    if start_at is None:
+        start_at = time.perf_counter() + 0.1
+    stop_at = start_at + workload.duration if workload.requests is None else float('inf')
+    loads = [ConnectionLoad(workload, first + index, start_at, stop_at) for index in range(count)]
+    for load in loads:
+        load.start()
+    for load in loads:
+        load.join()
+    histograms = {'GET': LatencyHistogram(), 'PUT': LatencyHistogram()}
+    for load in loads:
+        for command, histogram in load.histograms.items():
+            histograms[command].merge(histogram)
+    return {
+        'histograms': {command: histogram.to_dict() for command, histogram in histograms.items()},
+        'operations': sum(load.operations for load in loads),
+        'errors': sum(load.errors for load in loads),
+        'misses': sum(load.misses for load in loads),
+        'elapsed': max((load.elapsed for load in loads), default=0.0),
+        'failures': [load.failure for load in loads if load.failure],
+    }
+
+
+def run(workload, connections, processes=1):
+    """Run the workload over connections split across processes; returns the results dict"""
+    start_at = time.perf_counter() + 0.2
+    shares = [connections // processes + (index < connections % processes) for index in range(processes)]
+    firsts = [sum(shares[:index]) for index in range(processes)]
+    if processes == 1:
+        parts = [run_connections(workload, 0, connections, start_at)]
+    else:
+        # perf_counter is not comparable across processes: each starts its own clock
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [executor.submit(run_connections, workload, first, share, None)
+                       for first, share in zip(firsts, shares) if share]
+            parts = [future.result() for future in futures]
+
+    histograms = {'GET': LatencyHistogram(), 'PUT': LatencyHistogram()}
+    total = LatencyHistogram()
+    for part in parts:
+        for command, data in part['histograms'].items():
+            histogram = LatencyHistogram.from_dict(data)
+            histograms[command].merge(histogram)
+            total.merge(histogram)
+    operations = sum(part['operations'] for part in parts)
+    elapsed = max(part['elapsed'] for part in parts)
+    return {
+        'operations': operations,
+        'errors': sum(part['errors'] for part in parts),
+        'misses': sum(part['misses'] for part in parts),
+        'failures': [failure for part in parts for failure in part['failures']],
+        'elapsed': round(elapsed, 3),
+        'throughput': round(operations / elapsed, 1) if elapsed else 0.0,
+        'latency_ms': dict({'ALL': total.summary()},
+                           **{command: histogram.summary()
+                              for command, histogram in histograms.items() if histogram.total}),
+        'histograms_us': {command: histogram.to_dict() for command, histogram in histograms.items()},
+    }
+
+
+def load_baseline(path):
+    """Read the results of an earlier run for compare(); raises OSError or ValueError"""
+    with open(path) as f:
+        baseline = json.load(f)
+    if not (isinstance(baseline, dict) and isinstance(baseline.get('throughput'), (int, float))
+            and isinstance(baseline.get('latency_ms'), dict)):
+        raise ValueError("not kvss-bench JSON results")
+    return baseline
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against a baseline run, as messages
+
+    Throughput may drop and p99 latency may rise by at most tolerance (a fraction).
+    """
+    regressions = []
+    old, new = baseline['throughput'], results['throughput']
+    if old and new < old * (1 - tolerance):
+        regressions.append(f"throughput {new:.0f} ops/s is {1 - new / old:.1%} below baseline {old:.0f}")
+    for command, summary in results['latency_ms'].items():
+        reference = baseline['latency_ms'].get(command)
+        if reference and reference['p99'] and summary['p99'] > reference['p99'] * (1 + tolerance):
+            regressions.append(f"{command} p99 {summary['p99']:.3f}ms is "
+                               f"{summary['p99'] / reference['p99'] - 1:.1%} above baseline "
+                               f"{reference['p99']:.3f}ms")
+    return regressions
+
+
+def print_report(results, workload, connections, file=sys.stdout):
+    print(f"{results['operations']} requests in {results['elapsed']:.2f}s over {connections} "
+          f"connections (pipeline {workload.pipeline}, {'KV/2.0' if workload.binary else 'KV/1.0'}, "
+          f"{workload.read_ratio:.0%} reads, {workload.distribution} keys)", file=file)
+    print(f"throughput: {results['throughput']:.0f} ops/s, errors: {results['errors']}, "
+          f"GET misses: {results['misses']}", file=file)
+    columns = ['count', 'p50', 'p90', 'p99', 'p999', 'mean', 'max']
+    print(f"{'op':<5}" + ''.join(f"{column + ('' if column == 'count' else '_ms'):>11}"
+                                 for column in columns), file=file)
+    for command, summary in results['latency_ms'].items():
+        print(f"{command:<5}{summary['count']:>11}" +
+              ''.join(f"{summary[column]:>11.3f}" for column in columns[1:]), file=file)
+    for failure in results['failures']:
+        print(f"failed: {failure}", file=file)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='kvss-bench', description="Load generator and latency benchmark for a KVSS server")
+    parser.add_argument('host', nargs='?', default='127.0.0.1', help="server address (default: 127.0.0.1)")
+    parser.add_argument('port', nargs='?', type=int, default=5050, help="server port (default: 5050)")
+    parser.add_argument('-c', '--connections', type=int, default=8, help="concurrent connections")
+    parser.add_argument('-P', '--pipeline', type=int, default=1, help="requests in flight per connection")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="client processes sharing the connections (one Python process "
+                             "generates load on one core)")
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('-n', '--requests', type=int, default=None,
+                        help="requests per connection instead of a fixed duration")
+    parser.add_argument('-r', '--read-ratio', type=float, default=0.9,
+                        help="fraction of requests that are GETs, the rest PUTs (default: 0.9)")
+    parser.add_argument('-k', '--keys', type=int, default=100000, help="size of the keyspace")
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform',
+                        help="how keys are picked (default: uniform)")
+    parser.add_argument('--zipf-skew', type=float, default=0.99,
+                        help="exponent of the zipfian distribution (default: 0.99)")
+    parser.add_argument('-s', '--value-size', type=int, default=100, help="PUT value size in bytes")
+    parser.add_argument('--key-prefix', default='key', help="keys are <prefix><index>")
+    parser.add_argument('--binary', action='store_true', help="use the KV/2.0 binary protocol")
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help="skip writing every key before the run")
+    parser.add_argument('--spawn', metavar='SERVER_ARGS', default=None,
+                        help="start a throw-away server.py with these arguments (e.g. \"--mode "
+                             "asyncio\") on a free port instead of using host:port")
+    parser.add_argument('--json', metavar='PATH', default=None,
+                        help="write the results as JSON to PATH ('-' for stdout)")
+    parser.add_argument('--compare', metavar='BASELINE', default=None,
+                        help="JSON results of an earlier run; exit with status 1 on a regression, "
+                             f"{EXIT_BAD_BASELINE} if it cannot be read")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed throughput drop / p99 rise against --compare (default: 0.10)")
+    args = parser.parse_args(argv)
+    if not 0 <= args.read_ratio <= 1:
+        parser.error("--read-ratio must be between 0 and 1")
+    if args.connections < 1 or args.pipeline < 1 or args.processes < 1 or args.keys < 1:
+        parser.error("--connections, --pipeline, --processes and --keys must be positive")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.compare:
+        # Checked before the run, which may take a while
+        try:
+            baseline = load_baseline(args.compare)
+        except (OSError, ValueError) as e:
+            print(f"kvss-bench: cannot read baseline {args.compare}: {e}", file=sys.stderr)
+            return EXIT_BAD_BASELINE
+    server = None
+    workdir = None
+    if args.spawn is not None:
+        from benchmark import free_port, start_server, stop_server
+        workdir = tempfile.TemporaryDirectory()
+        args.host, args.port = '127.0.0.1', free_port()
+        server = start_server(args.port, ['--trace-sample', '0'] + shlex.split(args.spawn), workdir.name)
+    try:
+        workload = Workload(args)
+        if args.preload:
+            elapsed = preload(workload, args.connections)
+            print(f"preloaded {args.keys} keys in {elapsed:.2f}s", file=sys.stderr)
+        results = run(workload, args.connections, args.processes)
+    finally:
+        if server:
+            stop_server(server)
+            workdir.cleanup()
+
+    # With JSON on stdout the human-readable report goes to stderr
+    print_report(results, workload, args.connections,
+                 file=sys.stderr if args.json == '-' else sys.stdout)
+
+    document = {
+        'tool': 'kvss-bench',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'server': f"{args.host}:{args.port}" if args.spawn is None else f"spawned: {args.spawn}",
+        'config': {name: value for name, value in vars(args).items()
+                   if name not in ('json', 'compare', 'tolerance')},
+    }
+    document.update(results)
+    if args.json == '-':
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(document, f, indent=2)
+
+    status = 1 if results['failures'] else 0
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            status = 1
+        else:
+            print(f"no regression against {args.compare} (tolerance {args.tolerance:.0%})",
+                  file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
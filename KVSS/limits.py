@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Overload protection for the KVSS server
+Client connections beyond --max-connections are answered "503 BUSY" and closed, a
+sweeper thread closes connections that stay idle or stall mid-request (or stop reading
+responses) past their timeout, and --rate-limit answers a connection's requests over
+its budget with "503 BUSY" instead of running them. Peer connections between
+--workers are exempt from all of these.
+"""
+
+import threading
+import time
+
+
+BUSY = "503 BUSY"
+
+# Pending connections queued by the kernel before accept()
+DEFAULT_BACKLOG = 1024
+# Client connections served at once per server process
+DEFAULT_MAX_CONNECTIONS = 10000
+# Seconds a client gets to finish sending a request, or to read its responses
+DEFAULT_READ_TIMEOUT = 30.0
+# Response bytes produced for one connection before its next requests wait for them
+# to be sent
+DEFAULT_MAX_OUTPUT_BUFFER = 4 * 1024 * 1024
+
+FOREVER = float('inf')
+
+
+class RateLimiter:
+    """Token bucket: rate requests per second, in bursts of up to one second's worth"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.burst = max(rate, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        """Add the tokens earned since the last refill (once per batch of requests)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """Spend the token of one request; False if none is left"""
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class ConnectionTracker:
+    """The client connections of one server process and their deadlines
+
+    Each registered ClientSession carries a time.monotonic() deadline, set by its
+    handler through waiting() and sending(): idle_timeout while no request is in
+    progress, read_timeout for the rest of a partly received request or for the client
+    to read its responses, and none while the server works. A sweeper thread closes
+    connections past their deadline; streams handed to replication, notifications or
+    bulk transfers keep their own timeouts.
+    """
+
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, idle_timeout=None,
+                 read_timeout=DEFAULT_READ_TIMEOUT, rate_limit=None, stats=None, log=None,
+                 shutdown_event=None):
+        """
+        max_connections, idle_timeout, read_timeout: None or 0 disables the limit
+        rate_limit: requests per second allowed to each connection (None: unlimited)
+        stats: the server's StatsCounters, for rejected_connections and timeouts
+        """
+        self.max_connections = max_connections or None
+        self.idle_timeout = idle_timeout or None
+        self.read_timeout = read_timeout or None
+        self.rate_limit = rate_limit or None
+        self.stats = stats
+        self.log = log or (lambda message, level='INFO': None)
+        self.shutdown_event = shutdown_event or threading.Event()
+        self.sessions = {}  # ClientSession -> callable closing its connection
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def admit(self, session, close):
+        """Register a new connection, or return False if max_connections are open
+
+        close() must unblock the connection's handler, which then calls remove().
+        """
+        with self.lock:
+            if self.max_connections and len(self.sessions) >= self.max_connections:
+                if self.stats:
+                    self.stats.incr('rejected_connections')
+                return False
+            self.sessions[session] = close
+        if self.rate_limit:
+            session.limiter = RateLimiter(self.rate_limit)
+        self.waiting(session, False)
+        return True
+
+    def remove(self, session):
+        with self.lock:
+            self.sessions.pop(session, None)
+
+    def waiting(self, session, started):
+        """The handler waits for the client's next bytes
+
+        started: the partial request left in session.buffer (if any) is a new one, so
+        its read_timeout starts now; otherwise it keeps the one it had.
+        """
+        if session.buffer:
+            if started:
+                session.request_deadline = (time.monotonic() + self.read_timeout
+                                            if self.read_timeout else FOREVER)
+            session.deadline = session.request_deadline
+        elif self.idle_timeout:
+            session.deadline = time.monotonic() + self.idle_timeout
+        else:
+            session.deadline = FOREVER
+
+    def sending(self, session):
+        """The handler is about to write responses, which the client must read in time"""
+        if self.read_timeout:
+            session.deadline = time.monotonic() + self.read_timeout
+
+    def run(self):
+        """Background thread: close connections past their deadline until shutdown"""
+        timeouts = [t for t in (self.idle_timeout, self.read_timeout) if t]
+        if not timeouts:
+            return
+        interval = min(1.0, min(timeouts) / 4)
+        while not self.shutdown_event.wait(interval):
+            self.sweep()
+
+    def sweep(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [(session, close) for session, close in self.sessions.items()
+                       if session.deadline < now and not
+                       (session.replica or session.subscriber or session.transfer)]
+        for session, close in expired:
+            session.deadline = FOREVER  # Closed once
+            if self.stats:
+                self.stats.incr('timeouts')
+            self.log(f"Connection with {session.address} timed out, closing it", 'WARNING')
+            try:
+                close()
+            except (OSError, RuntimeError):
+                pass  # Already closed, or the event loop has stopped
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Asynchronous batched logging for KVSS
+Callers enqueue messages; a background thread writes them to one kept-open file
+"""
+
+import queue
+import random
+import sys
+import threading
+
+
+LOG_LEVELS = {
+    'DEBUG': 10,
+    'INFO': 20,
+    'WARNING': 30,
+    'ERROR': 40,
+}
+
+
+def abbreviate(text, limit=256):
+    """Shorten text for logging, noting how much was cut (keeps large values out of logs)"""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text)} chars)"
+
+
+class LogWriter:
+    def __init__(self, log_file, level='INFO', console=True, sample_rate=1.0,
+                 queue_size=10000, batch_size=256, flush_interval=0.2):
+        """
+        log_file: path appended to (kept open for the writer's lifetime)
+        level: minimum level written (DEBUG, INFO, WARNING, ERROR)
+        console: also echo messages to stdout from the writer thread
+        sample_rate: fraction of sampled messages (see sampled()) that are kept
+        queue_size: maximum pending messages; further messages are dropped and counted
+        batch_size: maximum messages written per flush
+        flush_interval: seconds the writer waits for more messages before flushing
+        """
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown log level '{level}', expected one of {list(LOG_LEVELS)}")
+        self.log_file = log_file
+        self.level = LOG_LEVELS[level]
+        self.console = console
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="kvss-log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def enabled(self, level):
+        """Return True if messages at level would be written"""
+        return LOG_LEVELS[level] >= self.level
+
+    def sampled(self):
+        """Decide whether the next sampled event (e.g. a request trace) is logged"""
+        if self.sample_rate >= 1.0:
+            return True
+        return self.sample_rate > 0.0 and random.random() < self.sample_rate
+
+    def log(self, message, level='INFO'):
+        """Queue a message without blocking; drops it if the queue is full"""
+        if self.closed or LOG_LEVELS[level] < self.level:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """Block until every message queued so far has been written"""
+        if self.closed:
+            return
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Flush pending messages and stop the writer thread"""
+        if self.closed:
+            return
+        self.flush(timeout)
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        """Writer thread: collect messages into batches and write each batch at once"""
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch = []
+            waiters = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                batch.append(f"Warning: log queue full, dropped {dropped} messages")
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                if self.file:
+                    self.file.close()
+                return
+
+    def _write(self, batch):
+        """Write a batch of messages to the console and the log file"""
+        text = '\n'.join(batch) + '\n'
+        if self.console:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+        try:
+            if self.file is None:
+                self.file = open(self.log_file, 'a', encoding='utf-8')
+            self.file.write(text)
+            self.file.flush()
+        except Exception as e:
+            self.file = None
+            if self.console:
+                print(f"Warning: Could not write to log file {self.log_file}: {e}", flush=True)
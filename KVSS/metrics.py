@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Request metrics for the KVSS server and benchmarks
+Per-command latency histograms kept per thread (no locks on the request path), and
+a Prometheus text-format endpoint served from a side port.
+"""
+
+import threading
+import weakref
+from time import perf_counter_ns
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Percentiles reported for every command
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Upper bounds (seconds) of the Prometheus histogram buckets
+PROMETHEUS_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                      0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class CellOwner:
+    """Placed in a thread's local storage; collected when the thread exits
+
+    StatsCounters and CommandMetrics retire a thread's cell with weakref.finalize on it.
+    """
+    __slots__ = ('__weakref__',)
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in microseconds (about 3% precision)
+
+    Values below 64us get a bucket each; above that each power of two is split into
+    32 buckets, so recording is O(1) and histograms from many threads or processes
+    merge by adding counts.
+    """
+
+    SUB_BUCKETS = 32
+
+    def __init__(self, counts=None):
+        self.counts = list(counts or [])
+        self.total = sum(self.counts)
+        self.max_us = 0
+
+    @classmethod
+    def bucket(cls, micros):
+        if micros < 2 * cls.SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - 6
+        return (shift + 1) * cls.SUB_BUCKETS + (micros >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bucket_limit(cls, index):
+        """Largest value (us) recorded in bucket index"""
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = index // cls.SUB_BUCKETS - 1
+        return ((index % cls.SUB_BUCKETS + cls.SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds):
+        self.record_micros(int(seconds * 1000000))
+
+    def record_micros(self, micros):
+        # bucket() inlined: this runs once per request in the server
+        if micros < 64:
+            index = micros
+        else:
+            shift = micros.bit_length() - 6
+            index = (shift + 1) * 32 + (micros >> shift) - 32
+        counts = self.counts
+        try:
+            counts[index] += 1
+        except IndexError:
+            counts.extend([0] * (index + 1 - len(counts)))
+            counts[index] += 1
+        self.total += 1
+        if micros > self.max_us:
+            self.max_us = micros
+
+    def merge(self, other):
+        if len(other.counts) > len(self.counts):
+            self.counts.extend([0] * (len(other.counts) - len(self.counts)))
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, percent):
+        """Upper bound (us) of the bucket holding the given percentile"""
+        if not self.total:
+            return 0
+        rank = max(int(self.total * percent / 100.0 + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bucket_limit(index), self.max_us)
+        return self.max_us
+
+    def count_below(self, micros):
+        """Number of values recorded in buckets that end at or below micros"""
+        return sum(count for index, count in enumerate(self.counts)
+                   if self.bucket_limit(index) <= micros)
+
+    def mean(self):
+        if not self.total:
+            return 0.0
+        weighted = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                lower = self.bucket_limit(index - 1) + 1 if index else 0
+                weighted += count * (lower + self.bucket_limit(index)) / 2
+        return weighted / self.total
+
+    def summary(self):
+        """Percentiles, mean and max in milliseconds"""
+        summary = {f"p{percent:g}".replace('.', ''): self.percentile(percent) / 1000.0
+                   for percent in PERCENTILES}
+        summary['mean'] = round(self.mean() / 1000.0, 4)
+        summary['max'] = self.max_us / 1000.0
+        summary['count'] = self.total
+        return summary
+
+    def to_dict(self):
+        return {'counts': self.counts, 'max_us': self.max_us}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data['counts'])
+        histogram.max_us = data['max_us']
+        return histogram
+
+
+class CommandMetrics:
+    """Latency histogram per command, kept per thread and merged on read
+
+    Like StatsCounters, each thread records into its own cell without locking;
+    cells of exited threads are folded into a retired total. Commands outside the
+    known set are recorded as OTHER, so junk requests cannot grow the cells.
+    """
+
+    OTHER = 'OTHER'
+
+    def __init__(self, commands):
+        self.commands = tuple(commands) + (self.OTHER,)
+        self.local = threading.local()
+        self.cells = {}    # id(cell) -> {command: LatencyHistogram}, one per live thread
+        self.retired = {}
+        self.cells_lock = threading.Lock()
+
+    def _cell(self):
+        cell = getattr(self.local, 'cell', None)
+        if cell is None:
+            cell = {command: LatencyHistogram() for command in self.commands}
+            owner = CellOwner()
+            with self.cells_lock:
+                self.cells[id(cell)] = cell
+            weakref.finalize(owner, self._retire, cell)
+            self.local.cell = cell
+            self.local.owner = owner
+        return cell
+
+    def _retire(self, cell):
+        with self.cells_lock:
+            self._merge_into(self.retired, cell)
+            del self.cells[id(cell)]
+
+    @staticmethod
+    def _merge_into(totals, cell):
+        for command, histogram in cell.items():
+            if not histogram.total:
+                continue
+            if command not in totals:
+                totals[command] = LatencyHistogram()
+            totals[command].merge(histogram)
+
+    def record(self, command, started):
+        """Record one request of command that began at perf_counter_ns() started"""
+        micros = (perf_counter_ns() - started) // 1000
+        try:
+            cell = self.local.cell
+        except AttributeError:
+            cell = self._cell()
+        (cell.get(command) or cell[self.OTHER]).record_micros(micros)
+
+    def snapshot(self):
+        """Return {command: LatencyHistogram} merged over all threads"""
+        totals = {}
+        with self.cells_lock:
+            self._merge_into(totals, self.retired)
+            for cell in list(self.cells.values()):
+                self._merge_into(totals, cell)
+        return totals
+
+
+def render_prometheus(gauges, counters, histograms, labels=None):
+    """Render metrics in the Prometheus text exposition format
+
+    gauges and counters map metric names (without the kvss_ prefix) to values;
+    histograms maps command names to LatencyHistograms. labels are added to every
+    sample (e.g. the worker index).
+    """
+    base = ','.join(f'{name}="{value}"' for name, value in (labels or {}).items())
+
+    def sample(name, value, extra=''):
+        label_text = ','.join(part for part in (base, extra) if part)
+        return f"kvss_{name}{{{label_text}}} {value}" if label_text else f"kvss_{name} {value}"
+
+    lines = []
+    for kind, metrics in (('gauge', gauges), ('counter', counters)):
+        for name, value in metrics.items():
+            lines.append(f"# TYPE kvss_{name} {kind}")
+            lines.append(sample(name, value))
+    lines.append("# TYPE kvss_command_duration_seconds histogram")
+    for command, histogram in sorted(histograms.items()):
+        command_label = f'command="{command}"'
+        for bound in PROMETHEUS_BUCKETS:
+            count = histogram.count_below(int(bound * 1000000))
+            lines.append(sample('command_duration_seconds_bucket', count,
+                                f'{command_label},le="{bound:g}"'))
+        lines.append(sample('command_duration_seconds_bucket', histogram.total,
+                            f'{command_label},le="+Inf"'))
+        lines.append(sample('command_duration_seconds_sum',
+                            round(histogram.mean() * histogram.total / 1000000, 6), command_label))
+        lines.append(sample('command_duration_seconds_count', histogram.total, command_label))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """HTTP endpoint serving render() as Prometheus text on GET /metrics"""
+
+    def __init__(self, host, port, render, log=None):
+        self.log = log or (lambda message, level='INFO': None)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Scrapes are not worth a log line each
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="kvss-metrics")
+        self.thread.daemon = True
+        self.thread.start()
+        host, port = self.httpd.server_address[:2]
+        self.log(f"Prometheus metrics on http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
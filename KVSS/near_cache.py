@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Client-side near-cache for KVSS
+Values read through a NearCache are kept in local memory and served from there
+until the server notifies that their key changed, so services that poll a key
+only go to the server after it was actually written.
+"""
+
+import socket
+import threading
+from collections import OrderedDict
+
+from client import KVSSClient
+from notify import parse_pattern
+from pool import KVSSClientPool
+
+
+_MISSING = object()
+
+
+class NearCache:
+    """Local LRU cache of a KVSS server's values, invalidated by notifications
+
+    A background thread keeps a SUBSCRIBE connection for patterns open and drops
+    each key the server reports as changed; reads and writes go through a
+    KVSSClientPool. Only keys matching patterns are cached (others are never
+    notified), missing keys included. Nothing is cached while the subscription is
+    down, and the cache is emptied when it drops or the server sends NOTIFY RESET,
+    so a cached value is at most one notification delay old.
+    """
+
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, host='127.0.0.1', port=5050, patterns=('*',), max_entries=10000,
+                 **pool_options):
+        """
+        patterns: keys to cache, as for SUBSCRIBE ('prefix*' or exact keys)
+        max_entries: keys kept in the cache; the least recently read are dropped
+        pool_options: passed to the KVSSClientPool used for reads and writes
+        """
+        self.host = host
+        self.port = port
+        self.patterns = list(patterns)
+        self.keys = set()
+        prefixes = []
+        for pattern in self.patterns:
+            is_prefix, text = parse_pattern(pattern)
+            (prefixes.append if is_prefix else self.keys.add)(text)
+        self.prefixes = tuple(prefixes)
+        self.max_entries = max_entries
+        self.pool = KVSSClientPool(host, port, **pool_options)
+        self.lock = threading.Lock()  # Guards entries, loading, live and the counters
+        self.entries = OrderedDict()  # key -> value (None: missing), least recently read first
+        self.loading = {}  # key -> token of a read in flight; invalidation removes it
+        self.live = False  # True while the subscription is established
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.resets = 0
+        self.subscribed = threading.Event()
+        self.closed = threading.Event()
+        self.client = None
+        self.thread = threading.Thread(target=self._listen, name="kvss-near-cache")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wait_ready(self, timeout=None):
+        """Wait until the subscription is established; returns False on timeout"""
+        return self.subscribed.wait(timeout)
+
+    def cacheable(self, key):
+        return key in self.keys or key.startswith(self.prefixes)
+
+    def get(self, key):
+        """Return the value of key, or None if it does not exist"""
+        with self.lock:
+            value = self.entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+            token = None
+            if self.live and self.cacheable(key):
+                token = self.loading[key] = object()
+        value = self.pool.get(key)
+        if token is not None:
+            with self.lock:
+                # A notification during the read removed the token: the value may be stale
+                if self.loading.get(key) is token:
+                    del self.loading[key]
+                    self.entries[key] = value
+                    if len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+        return value
+
+    def put(self, key, value, ttl=None):
+        """Store value under key; returns True if the key was created"""
+        try:
+            return self.pool.put(key, value, ttl)
+        finally:
+            self.invalidate(key)
+
+    def delete(self, key):
+        """Delete key; returns True if it existed"""
+        try:
+            return self.pool.delete(key)
+        finally:
+            self.invalidate(key)
+
+    def invalidate(self, key):
+        """Drop key from the cache"""
+        with self.lock:
+            self.loading.pop(key, None)
+            if self.entries.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every cached key"""
+        with self.lock:
+            self.entries.clear()
+            self.loading.clear()
+
+    def stats(self):
+        """Return the cache's size, hits, misses, invalidations and resets"""
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations, 'resets': self.resets,
+                    'live': self.live}
+
+    def _listen(self):
+        """Background thread: hold the subscription, reconnecting after failures"""
+        while not self.closed.is_set():
+            client = self.client = KVSSClient(self.host, self.port, verbose=False)
+            if client.connect():
+                try:
+                    client.socket.sendall(f"KV/1.0 SUBSCRIBE {' '.join(self.patterns)}\n".encode('utf-8'))
+                    while True:
+                        self._handle(client.read_response())
+                except (OSError, ValueError) as e:
+                    if not self.closed.is_set():
+                        client.log_error(f"Subscription to {self.host}:{self.port} lost: {e}")
+                finally:
+                    client.disconnect()
+            with self.lock:
+                self.live = False
+                self.subscribed.clear()
+            self.clear()  # Notifications may have been missed
+            self.closed.wait(self.RETRY_INTERVAL)
+
+    def _handle(self, line):
+        if line.startswith("NOTIFY "):
+            _, event, key = (line + ' ').split(' ', 2)
+            if event == "RESET":
+                with self.lock:
+                    self.resets += 1
+                self.clear()
+            else:
+                self.invalidate(key[:-1])
+        elif line.startswith("200 OK subscribed="):
+            with self.lock:
+                self.live = True
+            self.subscribed.set()
+        else:
+            raise ValueError(f"Server refused SUBSCRIBE: {line}")
+
+    def close(self):
+        """Stop the subscription and close the pool"""
+        self.closed.set()
+        client = self.client
+        if client and client.socket:
+            try:
+                client.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.thread.join()
+        self.pool.close()
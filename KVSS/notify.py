@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Key-change notifications for the KVSS server
+A connection that sends "KV/1.0 SUBSCRIBE <pattern> ..." becomes a notification
+stream: it is pushed a "NOTIFY PUT <key>" or "NOTIFY DEL <key>" line whenever a key
+matching one of its patterns is written or removed. A pattern ending in '*' matches
+every key starting with the rest of it; any other pattern names one key.
+"""
+
+import asyncio
+import socket
+import threading
+
+from store import OP_PUT, OP_DEL
+
+
+SUBSCRIBE_PREFIX = "KV/1.0 SUBSCRIBE "
+
+# Changes reported to subscribers, and their names on the wire
+EVENT_NAMES = {OP_PUT: 'PUT', OP_DEL: 'DEL'}
+EVENT_OPS = {name: op for op, name in EVENT_NAMES.items()}
+
+# Sent instead of notifications that were lost: the subscriber must forget what it cached
+RESET_LINE = b"NOTIFY RESET\n"
+
+# Default notifications queued for one subscriber before it is reset
+DEFAULT_QUEUE_LIMIT = 10000
+# Default changes waiting for the dispatcher before they are dropped and every
+# subscriber is reset
+DEFAULT_BACKLOG_LIMIT = 100000
+
+
+def escape_key(key):
+    """Escape line breaks (possible in keys set over KV/2.0) so a notification stays one line"""
+    return key.replace('\r', '\\r').replace('\n', '\\n')
+
+
+def parse_pattern(pattern):
+    """Return (is_prefix, text) for a subscription pattern"""
+    if pattern.endswith('*'):
+        return True, pattern[:-1]
+    return False, pattern
+
+
+class Subscriber:
+    """One subscribed connection: its patterns and its queue of outgoing lines
+
+    Notifications are queued by the dispatcher thread and sent by the connection's
+    writer, which wakeup() signals when the queue stops being empty. At most limit
+    notifications are queued: past that they are all replaced by one RESET_LINE, and
+    further ones are dropped until the writer has taken it.
+    """
+    __slots__ = ('address', 'patterns', 'local', 'lock', 'lines', 'pending', 'limit',
+                 'wakeup', 'overflowed', 'closed')
+
+    def __init__(self, address, limit, wakeup):
+        self.address = address
+        self.patterns = set()  # As sent, e.g. 'user:42' or 'user:*'
+        self.local = False     # Worker mode: only changes of this worker's own keys
+        self.lock = threading.Lock()
+        self.lines = []        # Encoded lines not yet taken by the writer
+        self.pending = 0       # Notifications in lines
+        self.limit = limit
+        self.wakeup = wakeup
+        self.overflowed = False
+        self.closed = False
+
+    def push(self, line, notification=True):
+        """Queue a line for the writer; returns True if this overflowed the queue
+
+        Responses to the subscriber's own requests (notification=False) are never
+        dropped or counted against the limit.
+        """
+        overflow = False
+        with self.lock:
+            if self.closed or (notification and self.overflowed):
+                return False
+            wake = not self.lines
+            if notification and self.pending >= self.limit:
+                self._overflow()
+                overflow = True
+            else:
+                if notification:
+                    self.pending += 1
+                self.lines.append(line)
+        if wake:
+            self.wakeup()
+        return overflow
+
+    def reset(self):
+        """Replace the queued notifications with RESET_LINE, as on overflow"""
+        with self.lock:
+            if self.closed or self.overflowed:
+                return
+            wake = not self.lines
+            self._overflow()
+        if wake:
+            self.wakeup()
+
+    def _overflow(self):
+        # Under lock: notifications were lost, so the queued ones are worthless
+        self.lines = [queued for queued in self.lines if not queued.startswith(b'NOTIFY ')]
+        self.lines.append(RESET_LINE)
+        self.pending = 0
+        self.overflowed = True
+
+    def take(self):
+        """Remove and return the queued lines; None once closed and drained"""
+        with self.lock:
+            lines = self.lines
+            if not lines and self.closed:
+                return None
+            self.lines = []
+            self.pending = 0
+            self.overflowed = False
+            return lines
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.wakeup()
+
+
+class Notifier:
+    """Fans key changes out to subscribed connections
+
+    The store listener only appends each change to a queue, so writers never wait
+    for subscribers; a dispatcher thread matches the changes against the
+    subscriptions and queues a line for every subscriber interested. Subscriptions
+    are kept in maps that updates rebuild and swap in, so matching needs no lock.
+    The listener and the dispatcher are only started for the first subscriber. If
+    more than backlog_limit changes wait for the dispatcher, they are dropped and
+    every subscriber is sent RESET_LINE instead.
+
+    With --workers each worker's store holds only its share of the keys: the first
+    subscriber makes a worker subscribe to the other workers' own changes ('*' with
+    LOCAL) through their peer ports and feed them to its subscribers as well.
+    """
+
+    # A subscriber that accepts no data for this long is disconnected
+    SEND_TIMEOUT = 30.0
+    # Longest request line accepted on a subscribed connection
+    MAX_LINE = 64 * 1024
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, store, queue_limit=DEFAULT_QUEUE_LIMIT, log=None, shutdown_event=None,
+                 worker_index=0, peers=None, backlog_limit=DEFAULT_BACKLOG_LIMIT):
+        self.store = store
+        self.queue_limit = queue_limit
+        self.backlog_limit = backlog_limit
+        self.log = log or (lambda message, level='INFO': None)
+        self.shutdown_event = shutdown_event or threading.Event()
+        self.worker_index = worker_index
+        self.peers = peers
+        self.changes = []  # (op, key, relayed line or None) waiting for the dispatcher
+        self.changes_lock = threading.Lock()
+        self.changes_lost = False  # Set when changes overflowed backlog_limit
+        self.ready = threading.Event()  # Set when changes has entries
+        self.lock = threading.Lock()  # Serializes subscription updates
+        self.subscribers = set()
+        # (key -> subscribers, prefix -> subscribers, distinct prefix lengths), replaced as a whole
+        self.routes = ({}, {}, ())
+        self.started = False
+        self.relaying = False
+        self.notifications = 0  # Lines queued for subscribers
+        self.resets = 0         # Times a subscriber was reset for lost notifications
+
+    def record(self, op, key, value=''):
+        """Queue a change for the dispatcher (store listener, under the shard lock)"""
+        if op in EVENT_NAMES and self.subscribers:
+            with self.changes_lock:
+                if len(self.changes) >= self.backlog_limit:
+                    self.changes = []
+                    self.changes_lost = True
+                self.changes.append((op, key, None))
+            self.ready.set()
+
+    def _dispatch(self):
+        """Background thread: queue a notification for every subscriber of each change"""
+        while not self.shutdown_event.is_set():
+            self.ready.wait(1.0)
+            self.ready.clear()
+            with self.changes_lock:
+                changes = self.changes
+                self.changes = []
+                lost, self.changes_lost = self.changes_lost, False
+            if lost:
+                self._reset_lost()
+            for op, key, line in changes:
+                keys, prefixes, lengths = self.routes
+                matched = keys.get(key, ())
+                for length in lengths:
+                    if length > len(key):
+                        break
+                    found = prefixes.get(key[:length])
+                    if found:
+                        matched = matched | found if matched else found
+                if not matched:
+                    continue
+                relayed = line is not None
+                if not relayed:
+                    line = f"NOTIFY {EVENT_NAMES[op]} {escape_key(key)}\n".encode('utf-8', 'replace')
+                for subscriber in matched:
+                    if relayed and subscriber.local:
+                        continue
+                    self.notifications += 1
+                    if subscriber.push(line):
+                        self.resets += 1
+                        self.log(f"Subscriber {subscriber.address} fell more than "
+                                 f"{self.queue_limit} notifications behind, sent RESET", 'WARNING')
+
+    def _reset_lost(self):
+        """Reset every subscriber after the dispatcher's backlog overflowed
+
+        Unlike reset_all, this includes other workers' relays (LOCAL), which missed
+        this worker's own changes; they pass the reset on to their subscribers.
+        """
+        subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.reset()
+        self.resets += len(subscribers)
+        self.log(f"More than {self.backlog_limit} changes waited for the notification "
+                 f"dispatcher, sent RESET to {len(subscribers)} subscribers", 'WARNING')
+
+    def _start(self, local):
+        """Install the store listener and dispatcher, and the worker relays if needed"""
+        if not self.started:
+            self.started = True
+            self.store.add_listener(self.record)
+            thread = threading.Thread(target=self._dispatch, name="kvss-notify")
+            thread.daemon = True
+            thread.start()
+        if self.peers and not local and not self.relaying:
+            self.relaying = True
+            for index, (host, port) in enumerate(self.peers):
+                if index != self.worker_index:
+                    thread = threading.Thread(target=self._relay, args=(index, host, port),
+                                              name=f"kvss-notify-relay-{index}")
+                    thread.daemon = True
+                    thread.start()
+
+    def subscribe(self, subscriber, patterns, local=False):
+        """Add patterns to subscriber's subscriptions"""
+        with self.lock:
+            if local:
+                subscriber.local = True
+            self._start(subscriber.local)
+            keys, prefixes, _ = self.routes
+            keys, prefixes = dict(keys), dict(prefixes)
+            for pattern in patterns:
+                if pattern in subscriber.patterns:
+                    continue
+                subscriber.patterns.add(pattern)
+                is_prefix, text = parse_pattern(pattern)
+                routes = prefixes if is_prefix else keys
+                routes[text] = routes.get(text, frozenset()) | {subscriber}
+            self.subscribers.add(subscriber)
+            self._swap(keys, prefixes)
+
+    def unsubscribe(self, subscriber, patterns=None):
+        """Remove patterns (all of them by default) from subscriber's subscriptions"""
+        with self.lock:
+            keys, prefixes, _ = self.routes
+            keys, prefixes = dict(keys), dict(prefixes)
+            for pattern in list(subscriber.patterns if patterns is None else patterns):
+                if pattern not in subscriber.patterns:
+                    continue
+                subscriber.patterns.discard(pattern)
+                is_prefix, text = parse_pattern(pattern)
+                routes = prefixes if is_prefix else keys
+                remaining = routes[text] - {subscriber}
+                if remaining:
+                    routes[text] = remaining
+                else:
+                    del routes[text]
+            if not subscriber.patterns:
+                self.subscribers.discard(subscriber)
+            self._swap(keys, prefixes)
+
+    def _swap(self, keys, prefixes):
+        self.routes = (keys, prefixes, tuple(sorted({len(prefix) for prefix in prefixes})))
+
+    def reset_all(self):
+        """Send RESET to every subscriber, e.g. after the store was replaced wholesale
+
+        Subscribers with LOCAL (other workers' relays) are left alone: they only follow
+        this worker's own changes, which were not lost.
+        """
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            if not subscriber.local:
+                subscriber.push(RESET_LINE, notification=False)
+
+    def command(self, subscriber, line):
+        """Handle a request on a subscribed connection; returns False once it should close
+
+        Only SUBSCRIBE, UNSUBSCRIBE and QUIT are accepted; responses are queued
+        between the notifications.
+        """
+        parts = line.split()
+        command = parts[1] if len(parts) >= 2 and parts[0] == "KV/1.0" else None
+        args = parts[2:]
+        if command in ("SUBSCRIBE", "UNSUBSCRIBE"):
+            local = 'LOCAL' in args
+            patterns = [arg for arg in args if arg != 'LOCAL']
+            if command == "SUBSCRIBE":
+                if not patterns:
+                    subscriber.push(b"400 BAD_REQUEST\n", notification=False)
+                    return True
+                self.subscribe(subscriber, patterns, local)
+            else:
+                self.unsubscribe(subscriber, patterns or None)
+            subscriber.push(f"200 OK subscribed={len(subscriber.patterns)}\n".encode('utf-8'),
+                            notification=False)
+        elif command == "QUIT":
+            subscriber.push(b"200 OK goodbye\n", notification=False)
+            return False
+        else:
+            subscriber.push(b"400 BAD_REQUEST\n", notification=False)
+        return True
+
+    def _process(self, subscriber, buffer):
+        """Handle the complete request lines in buffer; returns False once it should close"""
+        while True:
+            end = buffer.find(b'\n')
+            if end < 0:
+                return len(buffer) <= self.MAX_LINE
+            line = buffer[:end].decode('utf-8', 'replace').strip()
+            del buffer[:end + 1]
+            if line and not self.command(subscriber, line):
+                return False
+
+    def serve(self, sock, address, buffer):
+        """Run a subscribed connection on this thread until it closes
+
+        buffer holds the bytes received but not yet processed, starting with the
+        SUBSCRIBE request. A second thread writes the queued lines, so a subscriber
+        that stops reading only ever fills its own queue.
+        """
+        ready = threading.Event()
+        subscriber = Subscriber(address, self.queue_limit, ready.set)
+        writer = threading.Thread(target=self._write, args=(sock, subscriber, ready),
+                                  name="kvss-notify-writer")
+        writer.daemon = True
+        writer.start()
+        sock.settimeout(self.SEND_TIMEOUT)
+        try:
+            while self._process(subscriber, buffer):
+                try:
+                    data = sock.recv(4096)
+                except socket.timeout:
+                    continue  # Subscribers rarely send anything
+                if not data:
+                    break
+                buffer += data
+        except OSError:
+            pass
+        finally:
+            self.unsubscribe(subscriber)
+            subscriber.close()
+            writer.join(self.SEND_TIMEOUT)
+
+    def _write(self, sock, subscriber, ready):
+        try:
+            while True:
+                ready.wait()
+                ready.clear()
+                lines = subscriber.take()
+                if lines is None:
+                    return
+                if lines:
+                    sock.sendall(b''.join(lines))
+        except OSError as e:
+            self.log(f"Subscriber {subscriber.address} disconnected: {e}", 'WARNING')
+            subscriber.close()
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # Ends the reading side as well
+            except OSError:
+                pass
+
+    async def serve_async(self, reader, writer, address, buffer):
+        """Run a subscribed connection on the event loop until it closes; see serve"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def wakeup():
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+        subscriber = Subscriber(address, self.queue_limit, wakeup)
+
+        async def flush():
+            while True:
+                await ready.wait()
+                ready.clear()
+                lines = subscriber.take()
+                if lines is None:
+                    return
+                if lines:
+                    writer.write(b''.join(lines))
+                    await writer.drain()
+
+        flusher = asyncio.ensure_future(flush())
+        try:
+            while self._process(subscriber, buffer):
+                data = await reader.read(4096)
+                if not data:
+                    break
+                buffer += data
+        finally:
+            self.unsubscribe(subscriber)
+            subscriber.close()
+            try:
+                await asyncio.wait_for(flusher, self.SEND_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                self.log(f"Subscriber {address} disconnected: {e}", 'WARNING')
+
+    def _relay(self, index, host, port):
+        """Background thread: feed worker index's changes to this worker's subscribers
+
+        Changes made while the relay was down are unknown, so every (re)connection
+        resets this worker's subscribers.
+        """
+        while not self.shutdown_event.is_set():
+            sock = None
+            try:
+                sock = socket.create_connection((host, port))
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.sendall(f"{SUBSCRIBE_PREFIX}* LOCAL\n".encode('utf-8'))
+                buffer = bytearray()
+                while True:
+                    data = sock.recv(65536)
+                    if not data:
+                        raise ConnectionError("closed by worker")
+                    buffer += data
+                    end = buffer.rfind(b'\n')
+                    if end < 0:
+                        continue
+                    lines = buffer[:end + 1].splitlines(keepends=True)
+                    del buffer[:end + 1]
+                    self._relay_lines(lines)
+            except (OSError, ValueError, KeyError) as e:
+                if not self.shutdown_event.is_set():
+                    self.log(f"Notification relay from worker {index} interrupted: {e}", 'WARNING')
+            finally:
+                if sock:
+                    sock.close()
+                self.reset_all()
+            self.shutdown_event.wait(self.RETRY_INTERVAL)
+
+    def _relay_lines(self, lines):
+        relayed = []
+        for line in lines:
+            if line == RESET_LINE or line.startswith(b"200 OK"):
+                # The peer overflowed this relay's queue, or the relay just (re)subscribed
+                self.reset_all()
+                continue
+            _, event, key = line.decode('utf-8', 'replace').rstrip('\n').split(' ', 2)
+            relayed.append((EVENT_OPS[event], key, line))
+        if relayed:
+            with self.changes_lock:
+                if len(self.changes) + len(relayed) > self.backlog_limit:
+                    self.changes = []
+                    self.changes_lost = True
+                self.changes.extend(relayed[-self.backlog_limit:])
+            self.ready.set()
+
+    def stats(self):
+        """Return {'subscribers': n, 'notifications': n, 'notify_resets': n} for STATS
+
+        Other workers' relays are not counted as subscribers.
+        """
+        subscribers = sum(not subscriber.local for subscriber in list(self.subscribers))
+        return {'subscribers': subscribers, 'notifications': self.notifications,
+                'notify_resets': self.resets}
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Append-only persistence for the KVSS server
+Mutations are appended to write-ahead log segments; a background thread fsyncs them
+according to the configured policy and periodically compacts them into a snapshot.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from store import OP_PUT, OP_DEL, OP_EXPIRE
+
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+WAL_MAGIC = b'KVSSWAL1'
+SNAPSHOT_MAGIC = b'KVSSNAP1'
+SNAPSHOT_FILE = 'snapshot.kvs'
+
+# crc32, op, key length, value length
+RECORD_HEADER = struct.Struct('<IBII')
+# Set in a record's op byte when its value is raw bytes (KV/2.0) rather than text
+BYTES_VALUE = 0x80
+# First WAL segment not covered by the snapshot
+SNAPSHOT_HEADER = struct.Struct('<Q')
+
+
+def encode_record(op, key, value=''):
+    """Encode one mutation as a checksummed binary record"""
+    key_bytes = key.encode('utf-8')
+    if isinstance(value, str):
+        value_bytes = value.encode('utf-8')
+    else:
+        value_bytes = bytes(value)
+        op |= BYTES_VALUE
+    body = struct.pack('<BII', op, len(key_bytes), len(value_bytes)) + key_bytes + value_bytes
+    return struct.pack('<I', zlib.crc32(body)) + body
+
+
+def decode_record(buffer, offset):
+    """Decode the record at buffer[offset:]
+
+    Returns (op, key, value, end offset), or None if the record is not complete yet.
+    Raises ValueError if its checksum does not match.
+    """
+    header_size = RECORD_HEADER.size
+    if offset + header_size > len(buffer):
+        return None
+    crc, op, key_len, value_len = RECORD_HEADER.unpack_from(buffer, offset)
+    record_end = offset + header_size + key_len + value_len
+    if record_end > len(buffer):
+        return None
+    if zlib.crc32(buffer[offset + 4:record_end]) != crc:
+        raise ValueError(f"Corrupt record at offset {offset}")
+    key_start = offset + header_size
+    value_start = key_start + key_len
+    value = buffer[value_start:record_end]
+    if op & BYTES_VALUE:
+        op &= ~BYTES_VALUE
+        value = bytes(value)
+    else:
+        value = str(value, 'utf-8')
+    return op, str(buffer[key_start:value_start], 'utf-8'), value, record_end
+
+
+def iter_records(buffer, offset):
+    """Yield (op, key, value) from buffer starting at offset
+
+    Stops at the first truncated or corrupt record (e.g. a torn write at crash time).
+    """
+    while True:
+        try:
+            record = decode_record(buffer, offset)
+        except ValueError:
+            return
+        if record is None:
+            return
+        op, key, value, offset = record
+        yield op, key, value
+
+
+def read_file(path, magic):
+    """Yield the records of a snapshot or WAL file through a read-only memory map
+
+    The first item yielded is the raw header that follows the magic bytes (the
+    snapshot's WAL sequence, or empty for WAL segments).
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(magic):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if buffer[:len(magic)] != magic:
+                raise ValueError(f"{path} is not a KVSS data file")
+            offset = len(magic)
+            if magic == SNAPSHOT_MAGIC:
+                yield buffer[offset:offset + SNAPSHOT_HEADER.size]
+                offset += SNAPSHOT_HEADER.size
+            else:
+                yield b''
+            yield from iter_records(buffer, offset)
+
+
+class Persistence:
+    def __init__(self, data_dir, fsync='interval', fsync_interval=1.0,
+                 compact_bytes=64 * 1024 * 1024, log=None):
+        """
+        data_dir: directory holding the snapshot and WAL segments
+        fsync: 'always' (fsync every mutation), 'interval' (every fsync_interval
+               seconds) or 'never' (leave it to the OS)
+        compact_bytes: WAL size that triggers a background snapshot
+        log: callable(message, level) for diagnostics
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}', expected one of {FSYNC_POLICIES}")
+        self.data_dir = data_dir
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.log = log or (lambda message, level='INFO': None)
+        self.lock = threading.Lock()  # Guards the active segment
+        self.wal = None
+        self.wal_seq = 0
+        self.wal_bytes = 0
+        self.dirty = False
+        self.store = None
+        self.running = False
+        self.compacting = False
+        self.thread = None
+        self.stats = {'records': 0, 'fsyncs': 0, 'snapshots': 0}
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _wal_path(self, seq):
+        return os.path.join(self.data_dir, f"wal-{seq:08d}.log")
+
+    def _wal_segments(self):
+        """Return the sequence numbers of the WAL segments on disk, ascending"""
+        segments = []
+        for name in os.listdir(self.data_dir):
+            if name.startswith('wal-') and name.endswith('.log'):
+                try:
+                    segments.append(int(name[4:-4]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def recover(self):
+        """Rebuild the keyspace from the snapshot and WAL segments
+
+        Returns (data, expires): key -> value and key -> absolute expiry time.
+        """
+        start = time.perf_counter()
+        data = {}
+        expires = {}
+        first_seq = 0
+        snapshot_path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            records = read_file(snapshot_path, SNAPSHOT_MAGIC)
+            header = next(records, None)
+            if header:
+                first_seq = SNAPSHOT_HEADER.unpack(header)[0]
+            for op, key, value in records:
+                if op == OP_PUT:
+                    data[key] = value
+                elif op == OP_EXPIRE:
+                    expires[key] = float(value)
+
+        replayed = 0
+        for seq in self._wal_segments():
+            if seq < first_seq:
+                continue
+            records = read_file(self._wal_path(seq), WAL_MAGIC)
+            next(records, None)
+            for op, key, value in records:
+                if op == OP_PUT:
+                    data[key] = value
+                    expires.pop(key, None)
+                elif op == OP_DEL:
+                    data.pop(key, None)
+                    expires.pop(key, None)
+                elif op == OP_EXPIRE:
+                    expires[key] = float(value)
+                replayed += 1
+            self.wal_seq = max(self.wal_seq, seq)
+
+        self.log(f"Recovered {len(data)} keys ({replayed} log records) from {self.data_dir} "
+                 f"in {time.perf_counter() - start:.3f}s")
+        return data, expires
+
+    def open(self, store):
+        """Start logging mutations of store and the background fsync/compaction thread"""
+        self.store = store
+        with self.lock:
+            self._open_segment(self.wal_seq + 1)
+        store.add_listener(self.record)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="kvss-persistence")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _open_segment(self, seq):
+        """Switch appends to a new WAL segment; caller holds self.lock"""
+        if self.wal:
+            self._sync()
+            self.wal.close()
+        self.wal_seq = seq
+        self.wal = open(self._wal_path(seq), 'ab')
+        if self.wal.tell() == 0:
+            self.wal.write(WAL_MAGIC)
+        self.wal_bytes = 0
+
+    def _sync(self):
+        """Flush and fsync the active segment; caller holds self.lock"""
+        self.wal.flush()
+        if self.fsync != 'never':
+            os.fsync(self.wal.fileno())
+            self.stats['fsyncs'] += 1
+        self.dirty = False
+
+    def record(self, op, key, value=''):
+        """Append a mutation (store listener, called under the key's shard lock)"""
+        data = encode_record(op, key, value)
+        with self.lock:
+            if self.wal is None:  # Closed during shutdown
+                return
+            self.wal.write(data)
+            self.wal_bytes += len(data)
+            self.stats['records'] += 1
+            if self.fsync == 'always':
+                self._sync()
+            else:
+                self.dirty = True
+
+    def _run(self):
+        """Background thread: periodic flush/fsync and size-triggered compaction"""
+        while self.running:
+            time.sleep(self.fsync_interval)
+            with self.lock:
+                if self.dirty and self.wal:
+                    self._sync()
+                needs_compaction = self.wal_bytes >= self.compact_bytes
+            if needs_compaction:
+                self.compact()
+
+    def compact(self):
+        """Write a snapshot of the store and drop the WAL segments it covers
+
+        Appends move to a fresh segment first; the snapshot is then copied shard by
+        shard. Mutations racing with the copy are in the new segment as well, and
+        replaying them over the snapshot is idempotent.
+        """
+        with self.lock:
+            if self.compacting or self.wal is None:
+                return
+            self.compacting = True
+            self._open_segment(self.wal_seq + 1)
+            first_seq = self.wal_seq
+
+        try:
+            start = time.perf_counter()
+            snapshot_path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+            temp_path = snapshot_path + '.tmp'
+            count = 0
+            with open(temp_path, 'wb', buffering=1024 * 1024) as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(SNAPSHOT_HEADER.pack(first_seq))
+                for key, value, expires_at in self.store.entries():
+                    f.write(encode_record(OP_PUT, key, value))
+                    if expires_at is not None:
+                        f.write(encode_record(OP_EXPIRE, key, repr(expires_at)))
+                    count += 1
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, snapshot_path)
+
+            for seq in self._wal_segments():
+                if seq < first_seq:
+                    os.remove(self._wal_path(seq))
+            self.stats['snapshots'] += 1
+            self.log(f"Snapshot of {count} keys written in {time.perf_counter() - start:.3f}s")
+        except Exception as e:
+            self.log(f"Snapshot failed: {e}", 'ERROR')
+        finally:
+            self.compacting = False
+
+    def close(self):
+        """Stop the background thread and flush the active segment to disk"""
+        self.running = False
+        with self.lock:
+            if self.wal:
+                self.wal.flush()
+                os.fsync(self.wal.fileno())
+                self.wal.close()
+                self.wal = None
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Thread-safe connection pool for KVSS clients
+Each call checks a connection out of the pool, so threads never share a socket and
+responses always pair with their requests; idle connections are health-checked,
+reaped and re-established automatically.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from client import KVSSClient, KVSSError
+
+
+class KVSSClientPool:
+    def __init__(self, host='127.0.0.1', port=5050, min_connections=1, max_connections=10,
+                 idle_timeout=60.0, health_check_interval=30.0, timeout=5.0,
+                 acquire_timeout=5.0, binary=False, retries=1, compress=False):
+        """
+        min_connections: connections opened up front and kept open while idle
+        max_connections: upper bound on open connections; callers wait for a free one
+        idle_timeout: seconds after which idle connections above min_connections are closed
+        health_check_interval: connections idle for longer are checked before reuse
+        timeout: socket timeout for connecting and each request
+        acquire_timeout: seconds to wait for a free connection before TimeoutError
+        binary: use the KV/2.0 binary protocol (values are then returned as bytes)
+        retries: times a call is retried on a fresh connection after a connection error
+                 (never for incr, decr, append and cas, which must not run twice)
+        compress: with binary, receive values compressed as stored (see KVSSClient)
+        """
+        if not 0 <= min_connections <= max_connections or max_connections < 1:
+            raise ValueError("need 0 <= min_connections <= max_connections and max_connections >= 1")
+        self.host = host
+        self.port = port
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self.binary = binary
+        self.compress = compress
+        self.retries = retries
+        self.condition = threading.Condition()
+        self.idle = deque()  # (client, time returned); most recently used last
+        self.size = 0        # Open connections, checked out or idle, plus ones being opened
+        self.closed = False
+        self.stop_event = threading.Event()
+
+        for _ in range(min_connections):
+            self.size += 1
+            self.idle.append((self._open(), time.monotonic()))
+        self.reaper = threading.Thread(target=self._reap, name="kvss-pool-reaper")
+        self.reaper.daemon = True
+        self.reaper.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self):
+        client = KVSSClient(self.host, self.port, binary=self.binary, compress=self.compress,
+                            timeout=self.timeout, verbose=False)
+        if not client.connect():
+            raise ConnectionError(client.last_error or
+                                  f"Cannot connect to KVSS server at {self.host}:{self.port}")
+        return client
+
+    def _discard(self, client):
+        """Close a connection and free its slot; caller holds self.condition"""
+        try:
+            client.disconnect()
+        except OSError:
+            pass
+        self.size -= 1
+        self.condition.notify()
+
+    def acquire(self):
+        """Check out a connection, opening one if below max_connections
+
+        Reuses the most recently returned connection (LIFO) so that surplus ones stay
+        idle long enough to be reaped. Raises TimeoutError if none frees up within
+        acquire_timeout.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self.idle:
+                    client, returned_at = self.idle.pop()
+                    break
+                if self.size < self.max_connections:
+                    self.size += 1  # Reserve the slot, connect outside the lock
+                    client = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No KVSS connection available within {self.acquire_timeout}s")
+                self.condition.wait(remaining)
+
+        if client is not None:
+            stale = time.monotonic() - returned_at > self.health_check_interval
+            if not stale or client.is_alive():
+                return client
+            client.disconnect()
+        try:
+            return self._open()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, client, healthy=True):
+        """Return a connection; unhealthy or disconnected ones are closed"""
+        with self.condition:
+            if healthy and client.connected and not self.closed:
+                self.idle.append((client, time.monotonic()))
+                self.condition.notify()
+            else:
+                self._discard(client)
+
+    @contextmanager
+    def connection(self):
+        """Check out one connection for a sequence of calls (e.g. a pipeline)
+
+        The connection is closed instead of returned if the block fails with anything
+        other than an error response, since a request may have been left half-read.
+        """
+        client = self.acquire()
+        try:
+            yield client
+        except KVSSError:
+            self.release(client)
+            raise
+        except BaseException:
+            self.release(client, healthy=False)
+            raise
+        self.release(client)
+
+    def call(self, method, *args, retry=True):
+        """Run KVSSClient.<method>(*args) on a pooled connection and return its result
+
+        Connection failures close the connection and retry on a fresh one up to
+        `retries` times; error responses from the server are raised as KVSSError.
+        retry=False runs the request once: a connection lost after it was sent leaves
+        unknown whether the server applied it, so requests that must not run twice
+        (INCR, DECR, APPEND, CAS) are never retried.
+        """
+        retries = self.retries if retry else 0
+        for attempt in range(retries + 1):
+            client = self.acquire()
+            try:
+                result = getattr(client, method)(*args)
+            except KVSSError:
+                lost = not client.connected
+                self.release(client, healthy=not lost)
+                if not lost or attempt == retries:
+                    raise
+            except OSError:
+                self.release(client, healthy=False)
+                if attempt == retries:
+                    raise
+            except BaseException:
+                self.release(client, healthy=False)
+                raise
+            else:
+                self.release(client)
+                return result
+
+    def get(self, key):
+        """Return the value of key, or None if it does not exist"""
+        return self.call('get', key)
+
+    def put(self, key, value, ttl=None):
+        """Store value under key; returns True if the key was created"""
+        return self.call('put', key, value, ttl)
+
+    def delete(self, key):
+        """Delete key; returns True if it existed"""
+        return self.call('delete', key)
+
+    def mget(self, keys):
+        """Fetch many keys in one request; returns {key: value or None}"""
+        return self.call('mget', list(keys))
+
+    def mput(self, items):
+        """Store many pairs atomically; returns {'created': n, 'updated': m}"""
+        return self.call('mput', dict(items))
+
+    def mdel(self, keys):
+        """Delete many keys atomically; returns the number deleted"""
+        return self.call('mdel', list(keys))
+
+    def expire(self, key, seconds):
+        """Set a TTL on key; returns False if the key does not exist"""
+        return self.call('expire', key, seconds)
+
+    def ttl(self, key):
+        """Return the seconds key has left, -1 if it has no TTL, or None if missing"""
+        return self.call('ttl', key)
+
+    def incr(self, key, amount=1):
+        """Atomically add amount to the integer at key; returns the new value"""
+        return self.call('incr', key, amount, retry=False)
+
+    def decr(self, key, amount=1):
+        """Atomically subtract amount from the integer at key; returns the new value"""
+        return self.call('decr', key, amount, retry=False)
+
+    def append(self, key, value):
+        """Atomically append value to key; returns the new length"""
+        return self.call('append', key, value, retry=False)
+
+    def gets(self, key):
+        """Return (value, version) for key, or None if it does not exist"""
+        return self.call('gets', key)
+
+    def cas(self, key, version, value, ttl=None):
+        """Store value only if key still has version; returns the new version or None"""
+        return self.call('cas', key, version, value, ttl, retry=False)
+
+    def scan(self, cursor='0', prefix=None, start=None, end=None, count=None):
+        """Fetch one page of keys in key order; returns (next cursor, keys)"""
+        return self.call('scan', cursor, prefix, start, end, count)
+
+    def scan_iter(self, prefix=None, start=None, end=None, count=None):
+        """Yield every matching key in order; each page may use a different connection"""
+        cursor = '0'
+        while True:
+            cursor, keys = self.scan(cursor, prefix, start, end, count)
+            yield from keys
+            if cursor == '0':
+                return
+
+    def stats(self):
+        """Return the server statistics as a dict of numbers"""
+        return self.call('stats')
+
+    def _reap(self):
+        """Background thread: close idle surplus and dead connections, keep min_connections open"""
+        interval = max(min(self.idle_timeout, self.health_check_interval) / 2, 0.05)
+        while not self.stop_event.wait(interval):
+            now = time.monotonic()
+            with self.condition:
+                keep = deque()
+                while self.idle:
+                    client, returned_at = self.idle.popleft()
+                    idle_for = now - returned_at
+                    surplus = self.size > self.min_connections
+                    if surplus and idle_for > self.idle_timeout:
+                        self._discard(client)
+                    elif idle_for > self.health_check_interval and not client.is_alive():
+                        self._discard(client)
+                    else:
+                        keep.append((client, returned_at))
+                self.idle = keep
+                missing = self.min_connections - self.size
+                self.size += max(missing, 0)
+            for _ in range(missing):
+                try:
+                    client = self._open()
+                except OSError:
+                    with self.condition:
+                        self.size -= 1
+                    continue
+                self.release(client)
+
+    def close(self):
+        """Close idle connections and stop the reaper; checked-out ones close on release"""
+        self.stop_event.set()
+        with self.condition:
+            self.closed = True
+            while self.idle:
+                self._discard(self.idle.popleft()[0])
+            self.condition.notify_all()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+On-demand sampling profiler for the KVSS server (PROFILE)
+"KV/1.0 PROFILE START <seconds>" starts a thread that records the Python stack of
+every other server thread each INTERVAL seconds; when the time is up (or on
+"KV/1.0 PROFILE STOP") the counts are written as folded stacks, one
+"outer;...;inner count" line per distinct stack, which flamegraph.pl and speedscope
+read. Nothing runs while no profile is being taken.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """Samples the stacks of the process's threads for a limited time"""
+
+    # Seconds between samples
+    INTERVAL = 0.005
+    # Longest profile accepted
+    MAX_SECONDS = 3600
+
+    def __init__(self, log=None):
+        self.log = log or (lambda message, level='INFO': None)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = None
+        self.result = None  # (samples, path) of the last profile
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, path):
+        """Profile for seconds, then write the folded stacks to path
+
+        Returns False if a profile is already being taken.
+        """
+        with self.lock:
+            if self.running:
+                return False
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self._run, args=(self.stop_event, seconds, path),
+                                           name="kvss-profiler")
+            self.thread.daemon = True
+            self.thread.start()
+        self.log(f"Profiling for {seconds:g}s into {path}")
+        return True
+
+    def stop(self):
+        """End the current profile now; returns its (samples, path), or None if none runs"""
+        with self.lock:
+            thread = self.thread
+            if thread is None or not thread.is_alive():
+                return None
+            self.stop_event.set()
+        thread.join()
+        return self.result
+
+    def _run(self, stop_event, seconds, path):
+        own = threading.get_ident()
+        stacks = Counter()  # ((code, line), ...) from the outermost frame -> samples
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while not stop_event.wait(self.INTERVAL) and time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append((frame.f_code, frame.f_lineno))
+                    frame = frame.f_back
+                stack.reverse()
+                stacks[tuple(stack)] += 1
+            samples += 1
+        try:
+            self.write(stacks, path)
+        except OSError as e:
+            self.log(f"Cannot write profile {path}: {e}", 'ERROR')
+        self.result = (samples, path)
+        self.log(f"Profile of {samples} samples written to {path}")
+
+    @staticmethod
+    def write(stacks, path):
+        """Write stack counts in the folded format, most sampled first"""
+        labels = {}
+
+        def label(code, line):
+            key = (code, line)
+            if key not in labels:
+                labels[key] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{line})"
+            return labels[key]
+
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{';'.join(label(code, line) for code, line in stack)} {count}\n")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+KV/2.0 binary protocol framing shared by the KVSS server and client
+
+A connection starts in the KV/1.0 text protocol. Sending the line "KV/2.0 HELLO"
+upgrades it: a server that speaks KV/2.0 answers "200 OK KV/2.0" and every later
+message is a length-prefixed binary frame; older servers answer 426 UPGRADE_REQUIRED
+and the connection stays in text mode. "KV/2.0 HELLO COMPRESS" upgrades the same way
+(answered "200 OK KV/2.0 COMPRESS") and also asks for values as the server stores
+them: GET, MGET and GETS values then start with a codec byte (see compression.py).
+
+Request frame (big-endian):  u32 length | u8 opcode | u16 argc | argc * (u32 len | bytes)
+Response frame (big-endian): u32 length | u16 status | body
+where length counts the bytes that follow it. MGET bodies hold one
+(i32 len | bytes) per key, with len -1 for a missing key.
+"""
+
+import struct
+
+
+VERSION = "KV/2.0"
+HELLO = f"{VERSION} HELLO"
+HELLO_COMPRESS = f"{HELLO} COMPRESS"
+
+OPCODES = {
+    'GET': 1,
+    'PUT': 2,
+    'DEL': 3,
+    'MGET': 4,
+    'MPUT': 5,
+    'MDEL': 6,
+    'EXPIRE': 7,
+    'TTL': 8,
+    'STATS': 9,
+    'QUIT': 10,
+    'SCAN': 11,
+    'INCR': 12,
+    'DECR': 13,
+    'INCRBY': 14,
+    'APPEND': 15,
+    'CAS': 16,
+    'GETS': 17,
+    'SLOWLOG': 18,
+    'PROFILE': 19,
+}
+COMMANDS = {code: name for name, code in OPCODES.items()}
+
+STATUS_TEXT = {
+    200: 'OK',
+    201: 'CREATED',
+    204: 'NO_CONTENT',
+    400: 'BAD_REQUEST',
+    403: 'READ_ONLY',
+    404: 'NOT_FOUND',
+    409: 'CONFLICT',
+    426: 'UPGRADE_REQUIRED',
+    500: 'SERVER_ERROR',
+    503: 'BUSY',
+}
+
+LENGTH = struct.Struct('>I')
+REQUEST_HEADER = struct.Struct('>IBH')
+RESPONSE_HEADER = struct.Struct('>IH')
+VALUE_LENGTH = struct.Struct('>i')
+
+
+def to_bytes(value):
+    """Encode str arguments as UTF-8; bytes-like values pass through"""
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def encode_request(command, args=()):
+    """Build a request frame for command (a name from OPCODES) and its arguments"""
+    parts = [to_bytes(arg) for arg in args]
+    body_length = 3 + sum(LENGTH.size + len(part) for part in parts)
+    chunks = [REQUEST_HEADER.pack(body_length, OPCODES[command], len(parts))]
+    for part in parts:
+        chunks.append(LENGTH.pack(len(part)))
+        chunks.append(part)
+    return b''.join(chunks)
+
+
+def parse_request(view, offset, end):
+    """Parse the request frame at view[offset:end] (a memoryview holding a whole frame)
+
+    Returns (command name or None for unknown opcodes, list of argument memoryviews).
+    Raises ValueError if the frame is malformed.
+    """
+    _, opcode, argc = REQUEST_HEADER.unpack_from(view, offset)
+    position = offset + REQUEST_HEADER.size
+    args = []
+    unpack_length = LENGTH.unpack_from
+    for _ in range(argc):
+        if position + 4 > end:
+            raise ValueError("truncated argument length")
+        (length,) = unpack_length(view, position)
+        position += 4
+        if position + length > end:
+            raise ValueError("truncated argument")
+        args.append(view[position:position + length])
+        position += length
+    if position != end:
+        raise ValueError("trailing bytes in frame")
+    return COMMANDS.get(opcode), args
+
+
+def encode_request_header(command, argc, body_length):
+    """Build the fixed header of a request whose arguments total body_length bytes
+    (including their length prefixes), for callers that stream the arguments"""
+    return REQUEST_HEADER.pack(3 + body_length, OPCODES[command], argc)
+
+
+def encode_response(status, body=b''):
+    """Build a response frame"""
+    return RESPONSE_HEADER.pack(2 + len(body), status) + body
+
+
+def encode_response_header(status, body_length):
+    """Build the header of a response frame whose body is sent separately"""
+    return RESPONSE_HEADER.pack(2 + body_length, status)
+
+
+def encode_values(values):
+    """Encode an MGET body: each value length-prefixed, -1 for None"""
+    chunks = []
+    for value in values:
+        if value is None:
+            chunks.append(VALUE_LENGTH.pack(-1))
+        else:
+            value = to_bytes(value)
+            chunks.append(VALUE_LENGTH.pack(len(value)))
+            chunks.append(value)
+    return b''.join(chunks)
+
+
+def decode_values(body):
+    """Decode an MGET body into a list of bytes (None for missing keys)"""
+    values = []
+    position = 0
+    while position < len(body):
+        (length,) = VALUE_LENGTH.unpack_from(body, position)
+        position += VALUE_LENGTH.size
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(bytes(body[position:position + length]))
+            position += length
+    return values
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Leader-follower replication for the KVSS server
+A follower sends "KV/1.0 SYNC" to its leader, which hands the connection over to a
+replication stream: a snapshot of the store followed by every later mutation, in the
+append-only log's record format, with periodic heartbeats that the follower
+acknowledges so both sides can report how far behind it is.
+"""
+
+import select
+import socket
+import threading
+import time
+
+from persistence import encode_record, decode_record
+from store import OP_PUT, OP_DEL, OP_EXPIRE
+
+
+SYNC_COMMAND = "KV/1.0 SYNC"
+
+# Stream-only record types, numbered after the store's mutation ops
+OP_SYNCED = 16     # End of the snapshot; records after it are live mutations
+OP_HEARTBEAT = 17  # value is "<leader offset> <leader time.time()>"
+
+
+class FollowerLink:
+    """Leader-side state of one connected follower"""
+    __slots__ = ('address', 'records', 'size', 'start', 'acked', 'dropped')
+
+    def __init__(self, address):
+        self.address = address
+        self.records = []     # Encoded mutations not yet sent
+        self.size = 0         # Bytes in records
+        self.start = 0        # Leader offset when the follower registered
+        self.acked = 0        # Last offset the follower acknowledged
+        self.dropped = False  # Fell too far behind; the follower must resync
+
+
+class ReplicationLeader:
+    """Streams the store's mutations to followers
+
+    Every mutation is queued for every follower under one lock and numbered by a
+    leader offset; each follower is served by its own thread, which sends queued
+    records in batches and a heartbeat every HEARTBEAT_INTERVAL. The store listener
+    is only installed when the first follower connects.
+    """
+
+    HEARTBEAT_INTERVAL = 0.5
+    # Queued bytes after which a follower is disconnected and has to resync
+    MAX_BACKLOG = 64 * 1024 * 1024
+    # Snapshot records are sent in writes of about this size
+    SNAPSHOT_BATCH = 256 * 1024
+    # A follower that accepts no data for this long is disconnected
+    SEND_TIMEOUT = 30.0
+
+    def __init__(self, store, log=None, shutdown_event=None):
+        self.store = store
+        self.log = log or (lambda message, level='INFO': None)
+        self.shutdown_event = shutdown_event or threading.Event()
+        self.condition = threading.Condition()  # Guards links and offset
+        self.links = []
+        self.offset = 0  # Mutations queued since the first follower connected
+        self.listening = False
+
+    def record(self, op, key, value=''):
+        """Queue a mutation for every follower (store listener, under the shard lock)"""
+        if not self.links:
+            return
+        data = encode_record(op, key, value)
+        with self.condition:
+            self.offset += 1
+            for link in self.links:
+                link.records.append(data)
+                link.size += len(data)
+                if link.size > self.MAX_BACKLOG:
+                    link.dropped = True
+                    link.records = []
+                    link.size = 0
+            self.condition.notify_all()
+
+    def serve(self, sock, address):
+        """Stream the snapshot and live mutations to a follower until it disconnects
+
+        The follower is registered before the snapshot is copied, so mutations racing
+        with the copy are queued as well; replaying them over the snapshot is
+        idempotent.
+        """
+        link = FollowerLink(address)
+        with self.condition:
+            if not self.listening:
+                self.store.add_listener(self.record)
+                self.listening = True
+            link.start = link.acked = self.offset
+            self.links.append(link)
+        self.log(f"Follower {address} connected, starting sync at offset {link.start}")
+        try:
+            sock.settimeout(self.SEND_TIMEOUT)
+            sock.sendall(f"200 OK SYNC {link.start}\n".encode('utf-8'))
+            count = self._send_snapshot(sock)
+            self.log(f"Sent snapshot of {count} keys to follower {address}")
+
+            acks = bytearray()
+            next_heartbeat = 0.0
+            while not self.shutdown_event.is_set():
+                with self.condition:
+                    if not link.records and not link.dropped:
+                        self.condition.wait(max(next_heartbeat - time.time(), 0.0))
+                    if link.dropped:
+                        raise ConnectionError("follower fell too far behind")
+                    batch = link.records
+                    link.records = []
+                    link.size = 0
+                    offset = self.offset
+                if batch:
+                    sock.sendall(b''.join(batch))
+                now = time.time()
+                if now >= next_heartbeat:
+                    sock.sendall(encode_record(OP_HEARTBEAT, '', f"{offset} {now!r}"))
+                    next_heartbeat = now + self.HEARTBEAT_INTERVAL
+                self._read_acks(sock, link, acks)
+        except OSError as e:
+            self.log(f"Follower {address} disconnected: {e}", 'WARNING')
+        finally:
+            with self.condition:
+                self.links.remove(link)
+            sock.close()
+
+    def _send_snapshot(self, sock):
+        """Send every live key (and its expiry), then the end-of-snapshot marker"""
+        batch = []
+        size = 0
+        count = 0
+        for key, value, expires_at in self.store.entries():
+            batch.append(encode_record(OP_PUT, key, value))
+            if expires_at is not None:
+                batch.append(encode_record(OP_EXPIRE, key, repr(expires_at)))
+            size += len(value)
+            count += 1
+            if size >= self.SNAPSHOT_BATCH:
+                sock.sendall(b''.join(batch))
+                batch = []
+                size = 0
+        batch.append(encode_record(OP_SYNCED, ''))
+        sock.sendall(b''.join(batch))
+        return count
+
+    def _read_acks(self, sock, link, acks):
+        """Consume "ACK <offset>" lines the follower has sent, without blocking"""
+        while select.select([sock], [], [], 0)[0]:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("closed by follower")
+            acks += data
+            end = acks.rfind(b'\n')
+            if end < 0:
+                continue
+            lines = acks[:end].split(b'\n')
+            del acks[:end + 1]
+            _, _, offset = lines[-1].decode('utf-8').partition(' ')
+            link.acked = int(offset)
+
+    def drop_all(self):
+        """Disconnect every follower, e.g. after this node's own store was replaced"""
+        with self.condition:
+            for link in self.links:
+                link.dropped = True
+            self.condition.notify_all()
+
+    def stats(self):
+        """Return {'replicas': n, 'repl_offset': offset, 'repl_lag': records} for STATS
+
+        repl_lag is how many mutations the furthest-behind follower has not yet
+        acknowledged.
+        """
+        with self.condition:
+            offset = self.offset
+            lag = max((offset - link.acked for link in self.links), default=0)
+            return {'replicas': len(self.links), 'repl_offset': offset, 'repl_lag': lag}
+
+
+class ReplicationFollower:
+    """Keeps the store a read-only copy of a leader's
+
+    A background thread connects to the leader, replaces the store's contents with
+    the leader's snapshot and then applies its mutation stream. Any error (leader
+    restart, network failure, falling too far behind) leads to a reconnect and a
+    full resync.
+    """
+
+    RETRY_INTERVAL = 1.0
+    # No data for this long (heartbeats come every 0.5s) means the leader is gone
+    READ_TIMEOUT = 5.0
+    RECV_SIZE = 256 * 1024
+
+    def __init__(self, store, host, port, log=None, shutdown_event=None, on_resync=None):
+        """on_resync: called after the store is cleared for a full resync"""
+        self.store = store
+        self.host = host
+        self.port = port
+        self.log = log or (lambda message, level='INFO': None)
+        self.shutdown_event = shutdown_event or threading.Event()
+        self.on_resync = on_resync
+        self.sock = None
+        self.thread = None
+        self.synced = False
+        self.offset = 0          # Leader offset applied so far
+        self.leader_offset = 0   # Leader offset in the last heartbeat
+        self.lag = 0.0           # Seconds between the last heartbeat being sent and applied
+        self.last_io = None      # time.time() of the last data from the leader
+        self.syncs = 0           # Full resyncs performed
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="kvss-replication")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        sock = self.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _run(self):
+        while not self.shutdown_event.is_set():
+            try:
+                self._replicate()
+            except (OSError, ValueError) as e:
+                if not self.shutdown_event.is_set():
+                    self.log(f"Replication from {self.host}:{self.port} interrupted: {e}", 'WARNING')
+            finally:
+                self.synced = False
+                if self.sock:
+                    self.sock.close()
+                    self.sock = None
+            self.shutdown_event.wait(self.RETRY_INTERVAL)
+
+    def _replicate(self):
+        """Run one sync session: connect, load the snapshot, then follow the stream"""
+        self.sock = sock = socket.create_connection((self.host, self.port), timeout=self.READ_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(f"{SYNC_COMMAND}\n".encode('utf-8'))
+
+        buffer = bytearray()
+        while b'\n' not in buffer:
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionError("closed by leader")
+            buffer += data
+        line, _, rest = bytes(buffer).partition(b'\n')
+        parts = line.decode('utf-8').split()
+        if parts[:3] != ['200', 'OK', 'SYNC']:
+            raise ConnectionError(f"leader refused SYNC: {line.decode('utf-8', 'replace')}")
+        buffer = bytearray(rest)
+        self.offset = self.leader_offset = int(parts[3])
+        self.store.clear()
+        if self.on_resync:
+            self.on_resync()
+        self.syncs += 1
+        self.last_io = time.time()
+        self.log(f"Syncing from leader {self.host}:{self.port} at offset {self.offset}")
+        start = time.perf_counter()
+
+        store = self.store
+        chunk = bytearray(self.RECV_SIZE)
+        while True:
+            offset = 0
+            while True:
+                record = decode_record(buffer, offset)
+                if record is None:
+                    break
+                op, key, value, offset = record
+                if op == OP_PUT:
+                    store.put(key, value)
+                elif op == OP_DEL:
+                    store.delete(key)
+                elif op == OP_EXPIRE:
+                    store.expire_at(key, float(value))
+                elif op == OP_HEARTBEAT:
+                    leader_offset, sent_at = value.split()
+                    self.leader_offset = int(leader_offset)
+                    self.lag = max(time.time() - float(sent_at), 0.0)
+                    sock.sendall(f"ACK {self.offset}\n".encode('utf-8'))
+                    continue
+                elif op == OP_SYNCED:
+                    self.synced = True
+                    self.log(f"Synced {len(store)} keys from leader in "
+                             f"{time.perf_counter() - start:.3f}s")
+                    continue
+                if self.synced:
+                    self.offset += 1
+            del buffer[:offset]
+
+            received = sock.recv_into(chunk)
+            if not received:
+                raise ConnectionError("closed by leader")
+            buffer += memoryview(chunk)[:received]
+            self.last_io = time.time()
+
+    def stats(self):
+        """Return the follower's replication state for STATS
+
+        repl_lag is the delay of the last heartbeat in seconds (meaningful when both
+        hosts' clocks agree); repl_last_io is the seconds since the leader last sent
+        anything, -1 while disconnected.
+        """
+        last_io = time.time() - self.last_io if self.sock and self.last_io else -1
+        return {
+            'repl_synced': int(self.synced),
+            'repl_offset': self.offset,
+            'repl_lag': round(self.lag, 4),
+            'repl_lag_records': max(self.leader_offset - self.offset, 0),
+            'repl_last_io': round(last_io, 3),
+            'repl_syncs': self.syncs,
+        }
@@ -4,58 +4,252 @@ Mini Key-Value Store Service (KVSS) Server
 Implements a TCP-based key-value store with text-based protocol
 """
 
+import argparse
+import asyncio
+import json
+import signal
 import socket
 import threading
 import sys
 import time
+from time import perf_counter_ns
 from datetime import datetime
 import os
+from random import random
+
+from log_writer import LogWriter, LOG_LEVELS, abbreviate
+from store import ShardedStore, StatsCounters, STORAGE_ENGINES
+from eviction import EVICTION_POLICIES
+import protocol
+from persistence import Persistence, FSYNC_POLICIES
+from replication import ReplicationLeader, ReplicationFollower, SYNC_COMMAND
+from notify import Notifier, SUBSCRIBE_PREFIX, DEFAULT_QUEUE_LIMIT
+from transfer import BulkTransfer, DUMP_COMMAND, LOAD_COMMAND, parse_dump
+from slowlog import SlowLog, DEFAULT_THRESHOLD_MS, DEFAULT_SIZE as DEFAULT_SLOWLOG_SIZE
+from profiler import SamplingProfiler
+from limits import (ConnectionTracker, BUSY, FOREVER, DEFAULT_BACKLOG,
+                    DEFAULT_MAX_CONNECTIONS, DEFAULT_READ_TIMEOUT, DEFAULT_MAX_OUTPUT_BUFFER)
+from workers import PartitionedStore, merge_stats, partition_for, KEY_COMMANDS
+from client import parse_counts
+from metrics import CommandMetrics, MetricsServer, render_prometheus
+from index import prefix_end, encode_cursor, decode_cursor
+from compression import CODECS, DEFAULT_COMPRESS_MIN_SIZE, Compressed, to_wire
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+SERVER_MODES = ('threaded', 'asyncio')
+
+# Default largest value accepted by PUT/MPUT
+DEFAULT_MAX_VALUE_SIZE = 16 * 1024 * 1024
+# Large responses are written in pieces of this size
+SEND_CHUNK_SIZE = 256 * 1024
+# Keys returned by SCAN without COUNT, and the largest COUNT accepted
+DEFAULT_SCAN_COUNT = 100
+MAX_SCAN_COUNT = 1000
+# Commands refused with 403 READ_ONLY by a follower
+WRITE_COMMANDS = frozenset(('PUT', 'PUTEX', 'DEL', 'MPUT', 'MDEL', 'EXPIRE', 'INCR', 'DECR',
+                            'INCRBY', 'APPEND', 'CAS', 'CASEX'))
+
+
+class ClientSession:
+    """Per-connection state shared by both server engines"""
+    __slots__ = ('address', 'buffer', 'binary', 'compressed', 'scanned', 'discarding', 'skip',
+                 'replica', 'subscriber', 'transfer', 'limiter', 'deadline', 'request_deadline',
+                 'more', 'timer')
+
+    def __init__(self, address):
+        self.address = address
+        self.buffer = bytearray()  # Received bytes not yet processed, reused for the connection
+        self.binary = False        # True once upgraded to the KV/2.0 binary protocol
+        self.compressed = False    # Upgraded with HELLO COMPRESS: values are sent as stored
+        self.scanned = 0           # Leading bytes of buffer already searched for a newline
+        self.discarding = False    # Skipping the rest of an oversized text request
+        self.skip = 0              # Bytes of an oversized KV/2.0 frame still to drop
+        self.replica = False       # Sent SYNC: the connection becomes a replication stream
+        self.subscriber = False    # Sent SUBSCRIBE: the connection becomes a notification stream
+        self.transfer = None       # Sent DUMP or LOAD: the request handed to BulkTransfer
+        self.limiter = None        # RateLimiter of a client connection with --rate-limit
+        self.deadline = FOREVER    # When the connection times out (see ConnectionTracker)
+        self.request_deadline = FOREVER  # Of the partial request in buffer
+        self.more = False          # Stopped at max_output_buffer: requests remain in buffer
+        self.timer = None          # RequestTimer feeding the slow log (None when disabled)
 
 
 class KVSSServer:
-    def __init__(self, host='127.0.0.1', port=5050, log_file=None):
+    # Seconds between active expiry cycles (lazy expiry also happens on access)
+    EXPIRE_INTERVAL = 0.1
+    # Bytes read per recv; large enough to drain many pipelined requests at once
+    RECV_BUFFER_SIZE = 65536
+    # Room for the key and other arguments of a request on top of its value
+    REQUEST_OVERHEAD = 64 * 1024
+
+    def __init__(self, host='127.0.0.1', port=5050, log_file=None, mode='threaded',
+                 log_level='INFO', trace_sample=1.0, latency_sample=0.05, shards=16,
+                 data_dir=None, fsync='interval', fsync_interval=1.0,
+                 max_keys=None, max_memory=None, eviction='lru',
+                 max_value_size=DEFAULT_MAX_VALUE_SIZE, replica_of=None,
+                 worker_index=0, peers=None, peer_socket=None, metrics_port=None,
+                 subscriber_queue=DEFAULT_QUEUE_LIMIT, compression=None,
+                 compress_min_size=DEFAULT_COMPRESS_MIN_SIZE, storage='dict',
+                 backlog=DEFAULT_BACKLOG, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 idle_timeout=None, read_timeout=DEFAULT_READ_TIMEOUT, rate_limit=None,
+                 max_output_buffer=DEFAULT_MAX_OUTPUT_BUFFER,
+                 slowlog_threshold=DEFAULT_THRESHOLD_MS, slowlog_size=DEFAULT_SLOWLOG_SIZE,
+                 profile_dir='.'):
+        if mode not in SERVER_MODES:
+            raise ValueError(f"Unknown server mode '{mode}', expected one of {SERVER_MODES}")
         self.host = host
         self.port = port
-        self.data_store = {}  # In-memory key-value store
+        self.mode = mode
+        # Largest value accepted; bounds text lines and KV/2.0 frames as well
+        self.max_value_size = max_value_size
+        self.max_request_size = max_value_size + self.REQUEST_OVERHEAD
+        # Accept queue length, and response bytes produced per connection before the
+        # rest of its requests wait for them to be sent
+        self.backlog = backlog
+        self.max_output_buffer = max_output_buffer
+        # In-memory key-value store, one lock per shard, optionally bounded, compressed
+        # and packed into arenas
+        self.data_store = ShardedStore(shards, max_keys=max_keys, max_memory=max_memory,
+                                       eviction=eviction, compression=compression,
+                                       compress_min_size=compress_min_size, storage=storage)
+        # Worker mode (see run_workers): this process owns one partition of the keyspace,
+        # shares the port with the other workers and serves them on peer_socket
+        self.worker_index = worker_index
+        self.peers = peers
+        self.peer_socket = peer_socket
+        if peers:
+            self.data_store = PartitionedStore(self.data_store, worker_index, peers)
+        # Optional append-only log + snapshot persistence (None keeps data in memory only)
+        self.persistence = None
+        if data_dir:
+            self.persistence = Persistence(data_dir, fsync=fsync, fsync_interval=fsync_interval,
+                                           log=self.safe_log)
         self.server_socket = None
         self.running = False
+        self.shutdown_event = threading.Event()  # Stops background maintenance threads
+        # Streams mutations to followers that connect with SYNC
+        self.replication = ReplicationLeader(self.data_store, log=self.safe_log,
+                                             shutdown_event=self.shutdown_event)
+        # Pushes key changes to connections that sent SUBSCRIBE
+        self.notifier = Notifier(self.data_store, subscriber_queue, log=self.safe_log,
+                                 shutdown_event=self.shutdown_event,
+                                 worker_index=worker_index, peers=peers)
+        # Streams the keyspace out (DUMP) or in (LOAD) for connections that ask
+        self.transfers = BulkTransfer(self.data_store, log=self.safe_log, peers=peers,
+                                      worker_index=worker_index)
+        # With replica_of ('host:port' of the leader) this node is a read-only follower
+        self.follower = None
+        if replica_of:
+            leader_host, _, leader_port = replica_of.rpartition(':')
+            self.follower = ReplicationFollower(self.data_store, leader_host or '127.0.0.1',
+                                                int(leader_port), log=self.safe_log,
+                                                shutdown_event=self.shutdown_event,
+                                                on_resync=self.reset_downstream)
+        self.read_only = self.follower is not None
         self.print_lock = threading.Lock()  # Lock for thread-safe printing
         self.log_file = log_file or f"kvss_server_{host}_{port}.log"
-        self.stats = {
-            'start_time': None,
-            'connections': 0,
-            'commands_processed': 0,
-            'get_requests': 0,
-            'put_requests': 0,
-            'del_requests': 0
-        }
+        # Per-request REQUEST/RESPONSE tracing is sampled; 0 disables it
+        self.logger = LogWriter(self.log_file, level=log_level, sample_rate=trace_sample)
+        self.start_time = None
+        self.stats = StatsCounters([
+            'connections',
+            'commands_processed',
+            'get_requests',
+            'put_requests',
+            'del_requests',
+            'mget_requests',
+            'mput_requests',
+            'mdel_requests',
+            'expire_requests',
+            'ttl_requests',
+            'stats_requests',
+            'scan_requests',
+            'incr_requests',
+            'append_requests',
+            'cas_requests',
+            'gets_requests',
+            'connections_active',
+            'bytes_in',
+            'bytes_out',
+            'overflows',
+            'rejected_connections',
+            'timeouts',
+            'rate_limited',
+        ])
+        # Client connections: counted against max_connections, rate limited and closed
+        # by a sweeper thread once idle or stalled past their timeout
+        self.connections = ConnectionTracker(max_connections, idle_timeout, read_timeout,
+                                             rate_limit, stats=self.stats, log=self.safe_log,
+                                             shutdown_event=self.shutdown_event)
+        # Latency histogram per command, reported by STATS VERBOSE and /metrics; only a
+        # sampled fraction of requests is timed, keeping the cost off most requests
+        self.command_metrics = CommandMetrics(protocol.OPCODES)
+        self.latency_sample = latency_sample
+        # Requests slower than slowlog_threshold (ms), with their time split into
+        # parse, execute, log and send (SLOWLOG)
+        self.slowlog = SlowLog(slowlog_threshold, slowlog_size)
+        # Stack sampling on demand (PROFILE); profiles are written to profile_dir
+        self.profiler = SamplingProfiler(log=self.safe_log)
+        self.profile_dir = profile_dir
+        # Optional Prometheus endpoint on a side port (None disables it)
+        self.metrics_port = metrics_port
+        self.metrics_server = None
     
     def safe_print(self, message):
         """Thread-safe printing with immediate flush"""
         with self.print_lock:
             print(message, flush=True)
     
-    def safe_log(self, message):
-        """Thread-safe logging to both console and file"""
-        with self.print_lock:
-            print(message, flush=True)
-            try:
-                with open(self.log_file, 'a', encoding='utf-8') as f:
-                    f.write(f"{message}\n")
-            except Exception as e:
-                print(f"Warning: Could not write to log file {self.log_file}: {e}", flush=True)
+    def safe_log(self, message, level='INFO'):
+        """Queue a message for the background writer (console and file)"""
+        self.logger.log(message, level)
     
     def start(self):
-        """Start the KVSS server"""
+        """Start the KVSS server using the configured engine"""
+        if self.persistence:
+            data, expires = self.persistence.recover()
+            self.data_store.load(data.items(), expires)
+            self.persistence.open(self.data_store)
+        if self.follower:
+            self.follower.start()
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.host, self.metrics_port,
+                                                self.prometheus_metrics, log=self.safe_log)
+            self.metrics_server.start()
+        if self.peer_socket:
+            peer_thread = threading.Thread(target=self.serve_peers, name="kvss-peers")
+            peer_thread.daemon = True
+            peer_thread.start()
+        expiry_thread = threading.Thread(target=self.expire_keys, name="kvss-expiry")
+        expiry_thread.daemon = True
+        expiry_thread.start()
+        timeout_thread = threading.Thread(target=self.connections.run, name="kvss-timeouts")
+        timeout_thread.daemon = True
+        timeout_thread.start()
+        if self.mode == 'asyncio':
+            self.start_asyncio()
+        else:
+            self.start_threaded()
+
+    def start_threaded(self):
+        """Start the KVSS server with one thread per client connection"""
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.peers:
+                # Every worker listens on the port; the kernel spreads connections
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             self.server_socket.settimeout(1.0)  # Set timeout to make it interruptible
             self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket.listen(self.backlog)
             
             self.running = True
-            self.stats['start_time'] = datetime.now()
+            self.start_time = datetime.now()
             
             self.safe_log(f"KVSS Server started on {self.host}:{self.port}")
             self.safe_log("Waiting for connections... (Press Ctrl+C to stop)")
@@ -63,13 +257,26 @@ class KVSSServer:
             while self.running:
                 try:
                     client_socket, address = self.server_socket.accept()
-                    self.stats['connections'] += 1
+                    session = ClientSession(address)
+                    if not self.connections.admit(session, lambda sock=client_socket:
+                                                  sock.shutdown(socket.SHUT_RDWR)):
+                        self.safe_log(f"Refused connection from {address}: too many connections",
+                                      'DEBUG')
+                        try:
+                            client_socket.send(f"{BUSY}\n".encode('utf-8'))
+                        except OSError:
+                            pass
+                        client_socket.close()
+                        continue
+                    # Responses are already coalesced per read; Nagle would only delay them
+                    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.stats.incr('connections')
                     self.safe_log(f"Connection from {address}")
                     
                     # Handle each client in a separate thread
                     client_thread = threading.Thread(
                         target=self.handle_client,
-                        args=(client_socket, address)
+                        args=(client_socket, address, session)
                     )
                     client_thread.daemon = True
                     client_thread.start()
@@ -79,70 +286,681 @@ class KVSSServer:
                     continue
                 except socket.error:
                     if self.running:
-                        self.safe_log("Error accepting connection")
+                        self.safe_log("Error accepting connection", 'ERROR')
                     
         except Exception as e:
-            self.safe_log(f"Server error: {e}")
+            self.safe_log(f"Server error: {e}", 'ERROR')
         finally:
             self.stop()
     
+    def serve_peers(self):
+        """Background thread: serve requests forwarded by the other workers
+
+        Peer connections get their own threads even in asyncio mode, so a worker
+        blocked forwarding to a peer can never deadlock with one forwarding back.
+        """
+        self.peer_socket.settimeout(1.0)
+        self.safe_log(f"Worker {self.worker_index} of {len(self.peers)} serving peers on "
+                      f"port {self.peer_socket.getsockname()[1]}")
+        while not self.shutdown_event.is_set():
+            try:
+                peer, address = self.peer_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            peer.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            thread = threading.Thread(target=self.handle_client, args=(peer, address))
+            thread.daemon = True
+            thread.start()
+    
+    def reset_downstream(self):
+        """The store was replaced wholesale (follower resync): followers resync and
+        subscribers drop what they cached"""
+        self.replication.drop_all()
+        self.notifier.reset_all()
+    
     def stop(self):
         """Stop the KVSS server"""
         self.safe_log("\nShutting down server...")
         self.running = False
+        self.shutdown_event.set()
+        if self.follower:
+            self.follower.stop()
         if self.server_socket:
             try:
                 self.server_socket.close()
             except:
                 pass
+        if self.peer_socket:
+            self.peer_socket.close()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        if self.persistence:
+            self.persistence.close()
         self.safe_log("Server stopped")
+        self.logger.flush()
+    
+    def expire_keys(self):
+        """Background thread: actively remove expired keys in time-bounded cycles"""
+        while not self.shutdown_event.wait(self.EXPIRE_INTERVAL):
+            try:
+                self.data_store.expire_cycle()
+            except Exception as e:
+                self.safe_log(f"Expiry cycle failed: {e}", 'ERROR')
+    
+    def start_asyncio(self):
+        """Start the KVSS server on a single asyncio event loop"""
+        try:
+            asyncio.run(self.serve_asyncio())
+        except Exception as e:
+            self.safe_log(f"Server error: {e}", 'ERROR')
+        finally:
+            self.stop()
     
-    def handle_client(self, client_socket, address):
-        """Handle client connection and requests"""
-        buffer = ""  # Buffer to accumulate incomplete commands
+    async def serve_asyncio(self):
+        """Accept and serve connections until the server is stopped"""
+        raise_fd_limit()
+        server = await asyncio.start_server(
+            self.handle_client_async, self.host, self.port,
+            reuse_address=True, reuse_port=bool(self.peers) or None,
+            backlog=self.backlog
+        )
+        self.server_socket = None
+        self.running = True
+        self.start_time = datetime.now()
+        
+        self.safe_log(f"KVSS Server started on {self.host}:{self.port} (asyncio mode)")
+        self.safe_log("Waiting for connections... (Press Ctrl+C to stop)")
+        
+        async with server:
+            # Poll the running flag so stop() from another thread is honored
+            while self.running:
+                await asyncio.sleep(1.0)
+    
+    def handle_client(self, client_socket, address, session=None):
+        """Handle client connection and requests
+
+        session: the ClientSession admitted by the connection tracker; peer connections
+        between workers pass none and are exempt from connection limits.
+        """
+        if session is None:
+            session = ClientSession(address)
+        session.timer = timer = self.slowlog.timer(address)
+        # Preallocated receive buffer, reused for every read on this connection
+        chunk = bytearray(self.RECV_BUFFER_SIZE)
+        chunk_view = memoryview(chunk)
+        stats = self.stats
+        connections = self.connections
+        stats.incr('connections_active')
         try:
             with client_socket:
                 while self.running:
                     # Receive data from client
-                    data = client_socket.recv(1024).decode('utf-8')
-                    if not data:
+                    received = client_socket.recv_into(chunk)
+                    if not received:
                         break
+                    stats.incr('bytes_in', received)
+                    
+                    # Process every complete request, answering them with a single send
+                    # (several if their responses exceed max_output_buffer)
+                    session.buffer += chunk_view[:received]
+                    size = len(session.buffer)
+                    while True:
+                        session.deadline = FOREVER  # No timeout while the server works
+                        responses, closing = self.process_buffer(session)
+                        connections.sending(session)
+                        sending = perf_counter_ns() if timer is not None else 0
+                        for piece in send_chunks(responses):
+                            client_socket.sendall(piece)
+                            stats.incr('bytes_out', len(piece))
+                        if timer is not None:
+                            timer.sent(perf_counter_ns() - sending)
+                        if not session.more:
+                            break
+                        session.more = False
                     
-                    # Add received data to buffer
-                    buffer += data
+                    if session.replica:
+                        self.replication.serve(client_socket, address)
+                        return
+                    if session.subscriber:
+                        self.notifier.serve(client_socket, address, session.buffer)
+                        return
+                    if session.transfer:
+                        self.transfers.serve(client_socket, address, session.transfer,
+                                             session.buffer)
+                        return
                     
-                    # Process complete lines (ending with \n)
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        line = line.strip()
-                        
-                        if line:  # Only process non-empty lines
-                            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            self.safe_log(f"[{timestamp}] [REQUEST] from {address}: {line}")
-                            response = self.process_request(line)
-                            self.safe_log(f"[{timestamp}] [RESPONSE] to {address}: {response}")
-                            client_socket.send(f"{response}\n".encode('utf-8'))
-                            
-                            # Close connection if QUIT command was processed
-                            if self.is_quit_command(line):
-                                self.safe_log(f"Client {address} sent QUIT command, closing connection")
-                                buffer = ""  # Clear buffer before closing
-                                return  # Exit the function, which closes the connection
+                    # Close connection if QUIT command was processed
+                    if closing:
+                        self.safe_log(f"Client {address} sent QUIT command, closing connection")
+                        return  # Exit the function, which closes the connection
                     
-                    # Clear buffer if it gets too large (prevent memory issues)
-                    if len(buffer) > 4096:  # 4KB limit
-                        self.safe_log(f"Buffer overflow from {address}, clearing buffer")
-                        buffer = ""
-        except ConnectionResetError:
+                    self.check_overflow(session)
+                    # A partial request left over is new if it arrived into an empty
+                    # buffer or after complete requests
+                    connections.waiting(session, received == size or len(session.buffer) < size)
+        except (ConnectionResetError, BrokenPipeError):
+            self.safe_log(f"Client {address} disconnected")
+        except Exception as e:
+            self.safe_log(f"Error handling client {address}: {e}", 'ERROR')
+        finally:
+            connections.remove(session)
+            stats.incr('connections_active', -1)
+            self.safe_log(f"Connection with {address} closed")
+    
+    async def handle_client_async(self, reader, writer):
+        """Handle a client connection on the asyncio event loop"""
+        address = writer.get_extra_info('peername')
+        session = ClientSession(address)
+        connections = self.connections
+        loop = asyncio.get_running_loop()
+        if not connections.admit(session, lambda: loop.call_soon_threadsafe(writer.transport.abort)):
+            self.safe_log(f"Refused connection from {address}: too many connections", 'DEBUG')
+            writer.write(f"{BUSY}\n".encode('utf-8'))
+            writer.close()
+            return
+        self.stats.incr('connections')
+        self.safe_log(f"Connection from {address}")
+        
+        session.timer = timer = self.slowlog.timer(address)
+        stats = self.stats
+        stats.incr('connections_active')
+        try:
+            while self.running:
+                data = await reader.read(self.RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                stats.incr('bytes_in', len(data))
+                
+                session.buffer += data
+                size = len(session.buffer)
+                while True:
+                    session.deadline = FOREVER  # No timeout while the server works
+                    if self.peers:
+                        # Forwarding and multi-key commands wait on other workers:
+                        # keep the event loop free for the other connections meanwhile
+                        responses, closing = await loop.run_in_executor(
+                            None, self.process_buffer, session)
+                    else:
+                        responses, closing = self.process_buffer(session)
+                    connections.sending(session)
+                    sending = perf_counter_ns() if timer is not None else 0
+                    for piece in send_chunks(responses):
+                        writer.write(piece)
+                        stats.incr('bytes_out', len(piece))
+                        await writer.drain()
+                    if timer is not None:
+                        timer.sent(perf_counter_ns() - sending)
+                    if not session.more:
+                        break
+                    session.more = False
+                
+                if session.replica:
+                    await self.hand_off(writer, self.replication.serve, address,
+                                        name="kvss-replication-leader")
+                    return
+                if session.subscriber:
+                    await self.notifier.serve_async(reader, writer, address, session.buffer)
+                    return
+                if session.transfer:
+                    await self.hand_off(writer, self.transfers.serve, address, session.transfer,
+                                        bytes(session.buffer), name="kvss-transfer")
+                    return
+                
+                if closing:
+                    self.safe_log(f"Client {address} sent QUIT command, closing connection")
+                    return
+                
+                self.check_overflow(session)
+                connections.waiting(session, len(data) == size or len(session.buffer) < size)
+        except (ConnectionResetError, BrokenPipeError):
             self.safe_log(f"Client {address} disconnected")
         except Exception as e:
-            self.safe_log(f"Error handling client {address}: {e}")
+            self.safe_log(f"Error handling client {address}: {e}", 'ERROR')
         finally:
+            connections.remove(session)
+            stats.incr('connections_active', -1)
+            writer.close()
             self.safe_log(f"Connection with {address} closed")
     
-    def process_request(self, request):
+    async def hand_off(self, writer, target, *args, name):
+        """Move a connection off the event loop to a thread running target(sock, *args)
+
+        Replication and transfer streams block on the client, so they are served from
+        a duplicate of the socket on their own thread; closing the transport afterwards
+        leaves it open. The transport stops reading first, so whatever the client sends
+        next reaches the thread.
+        """
+        writer.transport.pause_reading()
+        writer.transport.set_write_buffer_limits(0)
+        await writer.drain()  # Earlier responses must precede the stream
+        fd = os.dup(writer.get_extra_info('socket').fileno())
+        sock = socket.socket(fileno=fd)
+        sock.setblocking(True)
+        thread = threading.Thread(target=target, args=(sock,) + args, name=name)
+        thread.daemon = True
+        thread.start()
+    
+    def check_overflow(self, session):
+        """Stop buffering a text request that has grown past max_request_size
+
+        The rest of the line is skipped as it arrives and answered with a single
+        400 BAD_REQUEST, so pipelined responses stay in order.
+        """
+        if not session.binary and len(session.buffer) > self.max_request_size:
+            self.safe_log(f"Request over {self.max_request_size} bytes from {session.address}, "
+                          f"discarding it", 'WARNING')
+            self.stats.incr('overflows')
+            session.buffer.clear()
+            session.scanned = 0
+            session.discarding = True
+    
+    def process_buffer(self, session):
+        """Process every complete request in session.buffer (pipelined requests)
+
+        Consumes the processed bytes from the buffer and returns (responses, closing):
+        the response chunks for all complete requests, in order, and whether a QUIT
+        was processed (requests after it are discarded). Once the responses reach
+        max_output_buffer bytes the remaining requests stay in the buffer and
+        session.more is set, so they are processed after these responses are sent.
+        """
+        if session.binary:
+            return self.process_frames(session)
+        
+        buffer = session.buffer
+        # Bytes before session.scanned hold no newline; only search what arrived since
+        end = buffer.rfind(b'\n', session.scanned)
+        if end < 0:
+            session.scanned = len(buffer)
+            return [], False
+        lines = buffer[:end].split(b'\n')
+        del buffer[:end + 1]
+        session.scanned = len(buffer)
+        
+        responses = []
+        output = 0
+        timer = session.timer
+        limiter = session.limiter
+        if limiter is not None:
+            limiter.refill()
+        # Worker mode: requests for keys owned by other workers, by owner
+        forwards = {} if self.peers else None
+        if session.discarding:
+            # Tail of an oversized request
+            lines.pop(0)
+            responses.append("400 BAD_REQUEST")
+            session.discarding = False
+        for index, raw_line in enumerate(lines):
+            line = raw_line.decode('utf-8').strip()
+            if not line:  # Only process non-empty lines
+                continue
+            if limiter is not None and not limiter.take() and not self.is_quit_command(line):
+                self.stats.incr('rate_limited')
+                responses.append(BUSY)
+                continue
+            if forwards is not None:
+                parts = line.split(None, 3)
+                owner = None
+                if len(parts) >= 3 and parts[0] == "KV/1.0" and parts[1] in KEY_COMMANDS:
+                    owner = partition_for(parts[2], len(self.peers))
+                if owner is not None and owner != self.worker_index:
+                    # Placeholder, filled in by one pipelined exchange per owner
+                    forwards.setdefault(owner, []).append((len(responses), raw_line + b'\n'))
+                    responses.append(None)
+                    continue
+                if owner is None and forwards:
+                    # Anything but a local single-key request may touch queued keys
+                    self.forward_requests(forwards, responses, False)
+            if timer is not None:
+                timer.begin()
+            if line == SYNC_COMMAND:
+                # Replication: the connection is handed to the leader's stream
+                session.replica = True
+                buffer.clear()
+                payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+                return [payload], True
+            if line == LOAD_COMMAND or line == DUMP_COMMAND or line.startswith(DUMP_COMMAND + ' '):
+                # Bulk transfer: the connection is handed to BulkTransfer, with any bytes
+                # after this line (LOAD data) left in the buffer
+                if line == LOAD_COMMAND:
+                    if self.read_only:
+                        responses.append("403 READ_ONLY")
+                        continue
+                    session.transfer = ('LOAD',)
+                else:
+                    options = parse_dump(line)
+                    if options is None:
+                        responses.append("400 BAD_REQUEST")
+                        continue
+                    session.transfer = ('DUMP',) + options
+                rest = b'\n'.join(lines[index + 1:])
+                if index + 1 < len(lines):
+                    rest += b'\n'
+                buffer[:0] = rest
+                payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+                return [payload], False
+            if line.startswith(SUBSCRIBE_PREFIX):
+                # Notifications: this and any later requests are the notifier's
+                session.subscriber = True
+                rest = b'\n'.join(lines[index:]) + b'\n'
+                buffer[:0] = rest
+                payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+                return [payload], False
+            if line == protocol.HELLO or line == protocol.HELLO_COMPRESS:
+                # Upgrade to KV/2.0: everything after this line is binary frames
+                session.compressed = line == protocol.HELLO_COMPRESS
+                responses.append(f"200 OK {protocol.VERSION}"
+                                 + (" COMPRESS" if session.compressed else ""))
+                session.binary = True
+                rest = b'\n'.join(lines[index + 1:])
+                if index + 1 < len(lines):
+                    rest += b'\n'
+                buffer[:0] = rest
+                payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+                frames, closing = self.process_frames(session)
+                return [payload] + frames, closing
+            responses.append(self.handle_line(line, session.address, timer))
+            if timer is not None:
+                timer.finish(line)
+            if self.is_quit_command(line):
+                buffer.clear()
+                payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+                return [payload], True
+            output += len(responses[-1])
+            if output >= self.max_output_buffer and index + 1 < len(lines):
+                # The rest waits until these responses are sent
+                buffer[:0] = b'\n'.join(lines[index + 1:]) + b'\n'
+                session.scanned = 0
+                session.more = True
+                break
+        if forwards:
+            self.forward_requests(forwards, responses, False)
+        payload = ''.join(f"{response}\n" for response in responses).encode('utf-8')
+        return [payload], False
+    
+    def process_frames(self, session):
+        """Process every complete KV/2.0 frame in session.buffer; see process_buffer"""
+        buffer = session.buffer
+        if session.skip:
+            dropped = min(session.skip, len(buffer))
+            del buffer[:dropped]
+            session.skip -= dropped
+            if session.skip:
+                return [], False
+        size = len(buffer)
+        view = memoryview(buffer)
+        unpack_length = protocol.LENGTH.unpack_from
+        responses = []
+        forwards = {} if self.peers else None
+        offset = 0
+        output = 0
+        closing = False
+        args = None
+        timer = session.timer
+        limiter = session.limiter
+        if limiter is not None:
+            limiter.refill()
+        try:
+            while offset + 4 <= size:
+                (length,) = unpack_length(view, offset)
+                if length < 3:
+                    self.safe_log(f"Invalid frame of {length} bytes from {session.address}", 'WARNING')
+                    responses.append(protocol.encode_response(400))
+                    closing = True
+                    break
+                end = offset + 4 + length
+                if length > self.max_request_size:
+                    # Answer 400 and drop the frame as it arrives, without buffering it
+                    self.safe_log(f"Frame of {length} bytes from {session.address} exceeds "
+                                  f"{self.max_request_size}, discarding it", 'WARNING')
+                    self.stats.incr('overflows')
+                    responses.append(protocol.encode_response(400))
+                    if end > size:
+                        session.skip = end - size
+                        offset = size
+                        break
+                    offset = end
+                    continue
+                if end > size:
+                    break  # Incomplete frame, wait for more data
+                if timer is not None:
+                    timer.begin()
+                try:
+                    command, args = protocol.parse_request(view, offset, end)
+                except ValueError:
+                    responses.append(protocol.encode_response(400))
+                else:
+                    if limiter is not None and not limiter.take() and command != 'QUIT':
+                        self.stats.incr('rate_limited')
+                        responses.append(protocol.encode_response(503))
+                        offset = end
+                        continue
+                    if forwards is not None:
+                        owner = None
+                        if command in KEY_COMMANDS and args:
+                            owner = partition_for(str(args[0], 'utf-8'), len(self.peers))
+                        if owner is not None and owner != self.worker_index:
+                            forwards.setdefault(owner, []).append((len(responses), bytes(view[offset:end])))
+                            responses.append(None)
+                            offset = end
+                            continue
+                        if owner is None and forwards:
+                            forwarding = perf_counter_ns()
+                            self.forward_requests(forwards, responses, True, session.compressed)
+                            if timer is not None:
+                                # Earlier requests' time, not this one's
+                                timer.start += perf_counter_ns() - forwarding
+                    start = perf_counter_ns() if random() < self.latency_sample else 0
+                    if timer is not None:
+                        timer.executing = perf_counter_ns()
+                    if self.logger.sampled():
+                        response = self.trace_frame(command, args, session.address,
+                                                    session.compressed, timer)
+                    else:
+                        response = self.process_binary(command, args, session.compressed)
+                    if start:
+                        self.command_metrics.record(command, start)
+                    if timer is not None:
+                        timer.finish(command, args)
+                    if response.__class__ is list:
+                        responses.extend(response)
+                        output += sum(map(len, response))
+                    else:
+                        responses.append(response)
+                        output += len(response)
+                    closing = command == 'QUIT'
+                offset = end
+                if closing:
+                    break
+                if output >= self.max_output_buffer and offset < size:
+                    session.more = True  # The rest waits until these responses are sent
+                    break
+        finally:
+            args = None  # Drop argument views so the buffer can be resized
+            view.release()
+        if forwards:
+            self.forward_requests(forwards, responses, True, session.compressed)
+        if closing:
+            buffer.clear()
+        else:
+            del buffer[:offset]
+        return responses, closing
+    
+    def forward_requests(self, forwards, responses, binary, compressed=False):
+        """Send queued requests to the workers owning their keys (worker mode)
+
+        forwards maps a worker index to (response position, raw request) pairs; each
+        owner's responses replace the placeholders at those positions. The mapping is
+        emptied. compressed forwards over connections that negotiated compression.
+        """
+        try:
+            results = self.data_store.forward(
+                {owner: [request for _, request in queued] for owner, queued in forwards.items()},
+                binary, compressed)
+        except (OSError, ValueError) as e:
+            self.safe_log(f"Forwarding to workers {sorted(forwards)} failed: {e}", 'ERROR')
+            failure = protocol.encode_response(500) if binary else "500 SERVER_ERROR"
+            results = {owner: [failure] * len(queued) for owner, queued in forwards.items()}
+        for owner, queued in forwards.items():
+            for (position, _), response in zip(queued, results[owner]):
+                responses[position] = response
+        forwards.clear()
+    
+    def trace_frame(self, command, args, address, compressed=False, timer=None):
+        """Trace and process one KV/2.0 request, returning its response frame
+
+        timer (the connection's RequestTimer) learns when tracing started.
+        """
+        response = self.process_binary(command, args, compressed)
+        if timer is not None:
+            timer.executed = perf_counter_ns()  # The rest is logging
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        summary = ' '.join(f"<{len(arg)} bytes>" for arg in args[1:])
+        key = bytes(args[0]).decode('utf-8', 'replace') if args else ''
+        self.safe_log(f"[{timestamp}] [REQUEST] from {address}: {protocol.VERSION} {command} {key} {summary}")
+        header = response[0] if response.__class__ is list else response
+        status = protocol.RESPONSE_HEADER.unpack_from(header)[1]
+        self.safe_log(f"[{timestamp}] [RESPONSE] to {address}: {status} "
+                      f"({protocol.LENGTH.size + protocol.LENGTH.unpack_from(header)[0]} bytes)")
+        return response
+    
+    def process_binary(self, command, args, compressed=False):
+        """Process one KV/2.0 request given as argument memoryviews
+
+        Returns a response frame, or [header, value] for large values so they are
+        sent without being copied into the frame. With compressed (HELLO COMPRESS),
+        GET, MGET and GETS send values as stored, prefixed by their codec byte.
+        """
+        self.stats.incr('commands_processed')
+        
+        try:
+            if command is None:
+                return protocol.encode_response(400)
+            if self.read_only and command in WRITE_COMMANDS:
+                return protocol.encode_response(403)
+            
+            # Values travel as raw bytes on the hot paths, without text decoding
+            if command == "GET":
+                self.stats.incr('get_requests')
+                if len(args) != 1:
+                    return protocol.encode_response(400)
+                value = self.data_store.get(str(args[0], 'utf-8'), raw=compressed)
+                if value is None:
+                    return protocol.encode_response(404)
+                if compressed:
+                    if value.__class__ is Compressed:
+                        codec, value = bytes((value.codec,)), value.data
+                    else:
+                        codec, value = b'\x00', protocol.to_bytes(value)
+                    if len(value) >= SEND_CHUNK_SIZE:
+                        return [protocol.encode_response_header(200, len(value) + 1) + codec, value]
+                    return protocol.encode_response(200, codec + value)
+                value = protocol.to_bytes(value)
+                if len(value) >= SEND_CHUNK_SIZE:
+                    return [protocol.encode_response_header(200, len(value)), value]
+                return protocol.encode_response(200, value)
+            elif command == "PUT":
+                self.stats.incr('put_requests')
+                if len(args) not in (2, 3):
+                    return protocol.encode_response(400)
+                ttl = None
+                if len(args) == 3:
+                    ttl = parse_ttl(str(args[2], 'utf-8'))
+                    if ttl is None:
+                        return protocol.encode_response(400)
+                if len(args[1]) > self.max_value_size:
+                    return protocol.encode_response(400)
+                key = str(args[0], 'utf-8')
+                if self.data_store.put(key, bytes(args[1]), ttl):
+                    return protocol.encode_response(201)
+                return protocol.encode_response(200)
+            elif command == "MGET":
+                self.stats.incr('mget_requests')
+                if not args:
+                    return protocol.encode_response(400)
+                values = self.data_store.get_many([str(arg, 'utf-8') for arg in args], raw=compressed)
+                if compressed:
+                    values = [None if value is None else to_wire(value) for value in values]
+                return protocol.encode_response(200, protocol.encode_values(values))
+            elif command == "MPUT":
+                self.stats.incr('mput_requests')
+                if not args or len(args) % 2 != 0:
+                    return protocol.encode_response(400)
+                if any(len(value) > self.max_value_size for value in args[1::2]):
+                    return protocol.encode_response(400)
+                items = [(str(key, 'utf-8'), bytes(value))
+                         for key, value in zip(args[0::2], args[1::2])]
+                created = self.data_store.put_many(items)
+                body = f"created={created} updated={len(items) - created}"
+                return protocol.encode_response(200, body.encode('utf-8'))
+            elif command == "GETS":
+                self.stats.incr('gets_requests')
+                if len(args) != 1:
+                    return protocol.encode_response(400)
+                found = self.data_store.get_with_version(str(args[0], 'utf-8'), raw=compressed)
+                if found is None:
+                    return protocol.encode_response(404)
+                value, version = found
+                value = to_wire(value) if compressed else protocol.to_bytes(value)
+                return protocol.encode_response(200, b'%d ' % version + value)
+            elif command == "APPEND":
+                self.stats.incr('append_requests')
+                if len(args) != 2:
+                    return protocol.encode_response(400)
+                try:
+                    length = self.data_store.append(str(args[0], 'utf-8'), bytes(args[1]),
+                                                    self.max_value_size)
+                except ValueError:
+                    return protocol.encode_response(400)
+                return protocol.encode_response(200, b'%d' % length)
+            elif command == "CAS":
+                self.stats.incr('cas_requests')
+                if len(args) not in (3, 4) or not bytes(args[1]).isdigit():
+                    return protocol.encode_response(400)
+                ttl = None
+                if len(args) == 4:
+                    ttl = parse_ttl(str(args[3], 'utf-8'))
+                    if ttl is None:
+                        return protocol.encode_response(400)
+                if len(args[2]) > self.max_value_size:
+                    return protocol.encode_response(400)
+                applied, version = self.data_store.cas(str(args[0], 'utf-8'), int(args[1]),
+                                                       bytes(args[2]), ttl)
+                if applied:
+                    return protocol.encode_response(200, b'%d' % version)
+                if not version:
+                    return protocol.encode_response(404)
+                return protocol.encode_response(409, b'%d' % version)
+            
+            # Remaining commands take keys and numbers: reuse the text handlers
+            response = self.dispatch(command, [str(arg, 'utf-8') for arg in args])
+            status, _, rest = response.partition(' ')
+            return protocol.encode_response(int(status), rest.partition(' ')[2].encode('utf-8'))
+                
+        except Exception as e:
+            self.safe_log(f"Error processing {protocol.VERSION} request {command}: {e}", 'ERROR')
+            return protocol.encode_response(500)
+    
+    def handle_line(self, line, address, timer=None):
+        """Trace and process a single request line, returning the response
+
+        timer (the connection's RequestTimer) learns when tracing started.
+        """
+        if not self.logger.sampled():
+            return self.process_request(line, timer)
+        response = self.process_request(line, timer)
+        if timer is not None:
+            timer.executed = perf_counter_ns()  # The rest is logging
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.safe_log(f"[{timestamp}] [REQUEST] from {address}: {abbreviate(line)}")
+        self.safe_log(f"[{timestamp}] [RESPONSE] to {address}: {abbreviate(response)}")
+        return response
+    
+    def process_request(self, request, timer=None):
         """Process a single request and return response"""
-        self.stats['commands_processed'] += 1
+        self.stats.incr('commands_processed')
         
         try:
             parts = request.split()
@@ -156,24 +974,63 @@ class KVSSServer:
             if version != "KV/1.0":
                 return "426 UPGRADE_REQUIRED"
             
-            # Process commands
-            if command == "PUT":
-                return self.handle_put(parts[2:])
-            elif command == "GET":
-                return self.handle_get(parts[2:])
-            elif command == "DEL":
-                return self.handle_del(parts[2:])
-            elif command == "STATS":
-                return self.handle_stats()
-            elif command == "QUIT":
-                return self.handle_quit()
-            else:
-                return "400 BAD_REQUEST"
+            start = perf_counter_ns() if random() < self.latency_sample else 0
+            if timer is not None:
+                timer.executing = perf_counter_ns()
+            response = self.dispatch(command, parts[2:])
+            if start:
+                self.command_metrics.record(command, start)
+            return response
                 
         except Exception as e:
-            self.safe_log(f"Error processing request '{request}': {e}")
+            self.safe_log(f"Error processing request '{abbreviate(request)}': {e}", 'ERROR')
             return "500 SERVER_ERROR"
     
+    def dispatch(self, command, args):
+        """Run a command's handler and return its text response"""
+        if self.read_only and command in WRITE_COMMANDS:
+            return "403 READ_ONLY"
+        if command == "PUT":
+            return self.handle_put(args)
+        elif command == "PUTEX":
+            return self.handle_putex(args)
+        elif command == "GET":
+            return self.handle_get(args)
+        elif command == "DEL":
+            return self.handle_del(args)
+        elif command == "MGET":
+            return self.handle_mget(args)
+        elif command == "MPUT":
+            return self.handle_mput(args)
+        elif command == "MDEL":
+            return self.handle_mdel(args)
+        elif command == "EXPIRE":
+            return self.handle_expire(args)
+        elif command == "TTL":
+            return self.handle_ttl(args)
+        elif command == "SCAN":
+            return self.handle_scan(args)
+        elif command in ("INCR", "DECR", "INCRBY"):
+            return self.handle_incr(command, args)
+        elif command == "APPEND":
+            return self.handle_append(args)
+        elif command == "CAS":
+            return self.handle_cas(args)
+        elif command == "CASEX":
+            return self.handle_casex(args)
+        elif command == "GETS":
+            return self.handle_gets(args)
+        elif command == "STATS":
+            return self.handle_stats(args)
+        elif command == "SLOWLOG":
+            return self.handle_slowlog(args)
+        elif command == "PROFILE":
+            return self.handle_profile(args)
+        elif command == "QUIT":
+            return self.handle_quit()
+        else:
+            return "400 BAD_REQUEST"
+    
     def is_quit_command(self, request):
         """Check if the request is a QUIT command"""
         try:
@@ -184,84 +1041,661 @@ class KVSSServer:
     
     def handle_put(self, args):
         """Handle PUT command: KV/1.0 PUT key value"""
-        self.stats['put_requests'] += 1
+        self.stats.incr('put_requests')
         
         if len(args) < 2:
             return "400 BAD_REQUEST"
         
-        key = args[0]
-        value = ' '.join(args[1:])  # Value can contain spaces
+        return self.store_value(args[0], ' '.join(args[1:]), None)  # Value can contain spaces
+    
+    def handle_putex(self, args):
+        """Handle PUTEX command: KV/1.0 PUTEX key seconds value
         
-        # Check if key already exists
-        if key in self.data_store:
-            self.data_store[key] = value
-            return "200 OK"
-        else:
-            self.data_store[key] = value
+        The TTL comes before the value, so any value PUT accepts is stored as is.
+        """
+        self.stats.incr('put_requests')
+        
+        if len(args) < 3:
+            return "400 BAD_REQUEST"
+        
+        ttl = parse_ttl(args[1])
+        if ttl is None:
+            return "400 BAD_REQUEST"
+        return self.store_value(args[0], ' '.join(args[2:]), ttl)
+    
+    def store_value(self, key, value, ttl):
+        """Store a PUT/PUTEX value: 201 CREATED for a new key, 200 OK otherwise"""
+        if len(value) > self.max_value_size:
+            return "400 BAD_REQUEST"
+        
+        # Check-and-set happens under the key's shard lock
+        if self.data_store.put(key, value, ttl):
             return "201 CREATED"
+        else:
+            return "200 OK"
     
     def handle_get(self, args):
         """Handle GET command: KV/1.0 GET key"""
-        self.stats['get_requests'] += 1
+        self.stats.incr('get_requests')
         
         if len(args) != 1:
             return "400 BAD_REQUEST"
         
         key = args[0]
         
-        if key in self.data_store:
-            return f"200 OK {self.data_store[key]}"
+        value = self.data_store.get(key)
+        if value is not None:
+            return f"200 OK {as_text(value)}"
         else:
             return "404 NOT_FOUND"
     
     def handle_del(self, args):
         """Handle DEL command: KV/1.0 DEL key"""
-        self.stats['del_requests'] += 1
+        self.stats.incr('del_requests')
         
         if len(args) != 1:
             return "400 BAD_REQUEST"
         
         key = args[0]
         
-        if key in self.data_store:
-            del self.data_store[key]
+        if self.data_store.delete(key):
             return "204 NO_CONTENT"
         else:
             return "404 NOT_FOUND"
     
-    def handle_stats(self):
-        """Handle STATS command: KV/1.0 STATS"""
-        uptime = datetime.now() - self.stats['start_time']
-        stats_data = [
-            f"keys={len(self.data_store)}",
-            f"uptime={round(uptime.total_seconds(), 3)}",
-            f"served={self.stats['connections']}",
-        ]
-        return f"200 OK {' '.join(stats_data)}"
+    def handle_mget(self, args):
+        """Handle MGET command: KV/1.0 MGET key [key ...]
+
+        Responds with a JSON array of values in request order, null for missing keys.
+        """
+        self.stats.incr('mget_requests')
+        
+        if not args:
+            return "400 BAD_REQUEST"
+        
+        values = [as_text(value) for value in self.data_store.get_many(args)]
+        return f"200 OK {json.dumps(values, ensure_ascii=False)}"
     
-    def handle_quit(self):
-        """Handle QUIT command: KV/1.0 QUIT"""
-        return "200 OK goodbye"
+    def handle_mput(self, args):
+        """Handle MPUT command: KV/1.0 MPUT key value [key value ...]
+
+        Values are single tokens here; use PUT for values containing spaces.
+        """
+        self.stats.incr('mput_requests')
+        
+        if not args or len(args) % 2 != 0:
+            return "400 BAD_REQUEST"
+        if any(len(value) > self.max_value_size for value in args[1::2]):
+            return "400 BAD_REQUEST"
+        
+        created = self.data_store.put_many(zip(args[0::2], args[1::2]))
+        return f"200 OK created={created} updated={len(args) // 2 - created}"
+    
+    def handle_mdel(self, args):
+        """Handle MDEL command: KV/1.0 MDEL key [key ...]"""
+        self.stats.incr('mdel_requests')
+        
+        if not args:
+            return "400 BAD_REQUEST"
+        
+        deleted = self.data_store.delete_many(args)
+        return f"200 OK deleted={deleted}"
+    
+    def handle_expire(self, args):
+        """Handle EXPIRE command: KV/1.0 EXPIRE key seconds"""
+        self.stats.incr('expire_requests')
+        if len(args) != 2:
+            return "400 BAD_REQUEST"
+        
+        ttl = parse_ttl(args[1])
+        if ttl is None:
+            return "400 BAD_REQUEST"
+        
+        if self.data_store.expire(args[0], ttl):
+            return "200 OK"
+        else:
+            return "404 NOT_FOUND"
+    
+    def handle_ttl(self, args):
+        """Handle TTL command: KV/1.0 TTL key (remaining seconds, -1 without expiry)"""
+        self.stats.incr('ttl_requests')
+        if len(args) != 1:
+            return "400 BAD_REQUEST"
+        
+        remaining = self.data_store.ttl(args[0])
+        if remaining is None:
+            return "404 NOT_FOUND"
+        if remaining == -1:
+            return "200 OK -1"
+        return f"200 OK {round(remaining, 3)}"
+    
+    def handle_incr(self, command, args):
+        """Handle KV/1.0 INCR key, DECR key and INCRBY key delta
+
+        Responds with the new number; a missing key counts as 0 and the key's TTL is
+        kept. Values that are not integers are refused with 400 BAD_REQUEST.
+        """
+        self.stats.incr('incr_requests')
+        if len(args) != (2 if command == "INCRBY" else 1):
+            return "400 BAD_REQUEST"
+        delta = -1 if command == "DECR" else 1
+        try:
+            if command == "INCRBY":
+                delta = int(args[1])
+            number = self.data_store.incr(args[0], delta)
+        except ValueError:
+            return "400 BAD_REQUEST"
+        return f"200 OK {number}"
+    
+    def handle_append(self, args):
+        """Handle APPEND command: KV/1.0 APPEND key value (responds with the new length)"""
+        self.stats.incr('append_requests')
+        
+        if len(args) < 2:
+            return "400 BAD_REQUEST"
+        
+        try:
+            length = self.data_store.append(args[0], ' '.join(args[1:]), self.max_value_size)
+        except ValueError:
+            return "400 BAD_REQUEST"
+        return f"200 OK {length}"
+    
+    def handle_cas(self, args):
+        """Handle CAS command: KV/1.0 CAS key version value
 
+        Stores the value only if the key's version (from GETS) is unchanged; version 0
+        means the key must not exist. Responds with the new version, 409 CONFLICT and
+        the current version if the key changed, or 404 NOT_FOUND if it is gone.
+        """
+        self.stats.incr('cas_requests')
+        
+        if len(args) < 3 or not args[1].isdigit():
+            return "400 BAD_REQUEST"
+        
+        return self.compare_and_set(args[0], int(args[1]), ' '.join(args[2:]), None)
+    
+    def handle_casex(self, args):
+        """Handle CASEX command: KV/1.0 CASEX key version seconds value
+        
+        CAS that also sets a TTL; like PUTEX, the TTL comes before the value.
+        """
+        self.stats.incr('cas_requests')
+        
+        if len(args) < 4 or not args[1].isdigit():
+            return "400 BAD_REQUEST"
+        
+        ttl = parse_ttl(args[2])
+        if ttl is None:
+            return "400 BAD_REQUEST"
+        return self.compare_and_set(args[0], int(args[1]), ' '.join(args[3:]), ttl)
+    
+    def compare_and_set(self, key, version, value, ttl):
+        """Run a CAS/CASEX: the new version, 409 CONFLICT or 404 NOT_FOUND"""
+        if len(value) > self.max_value_size:
+            return "400 BAD_REQUEST"
+        
+        applied, version = self.data_store.cas(key, version, value, ttl)
+        if applied:
+            return f"200 OK {version}"
+        if not version:
+            return "404 NOT_FOUND"
+        return f"409 CONFLICT {version}"
+    
+    def handle_gets(self, args):
+        """Handle GETS command: KV/1.0 GETS key (responds with the version and value)"""
+        self.stats.incr('gets_requests')
+        
+        if len(args) != 1:
+            return "400 BAD_REQUEST"
+        
+        found = self.data_store.get_with_version(args[0])
+        if found is None:
+            return "404 NOT_FOUND"
+        value, version = found
+        return f"200 OK {version} {as_text(value)}"
+    
+    def handle_scan(self, args):
+        """Handle SCAN command: KV/1.0 SCAN cursor [PREFIX p] [START key] [END key] [COUNT n] [LOCAL]
 
-def main():
-    # Default values
-    host = '127.0.0.1'
-    port = 5050
-    
-    # Parse command line arguments
-    if len(sys.argv) >= 2:
-        host = sys.argv[1]
-    if len(sys.argv) >= 3:
+        Responds with the next cursor and a JSON array of up to COUNT keys in key order
+        (START inclusive, END exclusive). A scan starts with cursor 0 and is complete
+        when the returned cursor is 0. LOCAL scans only this worker's keys (--workers).
+        """
+        self.stats.incr('scan_requests')
+        if not args:
+            return "400 BAD_REQUEST"
         try:
-            port = int(sys.argv[2])
+            after = decode_cursor(args[0])
         except ValueError:
-            print("Invalid port number", flush=True)
-            sys.exit(1)
+            return "400 BAD_REQUEST"
+        options = {}
+        local = False
+        rest = args[1:]
+        while rest:
+            if rest[0] == 'LOCAL':
+                local = True
+                rest = rest[1:]
+                continue
+            if len(rest) < 2 or rest[0] not in ('PREFIX', 'START', 'END', 'COUNT'):
+                return "400 BAD_REQUEST"
+            options[rest[0]] = rest[1]
+            rest = rest[2:]
+        count = options.get('COUNT', str(DEFAULT_SCAN_COUNT))
+        if not count.isdigit() or not 1 <= int(count) <= MAX_SCAN_COUNT:
+            return "400 BAD_REQUEST"
+        start, end = options.get('START'), options.get('END')
+        prefix = options.get('PREFIX')
+        if prefix is not None:
+            # A prefix is the range [prefix, prefix_end(prefix))
+            start = prefix if start is None else max(start, prefix)
+            bound = prefix_end(prefix)
+            if bound is not None and (end is None or bound < end):
+                end = bound
+        
+        store = self.data_store.local if local and self.peers else self.data_store
+        keys, more = store.scan(start, end, after, int(count))
+        cursor = encode_cursor(keys[-1]) if more else '0'
+        return f"200 OK {cursor} {json.dumps(keys, ensure_ascii=False)}"
     
-    # Create and start server
-    server = KVSSServer(host, port)
+    def handle_stats(self, args=()):
+        """Handle STATS command: KV/1.0 STATS [LOCAL] [VERBOSE]
+
+        With --workers the figures of every worker are combined; LOCAL reports only
+        the worker handling the request. VERBOSE adds the request counters and the
+        latency percentiles of every command timed (see latency_sample).
+        """
+        self.stats.incr('stats_requests')
+        options = set(args)
+        if len(options) != len(args) or not options <= {'LOCAL', 'VERBOSE'}:
+            return "400 BAD_REQUEST"
+        verbose = 'VERBOSE' in options
+        stats = self.local_stats(verbose)
+        if self.peers and 'LOCAL' not in options:
+            others = [index for index in range(len(self.peers)) if index != self.worker_index]
+            stats = merge_stats([stats] + [self.peer_stats(index, verbose) for index in others])
+        return f"200 OK {' '.join(f'{name}={value}' for name, value in stats.items())}"
+    
+    def local_stats(self, verbose=False):
+        """Statistics of this process as a dict, in STATS order"""
+        uptime = datetime.now() - self.start_time
+        hits, misses = self.data_store.hits, self.data_store.misses
+        hit_ratio = hits / (hits + misses) if hits + misses else 0.0
+        stats = {
+            'keys': len(self.data_store),
+            'uptime': round(uptime.total_seconds(), 3),
+            'served': self.stats.value('connections'),
+            'expired': self.data_store.expired,
+            'evicted': self.data_store.evicted,
+            'memory': self.data_store.memory,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hit_ratio, 4),
+            'role': 'follower' if self.follower else 'leader',
+        }
+        replication = self.replication.stats()
+        if self.follower:
+            # A follower can itself have followers, but its own lag matters most
+            replication = dict(replicas=replication['replicas'], **self.follower.stats())
+        stats.update(replication)
+        stats.update(self.notifier.stats())
+        if self.data_store.compression:
+            compression = self.data_store.compression_stats()
+            original, packed = compression['uncompressed_bytes'], compression['compressed_bytes']
+            stats.update({
+                'compression': self.data_store.compression,
+                'compressed_keys': compression['compressed_keys'],
+                'compressed_bytes': packed,
+                'uncompressed_bytes': original,
+                'compression_ratio': round(original / packed, 3) if packed else 0.0,
+                'compress_cpu_ms': round(compression['compress_cpu'] * 1000, 3),
+                'decompress_cpu_ms': round(compression['decompress_cpu'] * 1000, 3),
+            })
+        if self.data_store.storage != 'dict':
+            stats['storage'] = self.data_store.storage
+            stats.update(self.data_store.arena_stats())
+        if verbose:
+            counters = self.stats.snapshot()
+            del counters['connections']  # Already reported as served
+            stats.update(counters)
+            for command, histogram in sorted(self.command_metrics.snapshot().items()):
+                name = command.lower()
+                stats[f'{name}_samples'] = histogram.total
+                for percent in (50, 99, 99.9):
+                    stats[f"{name}_p{percent:g}_us".replace('.', '')] = histogram.percentile(percent)
+                stats[f'{name}_max_us'] = histogram.max_us
+        return stats
+    
+    def prometheus_metrics(self):
+        """This process's statistics in the Prometheus text format (for --metrics-port)"""
+        stats = self.local_stats()
+        counters = self.stats.snapshot()
+        gauges = {
+            'keys': stats['keys'],
+            'memory_bytes': stats['memory'],
+            'uptime_seconds': stats['uptime'],
+            'connections_active': counters['connections_active'],
+            'replicas': stats['replicas'],
+            'replication_lag': stats['repl_lag'],
+            'subscribers': stats['subscribers'],
+        }
+        totals = {
+            'connections_total': counters['connections'],
+            'commands_processed_total': counters['commands_processed'],
+            'bytes_in_total': counters['bytes_in'],
+            'bytes_out_total': counters['bytes_out'],
+            'overflows_total': counters['overflows'],
+            'rejected_connections_total': counters['rejected_connections'],
+            'timeouts_total': counters['timeouts'],
+            'rate_limited_total': counters['rate_limited'],
+            'hits_total': stats['hits'],
+            'misses_total': stats['misses'],
+            'expired_total': stats['expired'],
+            'evicted_total': stats['evicted'],
+            'notifications_total': stats['notifications'],
+            'notify_resets_total': stats['notify_resets'],
+        }
+        if 'compression' in stats:
+            gauges['compressed_keys'] = stats['compressed_keys']
+            gauges['compressed_bytes'] = stats['compressed_bytes']
+            gauges['uncompressed_bytes'] = stats['uncompressed_bytes']
+            totals['compress_cpu_seconds_total'] = stats['compress_cpu_ms'] / 1000
+            totals['decompress_cpu_seconds_total'] = stats['decompress_cpu_ms'] / 1000
+        if 'storage' in stats:
+            gauges['arena_bytes'] = stats['arena_bytes']
+            gauges['arena_dead_bytes'] = stats['arena_dead_bytes']
+        labels = {'worker': self.worker_index} if self.peers else None
+        return render_prometheus(gauges, totals, self.command_metrics.snapshot(), labels)
+    
+    def peer_stats(self, index, verbose=False):
+        """Fetch the local statistics of worker index"""
+        args = ['LOCAL', 'VERBOSE'] if verbose else ['LOCAL']
+        return parse_counts(self.call_peer(index, 'STATS', args)[1])
+    
+    def call_peer(self, index, command, args, statuses=(200,)):
+        """Send a request to worker index; returns (status, body text)"""
+        status, body = self.data_store.call(index, command, args)
+        if status not in statuses:
+            raise RuntimeError(f"Worker {index} answered {command} with {status}")
+        return status, body.decode('utf-8')
+    
+    def other_workers(self, args):
+        """Indexes of the workers an admin command also covers: all but this one,
+        unless args end with LOCAL (removed from args) or there are no workers"""
+        if args and args[-1] == 'LOCAL':
+            args.pop()
+            return []
+        if not self.peers:
+            return []
+        return [index for index in range(len(self.peers)) if index != self.worker_index]
+    
+    def handle_slowlog(self, args):
+        """Handle SLOWLOG: KV/1.0 SLOWLOG GET [<count>] | LEN | RESET, each optionally LOCAL
+
+        GET answers the count newest entries (default 10) as a JSON array, newest
+        first; with --workers the entries of every worker are merged, each tagged with
+        its worker, and LEN and RESET cover every worker. LOCAL limits them to the
+        worker handling the request.
+        """
+        args = list(args)
+        others = self.other_workers(args)
+        if args[:1] == ['GET'] and len(args) <= 2:
+            if len(args) == 2 and not args[1].isdigit():
+                return "400 BAD_REQUEST"
+            count = int(args[1]) if len(args) == 2 else 10
+            entries = self.slowlog.get(count)
+            if others:
+                for entry in entries:
+                    entry['worker'] = self.worker_index
+                for index in others:
+                    body = self.call_peer(index, 'SLOWLOG', ['GET', str(count), 'LOCAL'])[1]
+                    for entry in json.loads(body):
+                        entry['worker'] = index
+                        entries.append(entry)
+                entries.sort(key=lambda entry: entry['time'], reverse=True)
+                del entries[count:]
+            return f"200 OK {json.dumps(entries, ensure_ascii=False)}"
+        if args == ['LEN']:
+            total = len(self.slowlog)
+            for index in others:
+                total += int(self.call_peer(index, 'SLOWLOG', ['LEN', 'LOCAL'])[1])
+            return f"200 OK {total}"
+        if args == ['RESET']:
+            self.slowlog.reset()
+            for index in others:
+                self.call_peer(index, 'SLOWLOG', ['RESET', 'LOCAL'])
+            return "200 OK"
+        return "400 BAD_REQUEST"
+    
+    def handle_profile(self, args):
+        """Handle PROFILE: KV/1.0 PROFILE START <seconds> | STOP, each optionally LOCAL
+
+        START samples the stacks of every server thread for seconds, then writes them
+        to a file in profile_dir (409 CONFLICT if a profile is already running); STOP
+        ends it early (404 NOT_FOUND if none runs). Both answer with the files written;
+        with --workers every worker is profiled into its own file unless LOCAL is given.
+        """
+        args = list(args)
+        others = self.other_workers(args)
+        if len(args) == 2 and args[0] == 'START':
+            seconds = parse_ttl(args[1])
+            if seconds is None or seconds > self.profiler.MAX_SECONDS:
+                return "400 BAD_REQUEST"
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            suffix = f".worker{self.worker_index}" if self.peers else ""
+            path = os.path.abspath(os.path.join(self.profile_dir,
+                                                f"kvss_profile_{self.port}_{stamp}{suffix}.txt"))
+            if not self.profiler.start(seconds, path):
+                return "409 CONFLICT"
+            files = [path]
+            for index in others:
+                status, body = self.call_peer(index, 'PROFILE', ['START', args[1], 'LOCAL'],
+                                              (200, 409))
+                if status == 200:
+                    files.append(parse_counts(body)['files'])
+            return f"200 OK seconds={seconds:g} files={','.join(files)}"
+        if args == ['STOP']:
+            samples, files = 0, []
+            result = self.profiler.stop()
+            if result:
+                samples, files = result[0], [result[1]]
+            for index in others:
+                status, body = self.call_peer(index, 'PROFILE', ['STOP', 'LOCAL'], (200, 404))
+                if status == 200:
+                    counts = parse_counts(body)
+                    samples += counts['samples']
+                    files.append(counts['files'])
+            if not files:
+                return "404 NOT_FOUND"
+            return f"200 OK samples={samples} files={','.join(files)}"
+        return "400 BAD_REQUEST"
     
+    def handle_quit(self):
+        """Handle QUIT command: KV/1.0 QUIT"""
+        return "200 OK goodbye"
+
+
+def send_chunks(chunks, chunk_size=SEND_CHUNK_SIZE):
+    """Yield response chunks regrouped for sending
+
+    Small chunks (pipelined responses) are coalesced into one write; large values
+    are yielded as memoryview slices of chunk_size so they are never copied.
+    """
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        size = len(chunk)
+        if size < chunk_size:
+            pending.append(chunk)
+            pending_size += size
+            if pending_size < chunk_size:
+                continue
+        if pending:
+            yield b''.join(pending)
+            pending = []
+            pending_size = 0
+        if size >= chunk_size:
+            view = memoryview(chunk)
+            for start in range(0, size, chunk_size):
+                yield view[start:start + chunk_size]
+    if pending:
+        yield b''.join(pending)
+
+
+def as_text(value):
+    """Render a stored value for the line-based text protocol
+
+    Values stored through KV/2.0 are bytes: they are decoded as UTF-8 (invalid bytes
+    replaced) and line breaks are escaped so the response stays on one line.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return value.decode('utf-8', 'replace').replace('\r', '\\r').replace('\n', '\\n')
+
+
+def parse_ttl(text):
+    """Parse a TTL in seconds; returns None unless it is a positive number"""
+    try:
+        ttl = float(text)
+    except ValueError:
+        return None
+    if not ttl > 0 or ttl == float('inf'):
+        return None
+    return ttl
+
+
+def parse_size(text):
+    """Parse a byte size such as 1048576, 512kb, 64mb or 2gb"""
+    units = {'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'b': 1}
+    text = text.strip().lower()
+    for suffix, factor in units.items():
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
+
+
+def raise_fd_limit():
+    """Raise the soft open-file limit to the hard limit so one process can hold many sockets"""
+    if resource is None:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def parse_args(argv=None):
+    """Parse server command line arguments"""
+    parser = argparse.ArgumentParser(description="KVSS server")
+    parser.add_argument('host', nargs='?', default='127.0.0.1',
+                        help="address to bind (default: 127.0.0.1)")
+    parser.add_argument('port', nargs='?', type=int, default=5050,
+                        help="port to listen on (default: 5050)")
+    parser.add_argument('--mode', choices=SERVER_MODES, default='threaded',
+                        help="connection engine: one thread per client or a single asyncio loop")
+    parser.add_argument('--log-file', default=None,
+                        help="log file path (default: kvss_server_<host>_<port>.log)")
+    parser.add_argument('--log-level', choices=list(LOG_LEVELS), default='INFO',
+                        help="minimum level written to console and log file")
+    parser.add_argument('--trace-sample', type=float, default=1.0,
+                        help="fraction of requests traced as REQUEST/RESPONSE lines (0 disables)")
+    parser.add_argument('--slowlog-threshold-ms', type=float, default=DEFAULT_THRESHOLD_MS,
+                        help="log requests taking at least this long to SLOWLOG "
+                             f"(default: {DEFAULT_THRESHOLD_MS:g}, 0 logs all, negative disables)")
+    parser.add_argument('--slowlog-size', type=int, default=DEFAULT_SLOWLOG_SIZE,
+                        help=f"SLOWLOG entries kept (default: {DEFAULT_SLOWLOG_SIZE})")
+    parser.add_argument('--profile-dir', default='.',
+                        help="directory receiving PROFILE output (default: current directory)")
+    parser.add_argument('--latency-sample', type=float, default=0.05,
+                        help="fraction of requests timed into the latency histograms "
+                             "(default: 0.05, 0 disables)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="server processes sharing the port, each owning a share of the keys")
+    parser.add_argument('--shards', type=int, default=16,
+                        help="number of independently locked store shards")
+    parser.add_argument('--max-keys', type=int, default=None,
+                        help="evict keys once the store holds more than this many")
+    parser.add_argument('--max-memory', type=parse_size, default=None,
+                        help="evict keys once stored data exceeds this size (e.g. 512mb)")
+    parser.add_argument('--eviction', choices=list(EVICTION_POLICIES), default='lru',
+                        help="which key to evict when a limit is hit (default: lru)")
+    parser.add_argument('--storage', choices=list(STORAGE_ENGINES), default='dict',
+                        help="per-shard key tables: dict, or arena to pack values into "
+                             "compact buffers for less memory per key (default: dict)")
+    parser.add_argument('--compression', choices=['none'] + list(CODECS), default='none',
+                        help="compress stored values with this codec (default: none)")
+    parser.add_argument('--compress-min-size', type=parse_size, default=DEFAULT_COMPRESS_MIN_SIZE,
+                        help="smallest value compressed with --compression (default: 1kb)")
+    parser.add_argument('--max-value-size', type=parse_size, default=DEFAULT_MAX_VALUE_SIZE,
+                        help="largest value accepted by PUT/MPUT (default: 16mb)")
+    parser.add_argument('--backlog', type=int, default=DEFAULT_BACKLOG,
+                        help=f"pending connections queued before accept (default: {DEFAULT_BACKLOG})")
+    parser.add_argument('--max-connections', type=int, default=DEFAULT_MAX_CONNECTIONS,
+                        help="client connections served at once per process; more are "
+                             f"answered 503 BUSY (default: {DEFAULT_MAX_CONNECTIONS}, 0: no limit)")
+    parser.add_argument('--idle-timeout', type=float, default=0,
+                        help="close client connections idle this many seconds (default: 0, never)")
+    parser.add_argument('--read-timeout', type=float, default=DEFAULT_READ_TIMEOUT,
+                        help="seconds a client gets to finish a request or read its responses "
+                             f"(default: {DEFAULT_READ_TIMEOUT:g}, 0: no limit)")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="requests per second per client connection; the excess is "
+                             "answered 503 BUSY (default: 0, no limit)")
+    parser.add_argument('--max-output-buffer', type=parse_size, default=DEFAULT_MAX_OUTPUT_BUFFER,
+                        help="response bytes produced for one connection before its next "
+                             "requests wait for them to be sent (default: 4mb)")
+    parser.add_argument('--replica-of', default=None, metavar='HOST:PORT',
+                        help="run as a read-only follower replicating the leader at HOST:PORT")
+    parser.add_argument('--subscriber-queue', type=int, default=DEFAULT_QUEUE_LIMIT,
+                        help="notifications queued for a slow subscriber before it is sent "
+                             f"NOTIFY RESET (default: {DEFAULT_QUEUE_LIMIT})")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="serve Prometheus metrics over HTTP on this port "
+                             "(worker i of --workers uses port + i)")
+    parser.add_argument('--data-dir', default=None,
+                        help="enable persistence: append-only log and snapshots in this directory")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='interval',
+                        help="when the append-only log is fsynced (default: interval)")
+    parser.add_argument('--fsync-interval-ms', type=int, default=1000,
+                        help="fsync period for --fsync interval, in milliseconds")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.subscriber_queue < 1:
+        parser.error("--subscriber-queue must be at least 1")
+    if args.backlog < 1:
+        parser.error("--backlog must be at least 1")
+    if min(args.max_connections, args.idle_timeout, args.read_timeout, args.rate_limit) < 0:
+        parser.error("connection limits and timeouts cannot be negative")
+    if args.workers > 1 and args.replica_of:
+        parser.error("--replica-of cannot be combined with --workers")
+    return args
+
+
+def create_server(args, **overrides):
+    """Build a KVSSServer from parsed command line arguments"""
+    options = dict(log_file=args.log_file, mode=args.mode,
+                   log_level=args.log_level, trace_sample=args.trace_sample,
+                   latency_sample=args.latency_sample,
+                   shards=args.shards, data_dir=args.data_dir, fsync=args.fsync,
+                   fsync_interval=args.fsync_interval_ms / 1000.0,
+                   max_keys=args.max_keys, max_memory=args.max_memory,
+                   eviction=args.eviction, max_value_size=args.max_value_size,
+                   replica_of=args.replica_of, metrics_port=args.metrics_port,
+                   subscriber_queue=args.subscriber_queue,
+                   compression=args.compression, compress_min_size=args.compress_min_size,
+                   storage=args.storage, backlog=args.backlog,
+                   max_connections=args.max_connections, idle_timeout=args.idle_timeout,
+                   read_timeout=args.read_timeout, rate_limit=args.rate_limit,
+                   max_output_buffer=args.max_output_buffer,
+                   slowlog_threshold=args.slowlog_threshold_ms, slowlog_size=args.slowlog_size,
+                   profile_dir=args.profile_dir)
+    options.update(overrides)
+    return KVSSServer(args.host, args.port, **options)
+
+
+def run_server(server):
     try:
         server.start()
     except KeyboardInterrupt:
@@ -270,5 +1704,84 @@ def main():
         server.stop()
 
 
+def run_workers(args):
+    """Fork args.workers server processes that share the port through SO_REUSEPORT
+
+    Worker i owns the keys with partition_for(key) == i and forwards the rest to
+    their owners through per-worker peer ports on 127.0.0.1. Each worker has its
+    own log file and, with --data-dir, its own subdirectory; keep the worker count
+    fixed for a data directory, since it decides which worker owns each key.
+    The parent only waits: SIGTERM or a worker exiting stops all workers.
+    """
+    if not hasattr(os, 'fork') or not hasattr(socket, 'SO_REUSEPORT'):
+        sys.exit("--workers needs fork() and SO_REUSEPORT (Linux, macOS or BSD)")
+    # Peer listeners are bound before forking so every worker knows every address
+    peer_sockets = []
+    for _ in range(args.workers):
+        peer_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        peer_socket.bind(('127.0.0.1', 0))
+        peer_socket.listen(64)
+        peer_sockets.append(peer_socket)
+    peers = [peer_socket.getsockname() for peer_socket in peer_sockets]
+    log_file = args.log_file or f"kvss_server_{args.host}_{args.port}.log"
+    base, extension = os.path.splitext(log_file)
+
+    children = []
+    for index in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            for other in peer_sockets:
+                if other is not peer_sockets[index]:
+                    other.close()
+            data_dir = os.path.join(args.data_dir, f"worker-{index}") if args.data_dir else None
+            metrics_port = args.metrics_port + index if args.metrics_port is not None else None
+            server = create_server(args, log_file=f"{base}.worker{index}{extension}",
+                                   data_dir=data_dir, metrics_port=metrics_port,
+                                   worker_index=index, peers=peers,
+                                   peer_socket=peer_sockets[index])
+            code = 0
+            try:
+                run_server(server)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        children.append(pid)
+    for peer_socket in peer_sockets:
+        peer_socket.close()
+
+    def stop_workers(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGINT)  # Workers shut down cleanly on SIGINT
+            except OSError:
+                pass
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, lambda *_: None)  # Ctrl+C reaches the workers directly
+    print(f"KVSS started {args.workers} workers on {args.host}:{args.port} "
+          f"(pids {' '.join(map(str, children))})", flush=True)
+    stopping = False
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.remove(pid)
+        if not stopping:
+            # Without a worker its share of the keyspace is unreachable
+            stopping = True
+            stop_workers()
+
+
+def main():
+    args = parse_args()
+    if args.workers > 1:
+        run_workers(args)
+        return
+    
+    # Create and start server
+    run_server(create_server(args))
+
+
 if __name__ == "__main__":
     main()
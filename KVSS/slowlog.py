@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Slow request log for the KVSS server (SLOWLOG)
+Every request is timed on its connection; those taking at least --slowlog-threshold-ms
+are kept in a ring buffer of the last --slowlog-size entries, with their time split
+into parsing, executing the command, logging (REQUEST/RESPONSE tracing) and sending
+the responses written with it. Read with "KV/1.0 SLOWLOG GET [n]".
+"""
+
+import itertools
+import threading
+import time
+from collections import deque
+from time import perf_counter_ns
+
+from log_writer import abbreviate
+
+
+# Defaults for --slowlog-threshold-ms and --slowlog-size
+DEFAULT_THRESHOLD_MS = 10.0
+DEFAULT_SIZE = 128
+
+# Entry fields, in order (times in microseconds)
+FIELDS = ('id', 'time', 'client', 'command', 'total_us', 'parse_us', 'execute_us', 'log_us',
+          'send_us')
+
+
+def describe_frame(command, args):
+    """Summary of a KV/2.0 request for the log: command, key and argument sizes"""
+    key = bytes(args[0]).decode('utf-8', 'replace') if args else ''
+    sizes = ' '.join(f"<{len(arg)} bytes>" for arg in args[1:])
+    return f"{command} {key} {sizes}".rstrip()
+
+
+class RequestTimer:
+    """Times the requests of one connection for the slow log
+
+    The server calls begin() before parsing each request and finish() once its
+    response is built, after setting executing when the command starts and, if the
+    request is traced, executed when logging starts. Requests over the threshold wait
+    in pending until sent() adds the time taken to send their batch of responses; if
+    none was over it, the batch's slowest request is still logged when its send
+    makes it cross the threshold.
+    """
+    __slots__ = ('slowlog', 'address', 'start', 'executing', 'executed', 'pending', 'slowest',
+                 'slowest_total')
+
+    def __init__(self, slowlog, address):
+        self.slowlog = slowlog
+        self.address = address
+        self.start = self.executing = self.executed = 0
+        self.pending = []
+        self.slowest = None
+        self.slowest_total = 0
+
+    def begin(self):
+        self.start = perf_counter_ns()
+        self.executing = self.executed = 0
+
+    def finish(self, request, args=None):
+        """The response of request (a text line, or a KV/2.0 command and its args) is built"""
+        end = perf_counter_ns()
+        total = end - self.start
+        if total <= self.slowest_total:
+            return  # Faster than a request of the batch already kept
+        executed = self.executed or end
+        execute = executed - (self.executing or executed)
+        log = end - executed
+        if args is not None:
+            request = describe_frame(request, args)  # args do not outlive the batch
+        entry = (request, total, total - execute - log, execute, log)
+        if total >= self.slowlog.threshold:
+            self.pending.append(entry)
+        else:
+            self.slowest = entry
+            self.slowest_total = total
+
+    def sent(self, send_ns):
+        """The batch of responses was sent in send_ns: log its slow requests"""
+        entries = self.pending
+        if not entries and self.slowest and self.slowest_total + send_ns >= self.slowlog.threshold:
+            entries = [self.slowest]
+        for entry in entries:
+            self.slowlog.add(entry, send_ns, self.address)
+        if self.pending:
+            self.pending = []
+        self.slowest = None
+        self.slowest_total = 0
+
+
+class SlowLog:
+    """Ring buffer of the slowest requests of a server process"""
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, size=DEFAULT_SIZE):
+        """
+        threshold_ms: requests taking at least this long are logged; 0 logs every
+                      request, a negative value disables the slow log
+        size: entries kept; older ones are dropped
+        """
+        self.enabled = threshold_ms >= 0 and size > 0
+        self.threshold = int(threshold_ms * 1000000)
+        self.entries = deque(maxlen=max(size, 1))
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def timer(self, address):
+        """A RequestTimer for a new connection, or None while the slow log is disabled"""
+        return RequestTimer(self, address) if self.enabled else None
+
+    def add(self, entry, send_ns, address):
+        request, total, parse, execute, log = entry
+        client = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+        with self.lock:
+            self.entries.append((next(self.ids), round(time.time(), 3), client, abbreviate(request),
+                                 (total + send_ns) // 1000, parse // 1000, execute // 1000,
+                                 log // 1000, send_ns // 1000))
+
+    def get(self, count=10):
+        """The count newest entries as dicts, newest first"""
+        with self.lock:
+            newest = list(itertools.islice(reversed(self.entries), count))
+        return [dict(zip(FIELDS, entry)) for entry in newest]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
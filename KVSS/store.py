@@ -0,0 +1,750 @@
+#!/usr/bin/env python3
+"""
+Concurrent data structures for the KVSS server
+A sharded key-value store with per-shard locks and contention-free counters
+"""
+
+import heapq
+import sys
+import threading
+import time
+import weakref
+from itertools import islice
+from time import thread_time_ns
+
+from arena import ArenaTable
+from compression import Compressed, CODECS, CODEC_NONE, DEFAULT_COMPRESS_MIN_SIZE, compress
+from eviction import EVICTION_POLICIES
+from index import SortedKeys
+from metrics import CellOwner
+from protocol import to_bytes
+
+
+# Mutation operations reported to store listeners
+OP_PUT = 1
+OP_DEL = 2
+OP_EXPIRE = 3  # value is the absolute expiry time (time.time() seconds)
+
+# Approximate per-key bookkeeping cost (dict slots, sorted index, version) on top of
+# key and value objects
+ENTRY_OVERHEAD = 96
+
+# incr() keeps counters within a signed 64-bit range, like other stores' counters
+COUNTER_MIN = -2 ** 63
+COUNTER_MAX = 2 ** 63 - 1
+
+# Per-shard tables a store can keep its keys in (see ArenaTable)
+STORAGE_ENGINES = {
+    'dict': dict,
+    'arena': ArenaTable,
+}
+
+
+def entry_size(key, value):
+    """Approximate memory held by one stored key/value pair, in bytes"""
+    if value.__class__ is Compressed:
+        return sys.getsizeof(key) + value.footprint + ENTRY_OVERHEAD
+    return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+
+class Shard:
+    __slots__ = ('lock', 'storage', 'data', 'index', 'versions', 'sequence', 'expires',
+                 'deadlines', 'policy', 'memory', 'expired', 'evicted', 'hits', 'misses',
+                 'compressed', 'compressed_size', 'original_size')
+
+    def __init__(self, policy=None, storage=dict):
+        self.lock = threading.Lock()
+        self.storage = storage  # Table type of data: dict or ArenaTable
+        self.clear_data()
+        self.sequence = 0    # Last version handed out in this shard
+        self.expires = {}    # key -> absolute expiry time, only for keys with a TTL
+        self.deadlines = []  # min-heap of (expiry time, key); may hold stale entries
+        self.policy = policy  # Eviction policy, only when the store is bounded
+        self.memory = 0      # Approximate bytes held, see entry_size()
+        self.expired = 0
+        self.evicted = 0
+        self.hits = 0
+        self.misses = 0
+        self.compressed = 0       # Values held compressed
+        self.compressed_size = 0  # Their compressed bytes
+        self.original_size = 0    # Their original bytes
+
+    def clear_data(self):
+        """Start over with empty key tables"""
+        self.data = self.storage()
+        self.index = SortedKeys()  # The keys of data in order, for scans
+        # key -> version, renewed on every write (see cas()); an ArenaTable keeps them itself
+        self.versions = {} if self.storage is dict else self.data.versions
+
+    def count_value(self, value, sign):
+        """Add (sign 1) or remove (sign -1) value from the compression totals"""
+        if value.__class__ is Compressed:
+            self.compressed += sign
+            self.compressed_size += sign * len(value.data)
+            self.original_size += sign * value.size
+
+
+class ShardedStore:
+    """Key-value store split into shards selected by key hash, each with its own lock
+
+    Single-key operations lock only the key's shard. Multi-key operations lock every
+    shard involved, always in shard order, so they are atomic and cannot deadlock.
+
+    Keys may carry a TTL. Expired keys are removed lazily when accessed and actively
+    by expire_cycle(), which pops due keys off each shard's deadline heap in small,
+    time-bounded batches.
+
+    With max_keys or max_memory set, each shard enforces its share of the limit on
+    insert by evicting keys chosen by the eviction policy (lru, lfu or random).
+
+    Every shard also keeps its keys sorted, so scan() can page through key ranges.
+
+    Each write gives the key a new version from its shard's sequence, so a version is
+    never reused while the store lives; cas() writes only if the version is unchanged.
+    incr(), append() and cas() read and write under one shard lock, so concurrent
+    clients never lose updates.
+
+    With compression set ('zlib' or 'lzma'), values of at least compress_min_size are
+    stored as Compressed when that makes them smaller. Writes compress before taking
+    the shard lock and reads decompress after releasing it; listeners always see
+    the original value. Pass raw=True to the read methods to get the stored form.
+
+    storage picks the table each shard keeps its keys in: 'dict' (fastest) or 'arena'
+    (values and versions packed into an ArenaTable, for far less memory per key).
+    """
+
+    # Keys removed per shard lock hold by expire_cycle()
+    EXPIRE_BATCH = 64
+
+    def __init__(self, shards=16, max_keys=None, max_memory=None, eviction='lru',
+                 compression=None, compress_min_size=DEFAULT_COMPRESS_MIN_SIZE, storage='dict'):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        if compression not in (None, 'none') and compression not in CODECS:
+            raise ValueError(f"Unknown compression '{compression}', "
+                             f"expected one of {list(CODECS)}")
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{eviction}', "
+                             f"expected one of {list(EVICTION_POLICIES)}")
+        if storage not in STORAGE_ENGINES:
+            raise ValueError(f"Unknown storage engine '{storage}', "
+                             f"expected one of {list(STORAGE_ENGINES)}")
+        self.storage = storage
+        table = STORAGE_ENGINES[storage]
+        # Memory accounting follows the engine's layout
+        self.entry_size = entry_size if table is dict else table.entry_size
+        self.eviction = eviction
+        self.bounded = bool(max_keys or max_memory)
+        # Limits are split evenly so each shard can enforce its share under its own lock
+        self.shard_max_keys = max(max_keys // shards, 1) if max_keys else None
+        self.shard_max_memory = max(max_memory // shards, 1) if max_memory else None
+        policy = EVICTION_POLICIES[eviction]
+        self.shards = [Shard(policy() if self.bounded else None, table) for _ in range(shards)]
+        # Called as listener(op, key, value) under the shard lock after each mutation
+        self.listeners = []
+        self.compression = compression if compression in CODECS else None
+        self.codec = CODECS.get(compression, CODEC_NONE)
+        self.compress_min_size = compress_min_size
+        # Thread CPU time spent compressing and decompressing values
+        self.codec_stats = StatsCounters(('compress_ns', 'decompress_ns'))
+
+    def add_listener(self, listener):
+        """Register a mutation listener (e.g. the append-only log)"""
+        self.listeners.append(listener)
+
+    def _notify(self, op, key, value=''):
+        for listener in self.listeners:
+            listener(op, key, value)
+
+    def pack(self, value):
+        """Return value in the form to store: Compressed if compression is on, the value
+        is at least compress_min_size long and compressing it saves space"""
+        if not self.codec or len(value) < self.compress_min_size:
+            return value
+        start = thread_time_ns()
+        data = to_bytes(value)
+        packed = compress(self.codec, data)
+        self.codec_stats.incr('compress_ns', thread_time_ns() - start)
+        if len(packed) >= len(data):
+            return value
+        return Compressed(self.codec, packed, len(data), isinstance(value, str))
+
+    def unpack(self, value):
+        """Return the original form of a stored value"""
+        if value.__class__ is not Compressed:
+            return value
+        start = thread_time_ns()
+        value = value.unpack()
+        self.codec_stats.incr('decompress_ns', thread_time_ns() - start)
+        return value
+
+    def shard_for(self, key):
+        """Return the shard owning key"""
+        return self.shards[hash(key) % len(self.shards)]
+
+    def _shards_for(self, keys):
+        """Return the distinct shards owning keys, in lock order"""
+        count = len(self.shards)
+        return [self.shards[i] for i in sorted({hash(key) % count for key in keys})]
+
+    def _acquire(self, shards):
+        for shard in shards:
+            shard.lock.acquire()
+
+    def _release(self, shards):
+        for shard in reversed(shards):
+            shard.lock.release()
+
+    # Helpers below are called with the shard lock held
+
+    def _live(self, shard, key):
+        """Return True if key exists and has not expired, removing it if it has"""
+        if key not in shard.data:
+            return False
+        if shard.expires:
+            expires_at = shard.expires.get(key)
+            if expires_at is not None and expires_at <= time.time():
+                self._expire(shard, key)
+                return False
+        return True
+
+    def _read(self, shard, key):
+        """Return the live value of key (None if missing), recording the access"""
+        if not self._live(shard, key):
+            shard.misses += 1
+            return None
+        shard.hits += 1
+        if shard.policy:
+            shard.policy.touch(key)
+        return shard.data[key]
+
+    def _discard(self, shard, key):
+        """Drop key and its bookkeeping without notifying listeners"""
+        value = shard.data.pop(key)
+        shard.memory -= self.entry_size(key, value)
+        shard.count_value(value, -1)
+        shard.index.remove(key)
+        del shard.versions[key]
+        if shard.expires:
+            shard.expires.pop(key, None)
+        if shard.policy:
+            shard.policy.remove(key)
+
+    def _expire(self, shard, key):
+        self._discard(shard, key)
+        shard.expired += 1
+        if self.listeners:
+            self._notify(OP_DEL, key)
+
+    def _set(self, shard, key, value, ttl=None, keep_ttl=False, plain=None):
+        """Store value, replacing any previous TTL unless keep_ttl; returns True if the key was created
+
+        plain is the original value when value is its pack()ed form.
+        """
+        created = not self._live(shard, key)
+        if created:
+            shard.index.add(key)
+            if shard.policy:
+                shard.policy.add(key)
+        else:
+            previous = shard.data[key]
+            shard.memory -= self.entry_size(key, previous)
+            shard.count_value(previous, -1)
+            if shard.policy:
+                shard.policy.touch(key)
+        shard.data[key] = value
+        shard.memory += self.entry_size(key, value)
+        shard.count_value(value, 1)
+        shard.sequence += 1
+        shard.versions[key] = shard.sequence
+        if self.listeners:
+            self._notify(OP_PUT, key, value if plain is None else plain)
+        if ttl is not None:
+            self._set_expiry(shard, key, time.time() + ttl)
+        elif keep_ttl:
+            if self.listeners and key in shard.expires:
+                # Replaying a PUT drops the TTL, so log it again
+                self._notify(OP_EXPIRE, key, repr(shard.expires[key]))
+        elif shard.expires:
+            shard.expires.pop(key, None)
+        if shard.policy:
+            self._enforce_limits(shard, key)
+        return created
+
+    def _over_limit(self, shard):
+        return ((self.shard_max_keys and len(shard.data) > self.shard_max_keys) or
+                (self.shard_max_memory and shard.memory > self.shard_max_memory))
+
+    def _enforce_limits(self, shard, protect=None):
+        """Evict keys until shard is within its limits, never evicting protect"""
+        while self._over_limit(shard):
+            victim = shard.policy.victim(protect)
+            if victim is None:
+                break
+            self._discard(shard, victim)
+            shard.evicted += 1
+            if self.listeners:
+                self._notify(OP_DEL, victim)
+
+    def _set_expiry(self, shard, key, expires_at):
+        shard.expires[key] = expires_at
+        heapq.heappush(shard.deadlines, (expires_at, key))
+        if len(shard.deadlines) > 2 * len(shard.expires) + 64:
+            # Too many stale entries from overwritten TTLs: rebuild the heap
+            shard.deadlines = [(at, k) for k, at in shard.expires.items()]
+            heapq.heapify(shard.deadlines)
+        if self.listeners:
+            self._notify(OP_EXPIRE, key, repr(expires_at))
+
+    def _remove(self, shard, key):
+        """Delete key; returns True if it existed"""
+        if not self._live(shard, key):
+            return False
+        self._discard(shard, key)
+        if self.listeners:
+            self._notify(OP_DEL, key)
+        return True
+
+    def __len__(self):
+        """Number of keys, including expired keys not yet removed"""
+        return sum(len(shard.data) for shard in self.shards)
+
+    def __contains__(self, key):
+        shard = self.shard_for(key)
+        with shard.lock:
+            return self._live(shard, key)
+
+    def get(self, key, default=None, raw=False):
+        """Return the value stored for key, or default"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            value = self._read(shard, key)
+        if value is None:
+            return default
+        if value.__class__ is Compressed and not raw:
+            value = self.unpack(value)
+        return value
+
+    def put(self, key, value, ttl=None):
+        """Store value under key, expiring after ttl seconds if given
+
+        Returns True if the key was created.
+        """
+        packed = self.pack(value) if self.codec else value
+        shard = self.shard_for(key)
+        with shard.lock:
+            return self._set(shard, key, packed, ttl, plain=value)
+
+    def delete(self, key):
+        """Remove key; returns True if it existed"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            return self._remove(shard, key)
+
+    def expire(self, key, ttl):
+        """Set key to expire in ttl seconds; returns False if the key does not exist"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            if not self._live(shard, key):
+                return False
+            self._set_expiry(shard, key, time.time() + ttl)
+            return True
+
+    def expire_at(self, key, expires_at):
+        """Set key to expire at a time.time() timestamp; returns False if the key does not exist"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            if not self._live(shard, key):
+                return False
+            if expires_at <= time.time():
+                self._expire(shard, key)
+            else:
+                self._set_expiry(shard, key, expires_at)
+            return True
+
+    def ttl(self, key):
+        """Return the seconds key has left, -1 if it has no TTL, or None if missing"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            if not self._live(shard, key):
+                return None
+            expires_at = shard.expires.get(key)
+            if expires_at is None:
+                return -1
+            return max(expires_at - time.time(), 0.0)
+
+    def get_with_version(self, key, raw=False):
+        """Return (value, version) for key, or None if it does not exist"""
+        shard = self.shard_for(key)
+        with shard.lock:
+            value = self._read(shard, key)
+            if value is None:
+                return None
+            version = shard.versions[key]
+        if value.__class__ is Compressed and not raw:
+            value = self.unpack(value)
+        return value, version
+
+    def incr(self, key, delta=1):
+        """Add delta to the integer stored at key (0 if missing), keeping its TTL
+
+        Returns the new number; raises ValueError if the value is not an integer or
+        the result leaves the signed 64-bit range.
+        """
+        shard = self.shard_for(key)
+        with shard.lock:
+            current = self._read(shard, key)
+            if current.__class__ is Compressed:
+                current = self.unpack(current)
+            number = delta + (int(current) if current is not None else 0)
+            if not COUNTER_MIN <= number <= COUNTER_MAX:
+                raise ValueError("increment would overflow")
+            text = str(number)
+            self._set(shard, key, text.encode('ascii') if isinstance(current, bytes) else text,
+                      keep_ttl=True)
+            return number
+
+    def append(self, key, value, max_size=None):
+        """Append value to the value at key (created if missing), keeping its TTL
+
+        str values stay str; if either side is bytes the result is bytes. Returns the
+        new length; raises ValueError if it would exceed max_size. A compressed value
+        is decompressed and the result compressed again under the shard lock.
+        """
+        shard = self.shard_for(key)
+        with shard.lock:
+            current = self._read(shard, key)
+            if current.__class__ is Compressed:
+                current = self.unpack(current)
+            if current is None:
+                result = value
+            elif isinstance(current, str) and isinstance(value, str):
+                result = current + value
+            else:
+                result = to_bytes(current) + to_bytes(value)
+            if max_size is not None and len(result) > max_size:
+                raise ValueError("value would exceed the size limit")
+            self._set(shard, key, self.pack(result), keep_ttl=True, plain=result)
+            return len(result)
+
+    def cas(self, key, version, value, ttl=None):
+        """Store value only if key still has version (0: only if key does not exist)
+
+        Returns (applied, version): the key's new version if the value was stored,
+        otherwise its current version (0 if it does not exist).
+        """
+        packed = self.pack(value) if self.codec else value
+        shard = self.shard_for(key)
+        with shard.lock:
+            current = shard.versions[key] if self._live(shard, key) else 0
+            if current != version:
+                return False, current
+            self._set(shard, key, packed, ttl, plain=value)
+            return True, shard.versions[key]
+
+    def get_many(self, keys, raw=False):
+        """Return the values for keys (None for missing keys) as one atomic read"""
+        shards = self._shards_for(keys)
+        self._acquire(shards)
+        try:
+            values = [self._read(self.shard_for(key), key) for key in keys]
+        finally:
+            self._release(shards)
+        if raw or not self.codec:
+            return values
+        return [None if value is None else self.unpack(value) for value in values]
+
+    def put_many(self, items):
+        """Store (key, value) pairs atomically; returns the number of keys created"""
+        items = [(key, value, self.pack(value)) for key, value in items]
+        shards = self._shards_for(key for key, _, _ in items)
+        created = 0
+        self._acquire(shards)
+        try:
+            for key, value, packed in items:
+                if self._set(self.shard_for(key), key, packed, plain=value):
+                    created += 1
+        finally:
+            self._release(shards)
+        return created
+
+    def put_entries(self, entries):
+        """Store (key, value, expires_at or None) triples atomically, like put_many
+
+        expires_at is an absolute time.time() timestamp; keys already past it are
+        skipped. Returns the number of keys created.
+        """
+        now = time.time()
+        entries = [(key, value, self.pack(value), expires_at) for key, value, expires_at in entries
+                   if expires_at is None or expires_at > now]
+        shards = self._shards_for(key for key, _, _, _ in entries)
+        created = 0
+        self._acquire(shards)
+        try:
+            for key, value, packed, expires_at in entries:
+                ttl = None if expires_at is None else expires_at - now
+                if self._set(self.shard_for(key), key, packed, ttl, plain=value):
+                    created += 1
+        finally:
+            self._release(shards)
+        return created
+
+    def delete_many(self, keys):
+        """Remove keys atomically; returns the number of keys that existed"""
+        shards = self._shards_for(keys)
+        deleted = 0
+        self._acquire(shards)
+        try:
+            for key in keys:
+                if self._remove(self.shard_for(key), key):
+                    deleted += 1
+        finally:
+            self._release(shards)
+        return deleted
+
+    def scan(self, start=None, end=None, after=None, count=100):
+        """Return (keys, more): up to count live keys in order, from the key ranges
+
+        Keys k satisfy start <= k < end (None leaves a side open) and k > after, the
+        last key of the previous page. Each shard lock is held only while at most
+        count keys are read from its index; more is True if keys remain after the page.
+        """
+        low, inclusive = start, True
+        if after is not None and (low is None or after >= low):
+            low, inclusive = after, False
+        pages = []
+        more = False
+        for shard in self.shards:
+            page = []
+            with shard.lock:
+                now = time.time()
+                expires = shard.expires
+                for key in shard.index.irange(low, inclusive):
+                    if end is not None and key >= end:
+                        break
+                    if expires:
+                        expires_at = expires.get(key)
+                        if expires_at is not None and expires_at <= now:
+                            continue  # Left to lazy and active expiry
+                    if len(page) == count:
+                        more = True
+                        break
+                    page.append(key)
+            if page:
+                pages.append(page)
+        keys = list(islice(heapq.merge(*pages), count + 1))
+        if len(keys) > count:
+            del keys[count:]
+            more = True
+        return keys, more
+
+    def expire_cycle(self, budget=0.01):
+        """Remove expired keys from every shard, spending at most about budget seconds
+
+        Each shard lock is held for at most EXPIRE_BATCH removals so requests never
+        wait behind a long purge. Returns the number of keys removed.
+        """
+        stop_at = time.perf_counter() + budget
+        removed = 0
+        for shard in self.shards:
+            more = True
+            while more:
+                with shard.lock:
+                    now = time.time()
+                    deadlines = shard.deadlines
+                    for _ in range(self.EXPIRE_BATCH):
+                        if not deadlines or deadlines[0][0] > now:
+                            break
+                        expires_at, key = heapq.heappop(deadlines)
+                        if shard.expires.get(key) == expires_at:
+                            self._expire(shard, key)
+                            removed += 1
+                    more = bool(deadlines) and deadlines[0][0] <= now
+                if time.perf_counter() >= stop_at:
+                    return removed
+        return removed
+
+    @property
+    def expired(self):
+        """Total keys removed because their TTL elapsed"""
+        return sum(shard.expired for shard in self.shards)
+
+    @property
+    def evicted(self):
+        """Total keys removed to stay within a memory limit"""
+        return sum(shard.evicted for shard in self.shards)
+
+    @property
+    def memory(self):
+        """Approximate bytes held by stored keys and values"""
+        return sum(shard.memory for shard in self.shards)
+
+    def compression_stats(self):
+        """Return the compressed value count, their compressed and original bytes, and
+        the CPU seconds spent compressing and decompressing"""
+        counters = self.codec_stats.snapshot()
+        return {
+            'compressed_keys': sum(shard.compressed for shard in self.shards),
+            'compressed_bytes': sum(shard.compressed_size for shard in self.shards),
+            'uncompressed_bytes': sum(shard.original_size for shard in self.shards),
+            'compress_cpu': counters['compress_ns'] / 1e9,
+            'decompress_cpu': counters['decompress_ns'] / 1e9,
+        }
+
+    def arena_stats(self):
+        """Return the bytes held by the shards' arena segments and how many of them are
+        dead records awaiting collection (storage='arena' only)"""
+        held = dead = 0
+        for shard in self.shards:
+            with shard.lock:
+                held += shard.data.arena_bytes
+                dead += shard.data.dead_bytes
+        return {'arena_bytes': held, 'arena_dead_bytes': dead}
+
+    @property
+    def hits(self):
+        return sum(shard.hits for shard in self.shards)
+
+    @property
+    def misses(self):
+        return sum(shard.misses for shard in self.shards)
+
+    def items(self):
+        """Yield (key, value) pairs of live keys, one shard at a time"""
+        for key, value, _ in self.entries():
+            yield key, value
+
+    def entries(self):
+        """Yield (key, value, expires_at or None), copying one shard at a time under its lock"""
+        now = time.time()
+        for shard in self.shards:
+            with shard.lock:
+                expires = shard.expires
+                entries = [(key, value, expires.get(key)) for key, value in shard.data.items()]
+            for key, value, expires_at in entries:
+                if expires_at is None or expires_at > now:
+                    yield key, self.unpack(value), expires_at
+
+    def range_entries(self, start=None, end=None, batch=1000):
+        """Yield (key, value, expires_at or None) for live keys with start <= key < end
+
+        Unlike entries(), each shard lock is held for at most batch keys at a time, so
+        a long export never stalls other clients; keys written meanwhile may or may not
+        be included. Keys come shard by shard, each shard's in order.
+        """
+        for shard in self.shards:
+            low, inclusive = start, True
+            more = True
+            while more:
+                page = []
+                more = False
+                with shard.lock:
+                    now = time.time()
+                    expires = shard.expires
+                    for key in shard.index.irange(low, inclusive):
+                        if end is not None and key >= end:
+                            break
+                        if len(page) == batch:
+                            more = True
+                            break
+                        expires_at = expires.get(key) if expires else None
+                        if expires_at is None or expires_at > now:
+                            page.append((key, shard.data[key], expires_at))
+                if page:
+                    low, inclusive = page[-1][0], False
+                for key, value, expires_at in page:
+                    yield key, self.unpack(value), expires_at
+
+    def clear(self):
+        """Remove every key without notifying listeners (e.g. before a full resync)"""
+        policy = EVICTION_POLICIES[self.eviction]
+        for shard in self.shards:
+            with shard.lock:
+                shard.clear_data()
+                shard.expires = {}
+                shard.deadlines = []
+                shard.memory = 0
+                shard.compressed = shard.compressed_size = shard.original_size = 0
+                if shard.policy:
+                    shard.policy = policy()
+
+    def load(self, items, expires=None):
+        """Bulk-insert (key, value) pairs without notifying listeners (recovery)
+
+        expires maps keys to absolute expiry times; keys already past them are skipped.
+        """
+        expires = expires or {}
+        now = time.time()
+        count = len(self.shards)
+        for key, value in items:
+            expires_at = expires.get(key)
+            if expires_at is not None and expires_at <= now:
+                continue
+            shard = self.shards[hash(key) % count]
+            value = self.pack(value)
+            shard.data[key] = value
+            shard.count_value(value, 1)
+            shard.sequence += 1
+            shard.versions[key] = shard.sequence
+            shard.memory += self.entry_size(key, value)
+            if shard.policy:
+                shard.policy.add(key)
+            if expires_at is not None:
+                shard.expires[key] = expires_at
+                shard.deadlines.append((expires_at, key))
+        for shard in self.shards:
+            shard.index.update(shard.data)
+            heapq.heapify(shard.deadlines)
+            if shard.policy:
+                self._enforce_limits(shard)
+
+
+class StatsCounters:
+    """Named counters kept per thread and aggregated on read
+
+    Each thread increments only its own cell, so increments take no lock and never
+    lose updates. Cells of exited threads are folded into a retired total.
+    """
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.local = threading.local()
+        self.cells = {}  # id(cell) -> cell, one per live thread
+        self.retired = dict.fromkeys(self.names, 0)
+        self.cells_lock = threading.Lock()
+
+    def _cell(self):
+        cell = getattr(self.local, 'cell', None)
+        if cell is None:
+            cell = dict.fromkeys(self.names, 0)
+            owner = CellOwner()
+            with self.cells_lock:
+                self.cells[id(cell)] = cell
+            weakref.finalize(owner, self._retire, cell)
+            self.local.cell = cell
+            self.local.owner = owner
+        return cell
+
+    def _retire(self, cell):
+        with self.cells_lock:
+            for name, value in cell.items():
+                self.retired[name] += value
+            del self.cells[id(cell)]
+
+    def incr(self, name, amount=1):
+        """Add amount to counter name"""
+        self._cell()[name] += amount
+
+    def value(self, name):
+        """Return the aggregated value of counter name"""
+        with self.cells_lock:
+            return self.retired[name] + sum(cell[name] for cell in self.cells.values())
+
+    def snapshot(self):
+        """Return all aggregated counters as a dict"""
+        with self.cells_lock:
+            totals = dict(self.retired)
+            for cell in self.cells.values():
+                for name, value in cell.items():
+                    totals[name] += value
+        return totals
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Bulk export and import for KVSS (DUMP / LOAD)
+"KV/1.0 DUMP [PREFIX p]" hands the connection over to a stream of every live key (or
+those starting with p), and "KV/1.0 LOAD" to one that stores the keys it receives.
+Both streams use the dump file format: DUMP_MAGIC, the append-only log's checksummed
+records (a PUT per key, followed by an EXPIRE for keys with a TTL), then an END record
+holding the key count. Keys are read and stored a batch at a time, so other clients
+only ever wait behind one batch; the connection closes when the transfer ends.
+"""
+
+import os
+import socket
+import time
+
+from client import parse_counts
+from index import prefix_end
+from persistence import encode_record, decode_record
+from store import OP_PUT, OP_EXPIRE
+
+
+DUMP_COMMAND = "KV/1.0 DUMP"
+LOAD_COMMAND = "KV/1.0 LOAD"
+DUMP_MAGIC = b'KVSSDMP1'
+
+# Stream-only record type, numbered after the replication stream's
+OP_END = 18  # value is the number of keys in the stream
+
+# Bytes per socket read or write of a stream
+CHUNK_SIZE = 256 * 1024
+# Seconds between progress reports
+PROGRESS_INTERVAL = 5.0
+
+
+def parse_dump(line):
+    """Return (prefix or None, local) for a DUMP request line, or None if it is malformed
+
+    LOCAL (used between --workers) dumps only the receiving worker's own keys.
+    """
+    parts = line.split()[2:]
+    prefix, local = None, False
+    while parts:
+        option = parts.pop(0).upper()
+        if option == 'PREFIX' and parts and prefix is None:
+            prefix = parts.pop(0)
+        elif option == 'LOCAL' and not local:
+            local = True
+        else:
+            return None
+    return prefix, local
+
+
+def read_stream(recv, buffer=b''):
+    """Yield (op, key, value) for the records of a dump stream, up to its END record
+
+    recv() returns the next bytes (b'' at end of input); buffer holds bytes already
+    received. Raises ValueError on a bad header or corrupt record and ConnectionError
+    if the input ends before the END record.
+    """
+    buffer = bytearray(buffer)
+    while len(buffer) < len(DUMP_MAGIC):
+        data = recv()
+        if not data:
+            raise ConnectionError("dump ended before its header")
+        buffer += data
+    if buffer[:len(DUMP_MAGIC)] != DUMP_MAGIC:
+        raise ValueError("not a KVSS dump")
+    offset = len(DUMP_MAGIC)
+    while True:
+        record = decode_record(buffer, offset)
+        if record is None:
+            del buffer[:offset]
+            offset = 0
+            data = recv()
+            if not data:
+                raise ConnectionError("dump ended before its END record")
+            buffer += data
+            continue
+        op, key, value, offset = record
+        yield op, key, value
+        if op == OP_END:
+            return
+
+
+def read_line(sock, buffer):
+    """Read one response line from sock; bytes after it stay in buffer"""
+    while b'\n' not in buffer:
+        data = sock.recv(CHUNK_SIZE)
+        if not data:
+            raise ConnectionError("Connection closed by server")
+        buffer += data
+    end = buffer.index(b'\n')
+    line = buffer[:end].decode('utf-8').strip()
+    del buffer[:end + 1]
+    return line
+
+
+class Progress:
+    """Counts what a transfer moved and reports it every PROGRESS_INTERVAL seconds"""
+
+    def __init__(self, label, report, total=None):
+        """
+        report: callable(message) receiving the periodic summaries
+        total: bytes expected, shown as a percentage when known
+        """
+        self.label = label
+        self.report = report
+        self.total = total
+        self.keys = 0
+        self.bytes = 0
+        self.start = time.perf_counter()
+        self.next_report = self.start + PROGRESS_INTERVAL
+
+    def add(self, keys=0, size=0):
+        self.keys += keys
+        self.bytes += size
+        now = time.perf_counter()
+        if now >= self.next_report:
+            self.next_report = now + PROGRESS_INTERVAL
+            self.report(f"{self.label}: {self.summary()}")
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        megabytes = self.bytes / (1024 * 1024)
+        text = f"{megabytes:.1f} MB"
+        if self.total:
+            text += f" ({100 * self.bytes / self.total:.0f}%)"
+        if self.keys:
+            text = f"{self.keys} keys, {text}"
+        text += f" in {elapsed:.1f}s ({megabytes / elapsed:.1f} MB/s"
+        if self.keys:
+            text += f", {self.keys / elapsed:.0f} keys/s"
+        return text + ")"
+
+
+class BulkTransfer:
+    """Serves the DUMP and LOAD streams of connections handed over by the server
+
+    With --workers, a DUMP without LOCAL relays every other worker's keys after this
+    worker's own, and LOAD stores each key on its owner (store is then the
+    PartitionedStore).
+    """
+
+    # Keys read per shard lock hold (DUMP) or stored per batch (LOAD)
+    BATCH = 1000
+    # A client that sends or accepts no data for this long is disconnected
+    TIMEOUT = 30.0
+
+    def __init__(self, store, log=None, peers=None, worker_index=0):
+        self.store = store
+        self.log = log or (lambda message, level='INFO': None)
+        self.peers = peers
+        self.worker_index = worker_index
+
+    def serve(self, sock, address, request, buffer=b''):
+        """Run a handed-over ('DUMP', prefix, local) or ('LOAD',) request, then close sock
+
+        buffer holds bytes the client sent after the request line.
+        """
+        try:
+            sock.settimeout(self.TIMEOUT)
+            if request[0] == 'DUMP':
+                self.dump(sock, address, *request[1:])
+            else:
+                self.load(sock, address, buffer)
+        except (OSError, ValueError) as e:
+            self.log(f"{request[0]} with {address} failed: {e}", 'WARNING')
+        finally:
+            sock.close()
+
+    def dump(self, sock, address, prefix=None, local=False):
+        """Stream the live keys starting with prefix (all keys if None) to sock"""
+        start, end = (prefix, prefix_end(prefix)) if prefix else (None, None)
+        progress = Progress(f"DUMP to {address}", self.log)
+        batch = [b"200 OK DUMP\n", DUMP_MAGIC]
+        size = 0
+
+        def emit(records, keys=1):
+            nonlocal batch, size
+            batch.append(records)
+            size += len(records)
+            progress.add(keys, len(records))
+            if size >= CHUNK_SIZE:
+                sock.sendall(b''.join(batch))
+                batch = []
+                size = 0
+
+        # A PartitionedStore hands range_entries to its local store: this worker's keys
+        for key, value, expires_at in self.store.range_entries(start, end, self.BATCH):
+            records = encode_record(OP_PUT, key, value)
+            if expires_at is not None:
+                records += encode_record(OP_EXPIRE, key, repr(expires_at))
+            emit(records)
+        if self.peers and not local:
+            for index in range(len(self.peers)):
+                if index != self.worker_index:
+                    self._relay_peer(index, prefix, emit)
+        emit(encode_record(OP_END, '', str(progress.keys)), 0)
+        sock.sendall(b''.join(batch))
+        self.log(f"DUMP to {address} done: {progress.summary()}")
+
+    def _relay_peer(self, index, prefix, emit):
+        """Pass worker index's own keys to emit(records, keys), as DUMP LOCAL streams them"""
+        with socket.create_connection(self.peers[index], timeout=self.TIMEOUT) as peer:
+            request = f"{DUMP_COMMAND} LOCAL" + (f" PREFIX {prefix}" if prefix else "")
+            peer.sendall(f"{request}\n".encode('utf-8'))
+            buffer = bytearray()
+            status = read_line(peer, buffer)
+            if status != "200 OK DUMP":
+                raise ValueError(f"worker {index} answered DUMP with {status}")
+            for op, key, value in read_stream(lambda: peer.recv(CHUNK_SIZE), buffer):
+                if op != OP_END:
+                    emit(encode_record(op, key, value), int(op == OP_PUT))
+
+    def load(self, sock, address, buffer=b''):
+        """Store the keys of a dump stream read from sock, then report how many"""
+        sock.sendall(b"200 OK LOAD\n")
+        progress = Progress(f"LOAD from {address}", self.log)
+        pending = []  # [key, value, expires_at] not stored yet
+        stored = 0
+
+        def flush():
+            nonlocal stored
+            self.store.put_entries(pending)
+            progress.add(len(pending))
+            stored += len(pending)
+            pending.clear()
+
+        def recv():
+            data = sock.recv(CHUNK_SIZE)
+            progress.add(size=len(data))
+            return data
+
+        progress.add(size=len(buffer))
+        try:
+            for op, key, value in read_stream(recv, buffer):
+                if op == OP_PUT:
+                    if len(pending) >= self.BATCH:
+                        flush()
+                    pending.append([key, value, None])
+                elif op == OP_EXPIRE and pending and pending[-1][0] == key:
+                    pending[-1][2] = float(value)
+                elif op == OP_END:
+                    flush()
+                    if int(value) != stored:
+                        self.log(f"LOAD from {address}: dump announced {value} keys, "
+                                 f"{stored} received", 'WARNING')
+                else:
+                    raise ValueError(f"unexpected record {op} for {key!r}")
+        except (ValueError, ConnectionError) as e:
+            # Corrupt or cut short: keep what arrived intact and tell the client
+            flush()
+            sock.sendall(b"400 BAD_REQUEST\n")
+            raise ValueError(f"{e} after {stored} keys") from e
+        elapsed = max(time.perf_counter() - progress.start, 1e-9)
+        sock.sendall(f"200 OK keys={stored} bytes={progress.bytes} seconds={elapsed:.3f} "
+                     f"keys_per_sec={stored / elapsed:.0f}\n".encode('utf-8'))
+        self.log(f"LOAD from {address} done: {progress.summary()}")
+
+
+def dump_file(host, port, path, prefix=None, report=None):
+    """Write the keys of the server at host:port (those starting with prefix if given)
+    to a dump file at path; returns the number of keys
+
+    report, if given, is called with a progress summary every PROGRESS_INTERVAL seconds.
+    The file is only put in place once the whole dump arrived.
+    """
+    progress = Progress(f"DUMP {path}", report or (lambda message: None))
+    temp_path = path + '.tmp'
+    try:
+        with socket.create_connection((host, port)) as sock, open(temp_path, 'wb') as f:
+            request = DUMP_COMMAND + (f" PREFIX {prefix}" if prefix else "")
+            sock.sendall(f"{request}\n".encode('utf-8'))
+            buffer = bytearray()
+            status = read_line(sock, buffer)
+            if status != "200 OK DUMP":
+                raise ValueError(f"Server refused DUMP: {status}")
+
+            def recv():
+                data = sock.recv(CHUNK_SIZE)
+                f.write(data)
+                progress.add(size=len(data))
+                return data
+
+            f.write(buffer)
+            progress.add(size=len(buffer))
+            for op, _, value in read_stream(recv, buffer):
+                if op == OP_PUT:
+                    progress.keys += 1
+                elif op == OP_END:
+                    count = int(value)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
+
+
+def load_file(host, port, path, report=None):
+    """Send a dump file to the server at host:port with LOAD
+
+    Returns the server's summary, e.g. {'keys': 1000, 'seconds': 0.5, ...}. report, if
+    given, is called with a progress summary every PROGRESS_INTERVAL seconds.
+    """
+    with open(path, 'rb') as f, socket.create_connection((host, port)) as sock:
+        size = os.fstat(f.fileno()).st_size
+        progress = Progress(f"LOAD {path}", report or (lambda message: None), total=size)
+        sock.sendall(f"{LOAD_COMMAND}\n".encode('utf-8'))
+        buffer = bytearray()
+        status = read_line(sock, buffer)
+        if status != "200 OK LOAD":
+            raise ValueError(f"Server refused LOAD: {status}")
+        while progress.bytes < size:
+            sent = sock.sendfile(f, progress.bytes, min(size - progress.bytes, 16 * CHUNK_SIZE))
+            if not sent:
+                break
+            progress.add(size=sent)
+        # A file cut short mid-record would leave the server waiting for the rest
+        sock.shutdown(socket.SHUT_WR)
+        status = read_line(sock, buffer)
+    if not status.startswith("200 OK"):
+        raise ValueError(f"LOAD failed: {status}")
+    return parse_counts(status[len("200 OK "):])
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+Keyspace partitioning for the multi-process KVSS server (--workers)
+Worker processes share the public port through SO_REUSEPORT, so any worker may
+receive any request. Each key belongs to exactly one worker; requests for keys
+owned elsewhere are forwarded to the owner through its private peer port, with the
+pipelined requests of one read sent to each owner in a single exchange.
+"""
+
+import heapq
+import json
+import threading
+import time
+import zlib
+from itertools import islice
+
+from client import KVSSClient, parse_counts
+from index import encode_cursor
+import protocol
+
+
+# Requests naming exactly one key, which the server forwards unchanged to its owner
+KEY_COMMANDS = frozenset(('GET', 'PUT', 'PUTEX', 'DEL', 'EXPIRE', 'TTL', 'INCR', 'DECR', 'INCRBY',
+                          'APPEND', 'CAS', 'CASEX', 'GETS'))
+
+
+def partition_for(key, count):
+    """Index of the worker owning key (stable across processes, unlike hash())"""
+    return zlib.crc32(key.encode('utf-8')) % count
+
+
+def merge_stats(stats):
+    """Combine the STATS dicts of every worker into one
+
+    Counters are summed, uptime and latencies (*_us) are the highest of any worker,
+    hit_ratio and compression_ratio are recomputed and other values are taken from
+    the first worker.
+    """
+    merged = {}
+    for worker_stats in stats:
+        for name, value in worker_stats.items():
+            if name not in merged:
+                merged[name] = value
+            elif name == 'uptime' or name.endswith('_us'):
+                merged[name] = max(merged[name], value)
+            elif isinstance(value, (int, float)) and not name.endswith('_ratio'):
+                merged[name] += value
+                if isinstance(value, float):
+                    merged[name] = round(merged[name], 3)
+    lookups = merged.get('hits', 0) + merged.get('misses', 0)
+    if 'hit_ratio' in merged:
+        merged['hit_ratio'] = round(merged['hits'] / lookups, 4) if lookups else 0.0
+    if merged.get('compressed_bytes'):
+        merged['compression_ratio'] = round(merged['uncompressed_bytes'] / merged['compressed_bytes'], 3)
+    merged['workers'] = len(stats)
+    return merged
+
+
+class PeerError(Exception):
+    """A peer worker answered a forwarded request with an unexpected status"""
+
+
+class PartitionedStore:
+    """Routes store operations to the worker owning each key
+
+    Keys owned by this worker go to its local ShardedStore; the others are sent to
+    the owning worker, one request per owner for multi-key operations (so those are
+    atomic per worker only). Every other attribute (expiry, listeners, entries,
+    counters) is the local store's, so persistence and STATS see this worker's share.
+    """
+
+    # Seconds to wait for a peer worker's response
+    PEER_TIMEOUT = 5.0
+
+    def __init__(self, local, index, peers):
+        """
+        local: this worker's ShardedStore
+        index: this worker's position in peers
+        peers: (host, port) of every worker's peer listener, in worker order
+        """
+        self.local = local
+        self.index = index
+        self.peers = list(peers)
+        self.connections = threading.local()  # Per-thread KVSSClients, by (peer, binary, compressed)
+
+    def __getattr__(self, name):
+        return getattr(self.local, name)
+
+    def __len__(self):
+        return len(self.local)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def owner(self, key):
+        return partition_for(key, len(self.peers))
+
+    def _group(self, keys):
+        """Split keys by owning worker: {index: [key, ...]} in request order"""
+        groups = {}
+        count = len(self.peers)
+        for key in keys:
+            groups.setdefault(partition_for(key, count), []).append(key)
+        return groups
+
+    def _client(self, index, binary=True, compressed=False):
+        """This thread's connection to worker index (KV/2.0 or KV/1.0), opened on first use"""
+        clients = self.connections.__dict__
+        client = clients.get((index, binary, compressed))
+        if client is None:
+            host, port = self.peers[index]
+            client = KVSSClient(host, port, binary=binary, compress=compressed,
+                                timeout=self.PEER_TIMEOUT, verbose=False)
+            if not client.connect():
+                raise ConnectionError(f"Cannot reach worker {index}: {client.last_error}")
+            clients[(index, binary, compressed)] = client
+        return client
+
+    def _drop(self, index, binary, compressed=False):
+        """Close a connection that failed; the next call reopens it"""
+        client = self.connections.__dict__.pop((index, binary, compressed), None)
+        if client:
+            client.disconnect()
+
+    def call(self, index, command, args=()):
+        """Send a KV/2.0 request to worker index and return (status, body bytes)"""
+        client = self._client(index)
+        try:
+            return client.send_frame(command, args)
+        except OSError:
+            self._drop(index, True)
+            raise
+
+    def forward(self, batches, binary, compressed=False):
+        """Relay encoded requests to their owners and return the owners' responses
+
+        batches maps worker index to the raw requests it owns (KV/1.0 lines or KV/2.0
+        frames). Each worker gets one write and all of them work in parallel; the
+        result maps each index to its responses in order: text lines without the
+        newline, or whole response frames. compressed uses connections upgraded with
+        HELLO COMPRESS, so values come back as the owner stores them.
+        """
+        for index, requests in batches.items():
+            try:
+                self._client(index, binary, compressed).socket.sendall(b''.join(requests))
+            except OSError:
+                self._drop(index, binary, compressed)
+                raise
+        results = {}
+        for index, requests in batches.items():
+            client = self._client(index, binary, compressed)
+            try:
+                if binary:
+                    results[index] = [protocol.encode_response(*client.read_frame())
+                                      for _ in requests]
+                else:
+                    results[index] = client.read_responses(len(requests))
+            except OSError:
+                self._drop(index, binary, compressed)
+                raise
+        return results
+
+    def _expect(self, index, command, args, statuses):
+        status, body = self.call(index, command, args)
+        if status not in statuses:
+            raise PeerError(f"Worker {index} answered {command} with {status}")
+        return status, body
+
+    def get(self, key, default=None, raw=False):
+        """Value of key; raw (the stored form) only applies to local keys, the others
+        come back uncompressed"""
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.get(key, default, raw)
+        status, body = self._expect(owner, 'GET', [key], (200, 404))
+        return body if status == 200 else default
+
+    def put(self, key, value, ttl=None):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.put(key, value, ttl)
+        args = [key, value] + ([repr(ttl)] if ttl is not None else [])
+        return self._expect(owner, 'PUT', args, (200, 201))[0] == 201
+
+    def delete(self, key):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.delete(key)
+        return self._expect(owner, 'DEL', [key], (204, 404))[0] == 204
+
+    def expire(self, key, ttl):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.expire(key, ttl)
+        return self._expect(owner, 'EXPIRE', [key, repr(ttl)], (200, 404))[0] == 200
+
+    def ttl(self, key):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.ttl(key)
+        status, body = self._expect(owner, 'TTL', [key], (200, 404))
+        return float(body) if status == 200 else None
+
+    def get_with_version(self, key, raw=False):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.get_with_version(key, raw)
+        status, body = self._expect(owner, 'GETS', [key], (200, 404))
+        if status == 404:
+            return None
+        version, _, value = body.partition(b' ')
+        return value, int(version)
+
+    def incr(self, key, delta=1):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.incr(key, delta)
+        status, body = self._expect(owner, 'INCRBY', [key, str(delta)], (200, 400))
+        if status == 400:
+            raise ValueError(f"Worker {owner} refused to increment {key}")
+        return int(body)
+
+    def append(self, key, value, max_size=None):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.append(key, value, max_size)
+        status, body = self._expect(owner, 'APPEND', [key, value], (200, 400))
+        if status == 400:
+            raise ValueError(f"Worker {owner} refused to append to {key}")
+        return int(body)
+
+    def cas(self, key, version, value, ttl=None):
+        owner = self.owner(key)
+        if owner == self.index:
+            return self.local.cas(key, version, value, ttl)
+        args = [key, str(version), value] + ([repr(ttl)] if ttl is not None else [])
+        status, body = self._expect(owner, 'CAS', args, (200, 404, 409))
+        return status == 200, int(body) if body else 0
+
+    def get_many(self, keys, raw=False):
+        found = {}
+        for owner, group in self._group(keys).items():
+            if owner == self.index:
+                values = self.local.get_many(group, raw)
+            else:
+                values = protocol.decode_values(self._expect(owner, 'MGET', group, (200,))[1])
+            found.update(zip(group, values))
+        return [found[key] for key in keys]
+
+    def put_many(self, items):
+        items = dict(items)
+        created = 0
+        for owner, group in self._group(items).items():
+            if owner == self.index:
+                created += self.local.put_many((key, items[key]) for key in group)
+            else:
+                args = [part for key in group for part in (key, items[key])]
+                body = self._expect(owner, 'MPUT', args, (200,))[1]
+                created += parse_counts(body.decode('utf-8'))['created']
+        return created
+
+    def scan(self, start=None, end=None, after=None, count=100):
+        """Merge one page of every worker's keys; see ShardedStore.scan"""
+        keys, more = self.local.scan(start, end, after, count)
+        pages = [keys]
+        args = [encode_cursor(after), 'COUNT', str(count), 'LOCAL']
+        if start is not None:
+            args += ['START', start]
+        if end is not None:
+            args += ['END', end]
+        for index in range(len(self.peers)):
+            if index == self.index:
+                continue
+            cursor, _, page = self._expect(index, 'SCAN', args, (200,))[1].decode('utf-8').partition(' ')
+            pages.append(json.loads(page))
+            more = more or cursor != '0'
+        keys = list(islice(heapq.merge(*pages), count + 1))
+        if len(keys) > count:
+            del keys[count:]
+            more = True
+        return keys, more
+
+    def put_entries(self, entries):
+        """Store (key, value, expires_at) triples on their owners; see ShardedStore.put_entries
+
+        Other workers get one MPUT of the keys without a TTL, and one pipelined PUT
+        with its TTL (PUTEX over KV/2.0) per key with one. Each TTL is computed once,
+        before anything is sent, so a key cannot expire in between.
+        """
+        now = time.time()
+        groups = {}
+        for key, value, expires_at in entries:
+            if expires_at is None or expires_at > now:
+                groups.setdefault(self.owner(key), []).append((key, value, expires_at))
+        created = 0
+        for owner, group in groups.items():
+            if owner == self.index:
+                created += self.local.put_entries(group)
+                continue
+            args = [part for key, value, expires_at in group if expires_at is None
+                    for part in (key, value)]
+            if args:
+                body = self._expect(owner, 'MPUT', args, (200,))[1]
+                created += parse_counts(body.decode('utf-8'))['created']
+            requests = [protocol.encode_request('PUT', [key, value, repr(expires_at - now)])
+                        for key, value, expires_at in group if expires_at is not None]
+            if requests:
+                for response in self.forward({owner: requests}, True)[owner]:
+                    status = protocol.RESPONSE_HEADER.unpack_from(response)[1]
+                    if status not in (200, 201):
+                        raise PeerError(f"Worker {owner} answered PUT with {status}")
+                    created += status == 201
+        return created
+
+    def delete_many(self, keys):
+        deleted = 0
+        for owner, group in self._group(keys).items():
+            if owner == self.index:
+                deleted += self.local.delete_many(group)
+            else:
+                body = self._expect(owner, 'MDEL', group, (200,))[1]
+                deleted += parse_counts(body.decode('utf-8'))['deleted']
+        return deleted